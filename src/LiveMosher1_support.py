@@ -6,6 +6,7 @@ import os.path
 import webbrowser
 
 from tempfile import TemporaryDirectory
+from typing import List
 import tkinter as tk
 import tkinter.ttk as ttk
 from tkinter import font as tkfont
@@ -14,8 +15,11 @@ from tkinter import PhotoImage
 from consts import FFGLITCH_URL, REPO_URL
 from lib.colored_print import print_error, print_warn
 from lib.misc import IS_MAC, IS_LINUX, IS_WIN # find_window_hwnd_for_current_process, get_window_pos_size
+from lib.process import Line
+from session_log import LEVEL_ERROR, LEVEL_WARNING, SessionLog
 from widget.console import Color, Console
 from widget.code_editor import DEFAULTSTYLE, CodeEditor # pylint: disable=import-error
+from widget.session_log_window import SessionLogWindow
 
 from gui import LiveMosher1
 
@@ -69,6 +73,10 @@ class LiveMosherGui:
 
         self.console = Console(self.w.scrolledText_console, font_size=9 if not IS_MAC else 12)
         self.w.scrolledText_console = self.console.text_widget
+        # The console only shows the current playback, all output of the app session is in the session log
+        self.session_log: SessionLog = None
+        self.session_log_window: SessionLogWindow = None
+        self.console.editor.menu.add_command(label="Session log...", command=self.on_session_log)
 
         style = ttk.Style(root)
 
@@ -526,15 +534,42 @@ class LiveMosherGui:
     def console_log(self, text: str, timestamp: float = None):
         print(f'Console: {text}\033[0m') # Reset color
         self.console.log(text, timestamp=timestamp)
+        self.session_log_lines('app', [(text, timestamp)])
+
+    def console_log_lines(self, lines: List[Line], process='fflive'):
+        if not lines:
+            return
+        print('\n'.join(f'Console: {line.line}\033[0m' for line in lines))
+        self.console.log_lines((line.line, line.timestamp) for line in lines)
+        self.session_log_lines(process, [(line.line, line.timestamp) for line in lines])
 
     def console_warn(self, text: str):
         print_warn(f'Console: {text}\033[0m')
         print(f'Console: {text}\033[0m') # Reset color
         self.console.log(text, Color.YELLOW)
+        self.session_log_lines('app', [(text, None)], LEVEL_WARNING)
 
     def console_error(self, text: str):
         print_error(f'Console: {text}\033[0m') # Reset color
         self.console.log(text, Color.RED)
+        self.session_log_lines('app', [(text, None)], LEVEL_ERROR)
+
+    def session_log_lines(self, process: str, lines, level: int = None):
+        if self.session_log:
+            self.session_log.append(process, lines, level)
+
+    def on_session_log(self):
+        if self.session_log_window and not self.session_log_window.is_destroyed():
+            self.session_log_window.frame.lift()
+            return
+        if not self.session_log:
+            print_warn('Session log disabled, set session_log_dir in config.ini')
+            return
+        top = tk.Toplevel(self.root)
+        self.session_log_window = SessionLogWindow(top, self.session_log, bg_color=self.top_background,
+                                                   font=self.console.text_widget.cget('font'))
+        self.session_log_window.set_on_exit_cb(lambda: setattr(self, 'session_log_window', None))
+        self.fix_labels_font(top)
 
     def show_about_dialog(self):
         root1 = tk.Toplevel(self.root)
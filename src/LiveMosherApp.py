@@ -1,6 +1,5 @@
 import configparser
-import locale
-from functools import cmp_to_key
+import difflib
 import os
 import os.path
 import subprocess
@@ -10,25 +9,41 @@ import re
 import signal
 import zipfile
 
-from typing import List
+from typing import Dict, List, Tuple
 
 from ctypes.wintypes import HWND
 import tkinter as tk
 from tkinter import filedialog, messagebox, simpledialog
 from send2trash import send2trash
-from zmq import Context as zmq_Context
 
-from consts import EDITED_SCRIPTS_DIR, NAME, PROJECT_EXT, REPO_URL, SCRIPTS_DIR, VERSION_FILE
+from audio_clock import AudioClock
+from consts import BIN_DIR_ENV, EDITED_SCRIPTS_DIR, NAME, PROJECT_EXT, REPO_URL, SCRIPTS_DIR, VERSION_FILE
 from lib.colored_print import print_error, print, print_warn # pylint: disable=redefined-builtin
+from lib.dir_watcher import DirWatcher
 from lib.framerate import find_fraction
 from lib.misc import IS_MAC, IS_WIN, copy_file, find_next_output_file, find_relative_path, fix_windows_network_path, \
                     normalize_path, open_explorer_and_select_file, parse_float, path_replace_not_allowed_chars, resolve_relative_path
 from lib.process import Line, Process
+from lib.process_log import BACKUP_COUNT as PROCESS_LOG_BACKUPS, ProcessLogger, ProcessLogWriter
 
 from LiveMosher1_support import LiveMosherGui, start_up
 from widget.midi_piano import MidiPiano
+from widget.param_curves_dialog import ParamCurvesDialog
+from widget.profiler_window import ProfilerWindow
 from script import Script
-from zmq_req import ZmqReqPush, ZmqReqMode
+from script_profiler import PROFILE_TAG, ScriptProfiler
+from script_index import ScriptIndex, is_script_file, sort_key as script_sort_key
+from session_log import KEEP_SESSIONS, SessionLog
+from script_wrapper import ScriptWrapper
+from midi_automation import MidiAutomation, merge_tables
+from midi_file_player import MidiFilePlayer
+from midi_sender import MidiSender, encode as midi_encode
+from mv_capture import MvCaptureFile, MvCaptureWriter
+from mv_producer import MvProducer
+from param_curves import compile_curves, curves_from_json, curves_to_json, format_curves
+from telemetry import TelemetrySubscriber
+from zmq_io import ZmqIoThread
+from zmq_req import ZmqReqPush, ZmqReqMode, endpoint_pool
 
 
 #pylint: disable=global-statement
@@ -83,22 +98,102 @@ class LiveMosherApp(LiveMosherGui):
             'video_maximized': 'False',
             'window_border_size': '-,-',
             'script_count': '0',
+            'script_telemetry': 'True',
+            'zmq_stats_file': '', # Export control-plane latency stats and slow request trace on exit
+            'midi_cc_rate': '60', # Max controller updates per second sent to the MIDI emulation, 0 = unlimited
+            'mv_producer_mode': '', # Serve motion vectors to Examples/zmq-demo/mv_receiver.js: zoom, rotate, wave, noise, image, replay
+            'mv_producer_source': '', # Image for 'image', .mvcap or .npy capture for 'replay'
+            'mv_producer_scale': '8',
+            'profile_helpers': 'True', # Profiling also times the exported functions of the imported helper scripts
+            'session_log_dir': 'logs', # Indexed log of all process output per app session, empty = disabled
+            'session_log_keep': str(KEEP_SESSIONS), # Sessions kept in session_log_dir
+            'process_log_dir': 'logs', # Rotating raw output files of the processes per session, empty = disabled
+            'process_logs': 'ffgac, ffgac_a, fflive, fflive1, ffgac_rec', # Processes logged, * = all
+            'process_log_max_mb': '10', # Size of one log file before it's rotated
+            'process_log_backups': str(PROCESS_LOG_BACKUPS), # Rotated files kept per process
+            'audio_tempo_control': 'True', # Follow the video by changing the audio tempo through an azmq filter, False = restart the audio
+            'audio_clock_log': 'True', # Audio/video drift of every sync step to audio_clock.csv in the process log session dir
         }
         self.config.read(os.path.join(self.cwd, 'config.ini'))
 
+        session_log_dir = self.config['Main'].get('session_log_dir', '')
+        if session_log_dir:
+            session_log = SessionLog(resolve_relative_path(self.cwd, session_log_dir),
+                                     keep_sessions=self.config['Main'].getint('session_log_keep', KEEP_SESSIONS))
+            if session_log.start():
+                self.session_log = session_log
+
+        self.process_log: ProcessLogWriter = None
+        process_log_dir = self.config['Main'].get('process_log_dir', '')
+        if process_log_dir:
+            processes = [p.strip() for p in self.config['Main'].get('process_logs', '').split(',') if p.strip()]
+            process_log = ProcessLogWriter(resolve_relative_path(self.cwd, process_log_dir),
+                                           session=self.session_log.name if self.session_log else None,
+                                           processes=None if '*' in processes else processes,
+                                           max_bytes=int(self.config['Main'].getfloat('process_log_max_mb', 10) * 1024 * 1024),
+                                           backup_count=self.config['Main'].getint('process_log_backups', PROCESS_LOG_BACKUPS),
+                                           keep_sessions=self.config['Main'].getint('session_log_keep', KEEP_SESSIONS))
+            if process_log.start():
+                self.process_log = process_log
+
         self.project = self.get_default_project()
 
+        # Parsed script types/imports cached by mtime, the list reload reads only changed files
+        self.script_index = ScriptIndex(os.path.join(self.cwd, 'script_index.json'))
+        self.script_index.load()
+        # External edits (editors, git pulls) in the script dirs update the list on their own
+        self.dir_watcher = DirWatcher()
+
         self.project_scripts: List[Script] = []
         self.all_scripts: List[Script] = []
         self.listbox_scripts: List[Script] = []
 
-        self.zmq_context = zmq_Context()
-        self.zmq_context_midi = zmq_Context()
-        self.fflive_zmq = ZmqReqPush(ctx=self.zmq_context, name='fflive', wait_cb=self.gui_event_loop)
-        self.fflive_a_zmq = ZmqReqPush(ctx=self.zmq_context, name='fflive_audio', wait_cb=self.gui_event_loop)
+        # All control sockets (fflive video, fflive audio, MIDI emulation) live in one I/O thread
+        self.zmq_io = ZmqIoThread()
+        self.zmq_io.start()
+        self.fflive_zmq = ZmqReqPush(self.zmq_io, name='fflive', wait_cb=self.gui_event_loop)
+        self.fflive_a_zmq = ZmqReqPush(self.zmq_io, name='fflive_audio', wait_cb=self.gui_event_loop)
         self.fflive_zmq.generate_urls()
         self.fflive_a_zmq.generate_urls()
-        self.midi_zmq = ZmqReqPush(ctx=self.zmq_context_midi, name='midi_emu', mode=ZmqReqMode.TCP, is_push=True)
+        # azmq filter in front of atempo in the audio fflive, the tempo follows the video without restarts
+        self.audio_tempo_control = self.config['Main'].getboolean('audio_tempo_control', True)
+        self.fflive_a_tempo_zmq = ZmqReqPush(self.zmq_io, name='fflive_audio_tempo', wait_cb=self.gui_event_loop)
+        self.fflive_a_tempo_zmq.generate_urls()
+        self.fflive_filters: Dict[str, List[str]] = {} # fflive binary -> filters it was built with
+        self.audio_clock = AudioClock(log_path=os.path.join(self.process_log.session_dir, 'audio_clock.csv')
+                                      if self.process_log and self.config['Main'].getboolean('audio_clock_log', True) else None)
+        self.midi_zmq = ZmqReqPush(self.zmq_io, name='midi_emu', mode=ZmqReqMode.TCP, is_push=True)
+        self.midi_sender = MidiSender(lambda data: self.midi_zmq.req(data) if self.midi_zmq.connected else None,
+                                      self.after, self.after_cancel,
+                                      rate_hz=self.config['Main'].getfloat('midi_cc_rate', 60),
+                                      stats=self.zmq_io.stats)
+        self.midi_sender.on_delivered = self.on_midi_delivered
+        self.midi_automation = MidiAutomation()
+        self.midi_file = MidiFilePlayer()
+
+        # Per frame telemetry published by the wrapped script, replaces scraping FRAME_NO from stdout
+        self.telemetry = TelemetrySubscriber(self.zmq_io)
+        if self.config['Main'].getboolean('script_telemetry', True):
+            self.telemetry.start()
+        self.telemetry_start_t = 0.0
+        self.last_telemetry_seq = None
+        self.script_wrapper = ScriptWrapper()
+        # Opt-in, the wrapper times the script entry point and helper functions while the profiler window is open
+        self.profiler = ScriptProfiler()
+        self.telemetry.add_handler(PROFILE_TAG, self.profiler.on_message)
+        self.profiling = False
+
+        self.mv_capture: MvCaptureWriter = None
+        self.mv_capture_processes: List[Process] = []
+        self.mv_capture_frames = 0
+        self.mv_producer: MvProducer = None
+        mv_mode = self.config['Main'].get('mv_producer_mode', '')
+        if mv_mode:
+            self.mv_producer = MvProducer(self.zmq_io.context, mode=mv_mode,
+                                          scale=self.config['Main'].getfloat('mv_producer_scale', 8.0),
+                                          source=resolve_relative_path(self.cwd, self.config['Main'].get('mv_producer_source', '')))
+            if not self.mv_producer.start():
+                self.mv_producer = None
 
         self.w.button_clone.configure(command=self.on_clone_script)
         self.w.button_edit_script.configure(command=self.on_edit_share_script)
@@ -158,6 +253,10 @@ class LiveMosherApp(LiveMosherGui):
         self.ffgac_process: Process = None
         self.ffgac_rec_process: Process = None
         self.fflive_process: Process = None
+        self.fflive_script_path = ''
+        self.fflive_script_is_filter = False
+        self.fflive_base_command: List[str] = None
+        self.swapped_mtimes: Dict[str, int] = {}
         self.fflive_process_ok = None
         self.fflive_window_title = ''
         self.fflive_window_borders = None, None
@@ -182,6 +281,7 @@ class LiveMosherApp(LiveMosherGui):
 
         self.input_frames_count = 0
         self.input_frames_count_alt = 0
+        self.input_video_size = None # (width, height)
         self.current_frame: int = 1
         self.current_frame_ffgac: int = 0
         self.start_video_at: float = 0.0
@@ -223,6 +323,8 @@ Have fun!
         self.editor_empty_text_color = '#666'
 
         self.piano: MidiPiano = None
+        self.param_curves_dialog: ParamCurvesDialog = None
+        self.profiler_window: ProfilerWindow = None
 
 
     @property
@@ -256,13 +358,16 @@ Have fun!
             print('Window borders:', self.fflive_window_borders)
         except ValueError:
             pass
-        if self.fflive_window_borders[0] is None or self.fflive_window_borders[1] is None:
+        # Borders are only needed to restore a saved video window position, don't spawn the test fflive before that
+        if (self.fflive_window_borders[0] is None or self.fflive_window_borders[1] is None) and self.has_saved_video_pos():
             self.after(500, self.test_window_borders_size)
 
         self.editor.set_text(self.editor_empty_text, self.editor_empty_text_color)
         self.after(1, self.show_hide, self.w.button_edit_script, False)
         self.place_start_end_mark()
         self.after(1000, self.check_fps, True)
+        self.after(20, self.check_telemetry, True)
+        self.after(250, self.check_dir_watcher)
 
         # self.console_log('CWD: ' + self.cwd)
         # self.console_log('App script dir: ' + self.this_dir)
@@ -314,9 +419,25 @@ Have fun!
                 self.editor.save()
 
             self.kill_ffplay_processes()
+            self.stop_mv_capture()
+            self.dir_watcher.stop()
             self.fflive_zmq.close()
             self.fflive_a_zmq.close()
+            self.fflive_a_tempo_zmq.close()
+            self.audio_clock.close()
+            self.midi_sender.flush()
             self.midi_zmq.close()
+            self.telemetry.stop()
+            if self.mv_producer:
+                self.mv_producer.stop()
+            self.export_zmq_stats()
+            self.zmq_io.stop()
+            if self.session_log:
+                self.session_log.stop()
+            if self.process_log:
+                self.process_log.stop()
+            endpoint_pool.cleanup()
+            self.script_wrapper.cleanup()
 
             super().on_exit(_event)
         except Exception as e:
@@ -326,6 +447,24 @@ Have fun!
                 super().on_exit(_event)
 
 
+    def has_saved_video_pos(self):
+        try:
+            x, y = (int(v) for v in self.config['Main']['video_pos'].split(','))
+            return x >= 0 and y >= 0
+        except ValueError:
+            return False
+
+    def export_zmq_stats(self):
+        for line in self.zmq_io.stats.summary():
+            print('ZMQ latency:', line)
+        stats_file = self.config['Main'].get('zmq_stats_file', '')
+        if stats_file:
+            try:
+                self.zmq_io.stats.export(resolve_relative_path(self.cwd, stats_file))
+                print('ZMQ latency stats exported to:', stats_file)
+            except Exception as e:
+                print_error('Error exporting ZMQ stats:', e)
+
     def get_video_win_pos_size(self, req: ZmqReqPush):
         try:
             if req.connected:
@@ -466,13 +605,17 @@ Have fun!
         self.place_start_end_mark()
         self.output_path_base = self.resolve_relative_path(self.project['Project']['output'])
         self.update_output_path()
+        self.midi_automation.load(self.project)
+        self.midi_file.load_project(self.project, self.resolve_relative_path)
+        self.update_piano_automation()
 
         self.project_scripts = []
         script_count = int(self.project['Project']['script_count'])
         for i in range(script_count):
             try:
                 script = Script(self.resolve_relative_path(self.project[f'Script#{i}']['path']),
-                                self.project[f'Script#{i}']['parameters'])
+                                self.project[f'Script#{i}']['parameters'],
+                                curves=self.project[f'Script#{i}'].get('curves', ''))
                 if os.path.exists(script.path):
                     self.project_scripts.append(script)
             except Exception as e:
@@ -522,13 +665,23 @@ Have fun!
                 'path': self.find_relative_path(script.path),
                 'parameters': script.parameters,
             }
+            if script.curves:
+                project[f'Script#{i}']['curves'] = script.curves
+
+        self.midi_automation.save(project)
+        self.midi_file.save_project(project, self.find_relative_path)
 
         def check_dirty():
             all_sections = self.project.sections()
+            for section in all_sections:
+                if not section.startswith('Script#') and not project.has_section(section):
+                    print('Dirty section removed:', section)
+                    return True
             for section in project.sections():
                 if section.startswith('Script#'):
                     path = project[section].get('path')
                     parameters = project[section].get('parameters')
+                    curves = project[section].get('curves', '')
                     found_script = False
                     # Find script in self.project
                     for section1 in self.project.sections():
@@ -538,7 +691,10 @@ Have fun!
                                 if parameters != self.project[section1].get('parameters'):
                                     print(f'Dirty: [{section}].parameters = {parameters}')
                                     return True
-                    if not found_script and parameters:
+                                if curves != self.project[section1].get('curves', ''):
+                                    print(f'Dirty: [{section}].curves')
+                                    return True
+                    if not found_script and (parameters or curves):
                         print(f'Dirty: [{section}].parameters = {parameters}')
                         return True
                 else:
@@ -678,22 +834,78 @@ Have fun!
             elif parameters:
                 self.project_scripts.append(Script(self.selected_script.path, parameters))
 
+    def on_edit_param_curves(self):
+        if not self.selected_script or not self.selected_script.path:
+            return
+        if self.param_curves_dialog and not self.param_curves_dialog.is_destroyed():
+            self.param_curves_dialog.destroy()
+        project_script = self.get_script_from_list(self.project_scripts, self.selected_script.path)
+        text = format_curves(curves_from_json(project_script.curves)) if project_script else ''
+        top = tk.Toplevel(self.root)
+        self.param_curves_dialog = ParamCurvesDialog(top, f'Parameter curves - {os.path.basename(self.selected_script.path)}',
+                                                     text, bg_color=self.top_background)
+        self.param_curves_dialog.set_on_ok_cb(self.set_param_curves)
+        self.fix_labels_font(top)
+
+    def on_profile_script(self):
+        if self.profiler_window and not self.profiler_window.is_destroyed():
+            self.profiler_window.frame.lift()
+            return
+        if not self.telemetry.url:
+            show_info('Profiling needs script telemetry, enable script_telemetry in config.ini')
+            return
+        top = tk.Toplevel(self.root)
+        self.profiler_window = ProfilerWindow(top, self.profiler, bg_color=self.top_background)
+        self.profiler_window.set_frame_budget(self.input_fps)
+        self.profiler_window.set_on_exit_cb(self.on_profiler_window_exit)
+        self.fix_labels_font(top)
+        self.set_profiling(True)
+
+    def on_profiler_window_exit(self):
+        self.profiler_window = None
+        self.set_profiling(False)
+
+    def set_profiling(self, enabled):
+        '''The instrumentation is part of the generated wrapper, swap the running script to add or remove it'''
+        if self.profiling == enabled:
+            return
+        self.profiling = enabled
+        if self.can_hot_swap_script():
+            self.hot_swap_script()
+
+    def set_param_curves(self, curves):
+        if not self.selected_script or not self.selected_script.path:
+            return
+        self.update_script_parameters()
+        script = self.get_script_from_list(self.project_scripts, self.selected_script.path)
+        if not script:
+            script = Script(self.selected_script.path, self.w.entry_script_parameters.get())
+            self.project_scripts.append(script)
+        script.curves = curves_to_json(curves)
+        self.project_changed()
+        self.restart_ffplay(self.current_time() if self.is_playing else 0.0)
+
+    def get_param_table(self):
+        script = self.get_script_from_list(self.project_scripts, self.selected_script.path) if self.selected_script else None
+        if not script or not script.curves:
+            return None
+        try:
+            return compile_curves(curves_from_json(script.curves))
+        except (ValueError, KeyError) as e:
+            print_error('Error compiling parameter curves:', e)
+            return None
+
     def restart_ffplay(self, start_at_sec=0.0):
         self.start_ffplay(start_at_sec=start_at_sec)
 
-    def update_scripts_list(self, select_script_path=''):
-        current_y_pos = self.w.listbox_scripts.yview()[0]
-        self.w.listbox_scripts.delete(0, tk.END)
-        self.listbox_scripts = []
+    def collect_scripts_list(self) -> List[Tuple[str, Script]]:
+        entries: List[Tuple[str, Script]] = []
 
         def format_path(path, depth):
             return f'{"  " * depth}{path}'
 
         def traverse_dir(root_dir, is_edited_scripts=False):
             current_dir = root_dir
-            def starting_underscore(x):
-                x = os.path.splitext(x)[0]
-                return re.sub(r'^(_+)', 'ZZZ', x)
             dirs = list(os.walk(current_dir))
             dirs.sort(key=lambda x: x[0])
             for root, _dirs, files in dirs:
@@ -706,56 +918,109 @@ Have fun!
                     base_name = os.path.basename(current_dir1)
                     if path_deep == 1:
                         base_name = EDITED_SCRIPTS_DIR if is_edited_scripts else SCRIPTS_DIR
-                    self.w.listbox_scripts.insert(tk.END, format_path(folder_icon + base_name, path_deep - 1)  )
+                    entries.append((format_path(folder_icon + base_name, path_deep - 1), None))
                     current_dir = current_dir1
-                    self.listbox_scripts.append(None)
                 # Files
-                files.sort(key=cmp_to_key(lambda x, y: locale.strcoll(starting_underscore(x), starting_underscore(y))), reverse=False)
+                files.sort(key=script_sort_key)
                 scripts = []
                 for file in files:
-                    if file.endswith(".js") or file.endswith(".mjs") or file.endswith(".py"):
+                    if is_script_file(file):
                         full_path = normalize_path(os.path.join(root, file))
-                        script = Script(full_path, buildin=not is_edited_scripts)
-                        scripts.append(script)
-                        with open(full_path, 'r', encoding='utf-8') as f:
-                            source = f.read()
-                            is_main = re.search(r'export +function +(glitch_frame|filter) *\(', source)
-                            script.type = Script.Type.MAIN if is_main else Script.Type.HELPER
-                            script.is_filter = is_main and is_main.group(1) == 'filter'
+                        scripts.append(self.script_index.script(full_path, buildin=not is_edited_scripts))
 
                 scripts.sort(key=lambda x: x.type == Script.Type.MAIN, reverse=True)
                 for script in scripts:
                     file_icon = '▹'
                     file = os.path.basename(script.path)
-                    self.w.listbox_scripts.insert(tk.END, format_path(file_icon + re.sub(r'.js$|.mjs$|.py$', '', file, flags=re.IGNORECASE), path_deep))
-                    self.listbox_scripts.append(script)
-
+                    entries.append((format_path(file_icon + re.sub(r'.js$|.mjs$|.py$', '', file, flags=re.IGNORECASE), path_deep), script))
 
+        self.script_index.begin_scan()
         traverse_dir(self.resolve_relative_path(EDITED_SCRIPTS_DIR), is_edited_scripts=True)
         # Separator
-        if self.listbox_scripts:
-            self.w.listbox_scripts.insert(tk.END, '')
-            self.listbox_scripts.append(None)
+        if entries:
+            entries.append(('', None))
         traverse_dir(self.scripts_dir)
+        self.script_index.end_scan([self.resolve_relative_path(EDITED_SCRIPTS_DIR), self.scripts_dir])
+        self.script_index.save()
+        return entries
 
-        self.w.listbox_scripts.tooltip_texts = [''] * len(self.listbox_scripts)
-        for i, script in enumerate(self.listbox_scripts):
-            if script:
-                if script.type == Script.Type.MAIN:
-                    self.w.listbox_scripts.itemconfig(i, {'fg': '#000000'})
-                if script.type == Script.Type.HELPER:
-                    self.w.listbox_scripts.itemconfig(i, {'fg': '#6f6f6f'})
-                    self.w.listbox_scripts.tooltip_texts[i] = 'Helper script'
+    def update_scripts_list(self, select_script_path=''):
+        entries = self.collect_scripts_list()
+        listbox = self.w.listbox_scripts
+
+        # Apply only the difference to the listbox, keeps scroll position, selection and unchanged Script objects
+        def entry_key(text, script: Script):
+            return (text, script.path, script.type, script.is_filter, script.buildin) if script else (text,)
+        old_keys = [entry_key(listbox.get(i), script) for i, script in enumerate(self.listbox_scripts)]
+        new_keys = [entry_key(text, script) for text, script in entries]
+        top_index = listbox.nearest(0) if self.listbox_scripts else 0
+        top_key = old_keys[top_index] if top_index < len(old_keys) else None
+
+        new_scripts = [script for _text, script in entries]
+        matcher = difflib.SequenceMatcher(None, old_keys, new_keys, autojunk=False)
+        for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+            if tag == 'equal':
+                new_scripts[j1:j2] = self.listbox_scripts[i1:i2]
+                continue
+            if i2 > i1:
+                listbox.delete(i1, i2 - 1)
+            for k in range(j1, j2):
+                listbox.insert(i1 + k - j1, entries[k][0])
+                script = entries[k][1]
+                if script and script.type == Script.Type.HELPER:
+                    listbox.itemconfig(i1 + k - j1, {'fg': '#6f6f6f'})
+                elif script:
+                    listbox.itemconfig(i1 + k - j1, {'fg': '#000000'})
+        self.listbox_scripts = new_scripts
+
+        listbox.tooltip_texts = ['Helper script' if script and script.type == Script.Type.HELPER else ''
+                                 for script in self.listbox_scripts]
 
         if select_script_path:
             self.selected_script = self.get_script_from_list(self.listbox_scripts, select_script_path)
 
+        listbox.selection_clear(0, tk.END)
         if self.selected_script:
             self.selected_script = self.get_script_from_list(self.listbox_scripts, self.selected_script.path)
-            idx = self.listbox_scripts.index(self.selected_script)
-            if idx >= 0:
-                self.w.listbox_scripts.selection_set(idx)
-        self.w.listbox_scripts.yview_moveto(current_y_pos)
+            if self.selected_script:
+                listbox.selection_set(self.listbox_scripts.index(self.selected_script))
+        if top_key in new_keys:
+            listbox.yview(new_keys.index(top_key))
+
+        self.dir_watcher.watch([self.resolve_relative_path(EDITED_SCRIPTS_DIR), self.scripts_dir])
+
+    def check_dir_watcher(self):
+        changed = self.dir_watcher.poll()
+        if changed and any(is_script_file(path) or not os.path.splitext(path)[1] for path in changed):
+            print(f'Scripts changed on disk ({len(changed)})')
+            self.update_scripts_list()
+            self.restart_on_dependency_change(changed)
+        self.after(250, self.check_dir_watcher)
+
+    def restart_on_dependency_change(self, changed):
+        '''fflive reloads only the script it was given, not the helpers it imports. Hot swap the script when one
+        of those changed. The script behind a generated wrapper is reloaded by rewriting the wrapper.'''
+        if not self.fflive_process or self.is_recording or not self.selected_script or not self.fflive_script_path:
+            return
+        changed = {normalize_path(os.path.abspath(path)) for path in changed}
+        # The editor's save is reported again by the dir watcher, handle once per file version
+        changed = {path for path in changed if self.swapped_mtimes.get(path) != get_mtime_ns(path)}
+        wrapped = self.script_wrapper.script
+        if wrapped and self.fflive_script_path == self.script_wrapper.path:
+            wrapped_path = normalize_path(os.path.abspath(wrapped.path))
+            if wrapped_path in changed:
+                self.swapped_mtimes[wrapped_path] = get_mtime_ns(wrapped_path)
+                if self.script_wrapper.reload(self.current_frame):
+                    print(f'Script changed, reloading version {self.script_wrapper.version}')
+                else:
+                    self.hot_swap_script()
+                    return
+        watched = {normalize_path(os.path.abspath(path)) for path in self.script_index.dependencies(self.selected_script.path)}
+        changed &= watched
+        if changed:
+            self.swapped_mtimes.update({path: get_mtime_ns(path) for path in changed})
+            print('Imported script changed, hot swapping')
+            self.hot_swap_script()
 
     def ping_window(self, req: ZmqReqPush):
         return req.connected and bool(req.req_msg('volume'))
@@ -811,9 +1076,11 @@ Have fun!
                 show_warning('Error while opening the video file. Check if the file is valid.')
                 self.ffgac_process = None
 
-            if self.fflive_a_zmq.connected and self.fflive_a_process and self.check_if_process_finished(self.fflive_a_process):
+            if self.fflive_a_zmq.connected and self.fflive_a_process and self.check_if_process_finished(self.fflive_a_process) \
+                    and not self.restart_audio_without_azmq():
                 self.fflive_a_process = None
                 self.fflive_a_zmq.disconnect()
+                self.fflive_a_tempo_zmq.disconnect()
                 self.update_mute_checkbutton()
         finally:
             self.check_timer_running = False
@@ -843,10 +1110,9 @@ Have fun!
                 self.audio_speed = max(0.5, new_audio_speed)
                 self.ffgac_a_process.kill()
                 self.fflive_a_process.kill()
-                new_temp = f'atempo={self.audio_speed:.3f}'
                 def change_param(cmd, param, new_value):
                     cmd[cmd.index(param) + 1] = str(new_value)
-                change_param(self.fflive_a_process.command, '-af', new_temp)
+                change_param(self.fflive_a_process.command, '-af', self.audio_filter(self.audio_speed))
                 change_param(self.fflive_a_process.command, '-volume', '100' if not self.is_mute else '0')
                 if '-start_paused' in self.fflive_a_process.command:
                     self.fflive_a_process.command.remove('-start_paused')
@@ -855,11 +1121,16 @@ Have fun!
                 self.ffgac_a_process.start()
                 self.fflive_a_process.start(stdin=self.ffgac_a_process.process.stdout)
                 self.is_paused_audio = False
+                self.audio_clock.reset(self.audio_speed)
                 print(f'Restart audio speed: {self.audio_speed:.3f}, time: {self.audio_time:.3f}')
 
             self.update_audio_time()
             t = time.time()
-            if self.fps >= 0 and self.input_fps:
+            sample = self.telemetry.latest if self.telemetry.is_alive() else None
+            if sample and self.fps >= 0 and self.input_fps and not self.is_paused:
+                # Frame time stamped by the script itself, no stdout/queue/timer delay
+                time_video = (sample.frame_num + (t - sample.wall_time) * self.fps) / self.input_fps
+            elif self.fps >= 0 and self.input_fps:
                 diff = t - self.last_progres_update_t
                 time_video = (self.current_frame + diff * self.fps) / self.input_fps
             elif self.input_fps:
@@ -871,24 +1142,38 @@ Have fun!
                     # print(f'Audio time: {time_audio:.3f}, Video time: {time_video:.3f}, Diff: {diff:.3f}')
             if self.fps > 0:
                 new_audio_speed = min(MAX_SPEED, max(0.1, self.fps / self.input_fps))
+                # With tempo control only large jumps restart (seek) or pause the audio, the rest is left to the clock loop
+                tempo_control = self.audio_tempo_control and self.fflive_a_tempo_zmq.connected
+                event = ''
                 if diff > 0.5:
-                    if new_audio_speed < self.audio_speed and self.audio_speed > 0.5 and t - self.last_audio_restart_time > 1:
+                    if not tempo_control and new_audio_speed < self.audio_speed and self.audio_speed > 0.5 and t - self.last_audio_restart_time > 1:
                         restart_audio(new_audio_speed, time_video + 0.1)
+                        event = 'seek'
                     elif not self.is_paused_audio:
                         if self.fflive_a_zmq.req_msg('pause'):
                             self.is_paused_audio = True
+                            event = 'pause'
                             print('Pause audio')
                         else:
                             print_error('Error pausing audio')
-                elif diff < -1 or (diff < -0.3 and new_audio_speed < self.audio_speed + 0.1): # Restart audio if it's too far behind
+                    self.audio_clock.hold()
+                elif diff < -1 or (not tempo_control and diff < -0.3 and new_audio_speed < self.audio_speed + 0.1): # Restart audio if it's too far behind
                     restart_audio(new_audio_speed, time_video)
-                elif diff < -0.1:
-                    if self.is_paused_audio:
+                    event = 'seek'
+                elif self.is_paused_audio:
+                    if diff < -0.1:
                         if self.fflive_a_zmq.req_msg('play'):
                             self.is_paused_audio = False
+                            event = 'play'
                             print('Play audio')
                         else:
                             print_error('Error 1 playing audio')
+                    self.audio_clock.hold()
+                elif tempo_control:
+                    tempo = self.audio_clock.update(t, diff, new_audio_speed)
+                    if tempo is not None and self.set_audio_tempo(tempo):
+                        event = 'tempo'
+                self.audio_clock.log(t, time_video, time_audio, new_audio_speed, event)
             self.update_audio_time()
         except TimeoutError:
             pass
@@ -896,6 +1181,65 @@ Have fun!
             print('Error check_ffplay_process:', e)
             traceback.print_exc()
 
+    def audio_filter(self, tempo):
+        if self.audio_tempo_control and 'azmq' not in self.get_fflive_filters():
+            print_warn('fflive has no azmq filter, restarting the audio to change its speed')
+            self.audio_tempo_control = False
+        if not self.audio_tempo_control:
+            return f'atempo={tempo:.3f}'
+        bind_url = self.fflive_a_tempo_zmq.bind_url.replace(':', r'\\:') # Escaped for the filter graph and the option
+        return f'azmq=bind_address={bind_url},atempo={tempo:.3f}'
+
+    def restart_audio_without_azmq(self):
+        '''The audio fflive failed right after starting with the azmq filter, e.g. a build without it or
+        a bind error. Runs the audio again with a plain atempo, its speed is then changed by restarts.'''
+        process = self.fflive_a_process
+        if (not self.audio_tempo_control or process.returncode == 0 or time.time() - self.last_audio_restart_time > 5
+                or not self.ffgac_a_process or not process.command[process.command.index('-af') + 1].startswith('azmq=')):
+            return False
+        print_warn('Audio failed with the azmq filter, restarting the audio to change its speed')
+        self.audio_tempo_control = False
+        self.fflive_a_tempo_zmq.disconnect()
+        process.kill()
+        self.ffgac_a_process.kill()
+        process.command[process.command.index('-af') + 1] = self.audio_filter(self.audio_speed)
+        self.audio_time = self.current_time()
+        self.ffgac_a_process.command[self.ffgac_a_process.command.index('-ss') + 1] = str(self.audio_time)
+        self.ffgac_a_process.start()
+        process.start(stdin=self.ffgac_a_process.process.stdout)
+        self.last_audio_restart_time = time.time()
+        self.last_audio_time_check = time.time()
+        self.audio_clock.reset(self.audio_speed)
+        return True
+
+    def get_fflive_filters(self) -> List[str]:
+        '''Filter names from `fflive -filters`, run once per binary'''
+        fflive = self.get_bin('fflive')
+        if fflive not in self.fflive_filters:
+            filters = []
+            try:
+                out = subprocess.run([fflive, '-hide_banner', '-filters'], capture_output=True, timeout=5,
+                                     env=self.get_env_vars(), check=False).stdout.decode('utf-8', errors='ignore')
+                # " T.. azmq  A->A  Receive commands through ZMQ and send them to filters."
+                filters = [m.group(1) for m in re.finditer(r'^\s*[A-Z.|]{2,}\s+(\w+)\s+\S*->', out, re.MULTILINE)]
+            except (OSError, subprocess.SubprocessError) as e:
+                print_error('Error listing the fflive filters:', e)
+            self.fflive_filters[fflive] = filters
+        return self.fflive_filters[fflive]
+
+    def set_audio_tempo(self, tempo):
+        '''Changes the tempo of the running audio in place, falls back to restarts if the command fails'''
+        reply = self.fflive_a_tempo_zmq.req_text(f'atempo tempo {tempo:.4f}')
+        if not reply or not reply.startswith('0 '):
+            print_warn(f'Audio tempo command failed: "{reply}", restarting the audio to change the speed from now on')
+            self.audio_tempo_control = False
+            self.fflive_a_tempo_zmq.disconnect()
+            return False
+        self.update_audio_time() # The time so far played at the old tempo
+        self.audio_speed = tempo
+        self.audio_clock.tempo_sent(time.time(), tempo)
+        return True
+
     def check_if_process_finished(self, process: Process):
         if process and process.process.poll() is not None:
             if process.returncode != 0:
@@ -996,12 +1340,13 @@ Have fun!
         if from_timer:
             self.after(round((self.next_fps_check_t - time.time()) * 1000), self.check_fps, from_timer)
 
-    def on_frame_progress(self, frame_no):
+    def on_frame_progress(self, frame_no, frame_t=None):
         timeS = self.frameToTime(frame_no)
         if timeS > self.input_duration:
             return
-        self.last_progres_update_t = time.time()
+        self.last_progres_update_t = frame_t or time.time()
         self.current_frame = frame_no
+        self.midi_file.on_frame(frame_no, self.send_midi_file_msg)
         # Update progress scale
         if not self.is_recording:
             self.set_progress_widget(self.current_frame)
@@ -1017,6 +1362,16 @@ Have fun!
                     print_error('Error 2 playing audio')
         self.played_frames += 1
 
+    def check_telemetry(self, from_timer=False):
+        sample = self.telemetry.latest
+        if sample and sample.seq != self.last_telemetry_seq and sample.wall_time >= self.telemetry_start_t:
+            self.last_telemetry_seq = sample.seq
+            self.midi_sender.on_frame(sample.wall_time, sample.frame_num)
+            if self.is_playing and not self.is_paused and self.input_frames_count:
+                self.on_frame_progress(sample.frame_num, sample.wall_time)
+        if from_timer:
+            self.after(20, self.check_telemetry, from_timer)
+
     def set_progress_widget(self, frame_no = None):
         if frame_no is None:
             frame_no = self.current_frame
@@ -1094,7 +1449,7 @@ Have fun!
                             #     self.is_paused = False
                             #     self.fflive_start_paused = False
                             #     self.update_play_text()
-                            if not self.is_paused:
+                            if not self.is_paused and not self.telemetry.is_alive():
                                 current_frame = frame + self.timeToframe(self.start_video_at)
                                 self.on_frame_progress(current_frame)
                     except ValueError as e:
@@ -1133,23 +1488,85 @@ Have fun!
                     process_line.line = line
                     lines1.append(process_line)
 
-        for line in lines1:
-            self.console_log(line.line, timestamp=line.timestamp)
+        self.console_log_lines(lines1, 'fflive')
 
     def show_midi_piano(self, show=True, in_ms=0):
         if show and (self.piano is None or self.piano.is_destroyed()):
             top = tk.Toplevel(self.root)
             self.piano = MidiPiano(top, bg_color=self.top_background)
-            self.piano.set_on_message_cb(lambda msg: self.midi_zmq.req_msg(str(msg)) if self.midi_zmq.connected else None)
+            self.piano.set_on_message_cb(self.on_midi_message)
+            self.piano.set_on_automation_cb(self.on_midi_automation_mode, self.on_midi_automation_clear)
+            self.piano.set_on_midi_file_cb(self.on_select_midi_file)
+            self.update_piano_automation()
             self.fix_labels_font(top)
 
         if self.piano:
             self.piano.show(show, in_ms)
 
+
+    def on_midi_message(self, msg):
+        if self.midi_automation.recording and not self.telemetry.is_alive() and self.is_playing and not self.is_paused:
+            # No telemetry to tell which frame got it, the next one is the best guess
+            self.midi_automation.record(self.current_frame + 1, msg)
+            self.update_piano_automation()
+        self.midi_sender.send(msg)
+
+    def on_midi_delivered(self, frame_num, msg):
+        if self.midi_automation.recording and self.is_playing and not self.is_paused:
+            self.midi_automation.record(frame_num, msg)
+            self.update_piano_automation()
+
+    def on_midi_automation_mode(self, record, play):
+        was_recording = self.midi_automation.recording
+        self.midi_automation.recording = record
+        self.midi_automation.enabled = play
+        if was_recording and not record:
+            print(f'MIDI automation: {len(self.midi_automation)} events')
+        self.project_changed()
+
+    def on_midi_automation_clear(self):
+        self.midi_automation.clear()
+        self.update_piano_automation()
+        self.project_changed()
+
+    def update_piano_automation(self):
+        if self.piano and not self.piano.is_destroyed():
+            self.piano.set_automation_state(self.midi_automation.recording, self.midi_automation.enabled,
+                                            len(self.midi_automation))
+            self.piano.set_midi_file(os.path.basename(self.midi_file.path))
+
+    def send_midi_file_msg(self, msg):
+        if self.midi_zmq.connected:
+            self.midi_zmq.req(midi_encode(msg))
+
+    def on_select_midi_file(self):
+        file_path = filedialog.askopenfilename(filetypes=[('MIDI files', ['.mid', '.midi', '.smf']), ('All files','.*')])
+        file_path = fix_windows_network_path(file_path)
+        if file_path:
+            bpm = simpledialog.askfloat('MIDI file', 'Tempo in BPM (0 = use the tempo map from the file):',
+                                        initialvalue=self.midi_file.bpm, minvalue=0)
+            self.midi_file.load(file_path, bpm=bpm or 0.0)
+        elif self.midi_file.path and messagebox.askyesno('MIDI file', f'Stop playing {os.path.basename(self.midi_file.path)}?'):
+            self.midi_file.unload()
+        else:
+            return
+        self.update_piano_automation()
+        self.project_changed()
+        self.restart_ffplay()
+
     def remove_hex_address(self, line):
         line = re.sub(r' ?@ ?(0x)?[0-9a-fA-F]{8,}', '', line) # [libx264 @ 000001a44c6d0840] => [libx264]
         return line
 
+    def process_logger(self, name: str) -> ProcessLogger:
+        '''Log file handle for the process, None when it's not in process_logs'''
+        return self.process_log.logger(name) if self.process_log else None
+
+    def on_ffgac_stderr(self, lines: List[Line]):
+        # Progress lines are left out of the session log, the rest isn't shown in the console
+        self.session_log_lines('ffgac', [(line.line, line.timestamp) for line in lines if 'frame=' not in line.line])
+        self.on_ffgac_console(lines)
+
     ffgac_lines = []
     def on_ffgac_console(self, lines: List[Line]):
         _duration_line = 'Duration: 00:00:26.00, start: 0.040000, bitrate: 3933 kb/s'
@@ -1193,6 +1610,11 @@ Have fun!
                         calc_frames_count()
                         self.update_play_text()
                 elif 'Video:' in line and 'fps' in line:
+                    size = re.search(r', (\d{2,5})x(\d{2,5})', line)
+                    if size:
+                        self.input_video_size = (int(size.group(1)), int(size.group(2)))
+                        if self.mv_producer:
+                            self.mv_producer.set_video(*self.input_video_size, float(line.split('fps,')[0].split(',')[-1].strip()))
                     fps = line.split('fps,')[0].split(',')[-1].strip()
                     if self.input_fps != float(fps):
                         self.input_fps = float(fps)
@@ -1224,6 +1646,7 @@ Have fun!
                 traceback.print_exc()
 
     def on_ffgac_rec_console(self, lines: List[Line]):
+        lines1: List[Line] = []
         for process_line in lines:
             line = process_line.line
             try:
@@ -1243,7 +1666,8 @@ Have fun!
             if 'slice end not reached but screenspace end' in line or 'corrupt decoded frame' in line:
                 continue
             process_line.line = line
-            self.console_log(process_line.line, timestamp=process_line.timestamp)
+            lines1.append(process_line)
+        self.console_log_lines(lines1, 'ffgac_rec')
 
     def on_play(self):
         if self.selected_script and not self.selected_script.buildin:
@@ -1279,7 +1703,10 @@ Have fun!
     def on_play_script(self):
         if self.selected_script and not self.selected_script.buildin:
             self.editor.save()
-        self.start_ffplay()
+        if self.can_hot_swap_script():
+            self.hot_swap_script()
+        else:
+            self.start_ffplay()
 
     def on_record(self):
         if not self.output_path and not self.on_select_output():
@@ -1338,6 +1765,8 @@ Have fun!
     def get_bin(self, bin_name):
         platform = 'win' if IS_WIN else 'mac' if IS_MAC else 'linux'
         bin_dir = f'bin/ffglitch/{platform}' if not self.is_app_packed else f'{self.this_dir}/ffglitch'
+        # E.g. bin/sim for the ffgac/fflive simulators, see ff_simulator.py
+        bin_dir = os.environ.get(BIN_DIR_ENV) or bin_dir
         return normalize_path(os.path.join(bin_dir, bin_name + ('.exe' if IS_WIN else '')))
 
 
@@ -1382,6 +1811,12 @@ Have fun!
             self.input_duration = None
             self.input_frames_count = 0
             self.progress_changing = False
+            self.telemetry.reset()
+            self.telemetry_start_t = time.time()
+            self.last_telemetry_seq = None
+            self.midi_sender.reset()
+            if self.mv_producer and self.input_video_size:
+                self.mv_producer.set_video(*self.input_video_size, self.input_fps, start_frame=start_frame)
 
             video_file = self.video_path
             if not os.path.exists(video_file):
@@ -1473,18 +1908,12 @@ Have fun!
                 idx = fflive_command.index('-vf')
                 fflive_command.pop(idx) # Remove default filter. It will be replaced by the filter script
                 fflive_command.pop(idx)
-
-            try:
-                w = int(self.last_video_size.split('x')[0])
-                h = int(self.last_video_size.split('x')[1])
-                if w > 0 and h > 0:
-                    fflive_command.extend(['-x', str(w), '-y', str(h)])
-            except Exception:
-                pass
+            self.fflive_base_command = list(fflive_command)
+            fflive_command.extend(self.fflive_window_size_args())
 
             fflive_a_command = [
                 self.get_bin('fflive'),
-                '-af', f'atempo={self.fflive_speed_scale}',
+                '-af', self.audio_filter(self.fflive_speed_scale),
                 '-vn',
                 '-nostats',
                 '-nodisp',
@@ -1501,17 +1930,7 @@ Have fun!
             if start_paused:
                 fflive_command.extend(['-start_paused'])
 
-            if self.selected_script and self.selected_script.path:
-                if self.selected_script.is_filter:
-                    path = normalize_path(self.selected_script.path)
-                    if IS_WIN:
-                        path = normalize_path(find_relative_path(self.cwd, self.selected_script.path))
-                    fflive_command.extend(['-vf', f'script=file={path}'])
-                else:
-                    fflive_command.extend(['-s', self.selected_script.path])
-                script_parameters = self.w.entry_script_parameters.get()
-                if script_parameters:
-                    fflive_command.extend(['-sp', script_parameters])
+            fflive_command.extend(self.generate_fflive_script_args(start_frame))
 
             if recording:
                 if os.path.exists(self.output_path):
@@ -1549,31 +1968,22 @@ Have fun!
                 self.output_path
             ]
 
-            try:
-                x, y = self.config['Main']['video_pos'].split(',')
-                x, y = int(x), int(y)
-                if x >= 0 and y >= 0:
-                    if self.fflive_window_borders[0] != 0:
-                        x += self.fflive_window_borders[0]
-                    if self.fflive_window_borders[1] != 0:
-                        y += self.fflive_window_borders[1]
-                    fflive_command.extend(['-left', str(x), '-top', str(y)])
-            except Exception:
-                pass
+            fflive_command.extend(self.fflive_window_pos_args())
 
             env_vars = self.get_env_vars()
             env_vars['AV_LOG_FORCE_NOCOLOR'] = '1'
             if enable_audio:
-                self.ffgac_a_process = Process('ffgac', ffgac_a_command,
+                self.ffgac_a_process = Process('ffgac_a', ffgac_a_command,
                                                stdout=Process.Pipe.PIPE, stderr=Process.Pipe.DEVNULL,
-                                               env=env_vars)
+                                               env=env_vars, logger=self.process_logger('ffgac_a'))
 
             if not self.selected_script or self.selected_script.path:
                 self.ffgac_process = Process('ffgac', ffgac_command, stdout=Process.Pipe.PIPE,
-                                                stderr=self.on_ffgac_console,
+                                                stderr=self.on_ffgac_stderr,
                                                 # stderr=Process.Pipe.STDOUT,
                                                 env=env_vars,
-                                                after=self.after, after_cancel=self.after_cancel)
+                                                after=self.after, after_cancel=self.after_cancel,
+                                                logger=self.process_logger('ffgac'))
             env_vars = self.get_env_vars()
             env_vars['AV_LOG_FORCE_COLOR'] = '1'
             env_vars['TERM'] = '1'
@@ -1582,23 +1992,29 @@ Have fun!
                 self.fflive_a_process = Process('fflive1', fflive_a_command, stdin=self.ffgac_a_process.process.stdout,
                                                 # stdout=Process.Pipe.STDOUT, stderr=Process.Pipe.STDOUT,
                                                 stdout=Process.Pipe.DEVNULL, stderr=Process.Pipe.DEVNULL,
-                                                env=env_vars)
+                                                env=env_vars, logger=self.process_logger('fflive1'))
                 self.last_audio_restart_time = time.time()
                 self.audio_restart_time_off = 0
                 self.update_audio_time()
                 self.audio_time = self.start_video_at
                 self.last_audio_time_check = time.time()
                 self.fflive_a_zmq.connect()
+                if self.audio_tempo_control:
+                    self.fflive_a_tempo_zmq.connect()
+                self.audio_clock.reset(self.audio_speed)
             else:
                 self.fflive_a_zmq.disconnect()
+                self.fflive_a_tempo_zmq.disconnect()
             self.update_mute_checkbutton()
 
+            self.fflive_script_is_filter = bool(self.selected_script and self.selected_script.is_filter)
             self.fflive_process = Process('fflive', fflive_command, stdin=self.ffgac_process.process.stdout if self.ffgac_process else None,
                                             stdout=self.on_console if not recording else Process.Pipe.PIPE,
                                             stderr=self.on_console,
                                             # stdout=Process.Pipe.STDOUT, stderr=Process.Pipe.STDOUT,
                                             env=env_vars,
-                                            after=self.after, after_cancel=self.after_cancel)
+                                            after=self.after, after_cancel=self.after_cancel,
+                                            logger=self.process_logger('fflive'))
                                             # stderr=subprocess.DEVNULL)
             self.fflive_zmq.connect()
 
@@ -1613,6 +2029,7 @@ Have fun!
                                                 env=env_vars,
                                                 binary_mode=False,
                                                 idle_priority=True,
+                                                logger=self.process_logger('ffgac_rec'),
                                             )
 
             # Install timer that polls for the fflive process to detect if it's still running
@@ -1633,6 +2050,144 @@ Have fun!
         finally:
             self.starting_ffplay = False
 
+    def fflive_window_size_args(self):
+        try:
+            w = int(self.last_video_size.split('x')[0])
+            h = int(self.last_video_size.split('x')[1])
+            if w > 0 and h > 0:
+                return ['-x', str(w), '-y', str(h)]
+        except Exception:
+            pass
+        return []
+
+    def fflive_window_pos_args(self):
+        try:
+            x, y = self.config['Main']['video_pos'].split(',')
+            x, y = int(x), int(y)
+            if x >= 0 and y >= 0:
+                if self.fflive_window_borders[0] != 0:
+                    x += self.fflive_window_borders[0]
+                if self.fflive_window_borders[1] != 0:
+                    y += self.fflive_window_borders[1]
+                return ['-left', str(x), '-top', str(y)]
+        except Exception:
+            pass
+        return []
+
+    def generate_fflive_script_args(self, start_frame):
+        '''fflive arguments running the selected script from `start_frame`, wraps the script when needed'''
+        self.fflive_script_path = ''
+        if not self.selected_script or not self.selected_script.path:
+            return []
+        midi_automation = merge_tables(self.midi_automation.table(start_frame) if self.midi_automation.enabled else None,
+                                       self.midi_file.table(self.input_fps, start_frame))
+        script_path = self.script_wrapper.generate(self.selected_script, start_frame=start_frame,
+                                                   telemetry_url=self.telemetry.url,
+                                                   midi_automation=midi_automation,
+                                                   param_table=self.get_param_table(),
+                                                   profile=self.profiling,
+                                                   profile_helpers=self.script_index.dependencies(self.selected_script.path)
+                                                   if self.profiling and self.config['Main'].getboolean('profile_helpers', True) else None)
+        self.fflive_script_path = script_path
+        self.profiler.reset(self.script_wrapper.profile_names)
+        if self.profiler_window and not self.profiler_window.is_destroyed():
+            self.profiler_window.set_frame_budget(self.input_fps)
+        if self.profiling and not self.script_wrapper.profile_names:
+            print_warn('Script not profiled, it needs script telemetry and a .js/.mjs script')
+        # Not wrapped, the MIDI file can only be streamed to the emulation socket
+        self.midi_file.stop_stream()
+        if script_path == self.selected_script.path and self.midi_file:
+            self.midi_file.start_stream(self.input_fps, start_frame)
+        if self.selected_script.is_filter:
+            path = normalize_path(script_path)
+            if IS_WIN:
+                path = normalize_path(find_relative_path(self.cwd, script_path))
+            args = ['-vf', f'script=file={path}']
+        else:
+            args = ['-s', script_path]
+        script_parameters = self.w.entry_script_parameters.get()
+        if script_parameters:
+            args.extend(['-sp', script_parameters])
+        return args
+
+    def can_hot_swap_script(self):
+        return bool(self.fflive_process and self.fflive_process.process and self.ffgac_process and self.fflive_base_command
+                    and self.is_playing and not self.is_recording and not self.starting_ffplay and not self.ffgac_rec_process
+                    and self.selected_script and self.selected_script.type == Script.Type.MAIN
+                    and self.fflive_script_is_filter == self.selected_script.is_filter)
+
+    def hot_swap_script(self):
+        '''Run the edited script from the current frame, keeping the audio processes running.
+        The video ffgac is respawned along with fflive: its raw mpeg4 stream has a single VOL header and,
+        with -g max, a single keyframe, so a new fflive can't join it mid-stream.'''
+        if not self.can_hot_swap_script():
+            self.start_ffplay(start_at_sec=self.current_time(), start_paused=self.is_paused)
+            return
+
+        start_at_sec = self.current_time()
+        if self.input_duration:
+            start_at_sec = min(start_at_sec, self.input_duration - 2 / self.input_fps)
+        start_at_sec = max(0, start_at_sec)
+        start_frame = self.timeToframe(start_at_sec) if self.input_fps else 0
+        print(f'Hot swap script at: {start_at_sec:.2f} sec, {start_frame} frame')
+        t = time.time()
+
+        self.starting_ffplay = True
+        try:
+            self.stop_check_timer()
+            try:
+                self.update_config() # Reopen the window where it is now
+            except Exception as e:
+                print('Error saving config:', e)
+            self.fflive_zmq.disconnect()
+            self.fflive_process.kill()
+            self.ffgac_process.kill()
+            # Audio would run ahead while fflive starts, sync_audio_and_video resumes it
+            if self.fflive_a_zmq.connected and not self.is_paused_audio and self.fflive_a_zmq.req_msg('pause'):
+                self.is_paused_audio = True
+
+            self.console_clear()
+            self.start_video_at = start_at_sec
+            self.current_frame = start_frame
+            self.last_current_frame = start_frame
+            self.current_frame_ffgac = 0
+            self.played_frames = 0
+            self.telemetry.reset()
+            self.telemetry_start_t = time.time()
+            self.last_telemetry_seq = None
+            self.midi_sender.reset()
+            if self.mv_producer and self.input_video_size:
+                self.mv_producer.set_video(*self.input_video_size, self.input_fps, start_frame=start_frame)
+            self.fps = -1
+            self.first_fps_calc_t = None
+
+            ffgac_command = self.ffgac_process.command
+            ffgac_command[ffgac_command.index('-ss') + 1] = str(start_at_sec)
+            fflive_command = list(self.fflive_base_command)
+            fflive_command[fflive_command.index('-frame_counter_off') + 1] = str(start_frame)
+            fflive_command.extend(self.fflive_window_size_args())
+            if self.is_paused:
+                fflive_command.append('-start_paused')
+            fflive_command.extend(self.generate_fflive_script_args(start_frame))
+            fflive_command.extend(self.fflive_window_pos_args())
+            self.fflive_process.command = fflive_command
+
+            self.ffgac_process.start()
+            self.fflive_process.start(stdin=self.ffgac_process.process.stdout)
+            self.fflive_zmq.connect()
+            print(f'Hot swap took {(time.time() - t) * 1000:.0f} ms')
+
+            self.check_ffplay_process_timer = self.after(500, self.check_ffplay_process, self.fflive_window_title)
+        except Exception as e:
+            print('hot_swap_script error:', e)
+            traceback.print_exc()
+            self.is_playing = False
+            self.is_paused = False
+            self.kill_ffplay_processes()
+            self.update_play_text()
+        finally:
+            self.starting_ffplay = False
+
     # def stream_output_to_fflive(self, output_file, window_title):
     #     # Read the the pipe self.r_fd and write it to self.w_fd2
     #     if self.r_fd and self.w_fd2:
@@ -1670,6 +2225,86 @@ Have fun!
 
         return ret
 
+    def on_capture_mvs(self):
+        if not self.video_path:
+            show_info('Please select a video file')
+            return
+        file_path = filedialog.asksaveasfilename(defaultextension='.mvcap', filetypes=[('Motion vector captures', '*.mvcap')])
+        file_path = fix_windows_network_path(file_path)
+        if file_path:
+            self.start_mv_capture(file_path)
+
+    def start_mv_capture(self, path):
+        # fflive has no real headless mode (-nodisp disables video decoding), so run it with its output discarded,
+        # at max speed and a tiny window
+        self.mv_capture = MvCaptureWriter(self.zmq_io, path)
+        if not self.mv_capture.start():
+            print_error('Error starting motion vector capture')
+            self.mv_capture = None
+            return
+        script_path = self.mv_capture.generate_script()
+        ffgac_command = [
+            self.get_bin('ffgac'),
+            '-nostats',
+            '-hide_banner',
+            '-i', self.video_path,
+            '-an',
+            '-mpv_flags', '+nopimb+forcemv', '-qscale:v', '0', '-g', 'max', '-sc_threshold', 'max', '-vcodec', 'mpeg4',
+            '-f', 'rawvideo',
+            '-'
+        ]
+        fflive_command = [
+            self.get_bin('fflive'),
+            '-i', '-',
+            '-vf', 'setpts=0*PTS',
+            '-an',
+            '-nostats',
+            '-hide_banner',
+            '-window_title', f'{NAME} motion vector capture',
+            '-x', '160', '-y', '90',
+            '-s', script_path,
+            '-o', '-', '-autoexit',
+        ]
+        print('Capturing motion vectors to:', path)
+        try:
+            env_vars = self.get_env_vars()
+            ffgac = Process('ffgac_mv', ffgac_command, stdout=Process.Pipe.PIPE, stderr=Process.Pipe.DEVNULL, env=env_vars,
+                            logger=self.process_logger('ffgac_mv'))
+            fflive = Process('fflive_mv', fflive_command, stdin=ffgac.process.stdout,
+                             stdout=Process.Pipe.DEVNULL, stderr=Process.Pipe.DEVNULL, env=env_vars, idle_priority=True,
+                             logger=self.process_logger('fflive_mv'), log_stdout=False) # stdout is the encoded video
+            self.mv_capture_processes = [ffgac, fflive]
+        except Exception as e:
+            print_error('Error starting motion vector capture:', e)
+            self.stop_mv_capture()
+            return
+        self.mv_capture_frames = 0
+        self.after(500, self.check_mv_capture)
+
+    def check_mv_capture(self):
+        if not self.mv_capture:
+            return
+        frames = self.mv_capture.frames
+        if any(p.process and p.process.poll() is None for p in self.mv_capture_processes) or frames != self.mv_capture_frames:
+            # Keep draining until the socket goes quiet, fflive may exit before its last messages are read
+            self.mv_capture_frames = frames
+            self.after(500, self.check_mv_capture)
+            return
+        path = self.mv_capture.path
+        self.stop_mv_capture()
+        try:
+            print(f'Motion vectors captured: {len(MvCaptureFile(path))} frames in {path}')
+        except (OSError, ValueError) as e:
+            print_error('Error reading motion vector capture:', e)
+
+    def stop_mv_capture(self):
+        for process in self.mv_capture_processes:
+            process.kill()
+        self.mv_capture_processes = []
+        if self.mv_capture:
+            self.mv_capture.close()
+            self.mv_capture = None
+
     def get_env_vars(self):
         exe_dir = os.path.dirname(self.get_bin('fflive'))
         env = os.environ.copy()
@@ -1681,7 +2316,7 @@ Have fun!
     def test_window_borders_size(self):
         window_title = f'{NAME} Test window'
         start_pos = 200, 200
-        fflive_zmq = ZmqReqPush(ctx=self.zmq_context, name='fflive_test')
+        fflive_zmq = ZmqReqPush(self.zmq_io, name='fflive_test')
         fflive_zmq.generate_urls()
         fflive_command = [
             self.get_bin('fflive'),
@@ -1694,7 +2329,8 @@ Have fun!
         ]
 
         env_vars = self.get_env_vars()
-        fflive_process = Process('fflive', fflive_command, stdout=Process.Pipe.DEVNULL, stderr=Process.Pipe.DEVNULL, env=env_vars)
+        fflive_process = Process('fflive_test', fflive_command, stdout=Process.Pipe.DEVNULL, stderr=Process.Pipe.DEVNULL, env=env_vars,
+                                 logger=self.process_logger('fflive_test'))
         if IS_MAC:
             time.sleep(1)
         fflive_zmq.connect()
@@ -1728,6 +2364,7 @@ Have fun!
             print('Window test timeout')
 
         fflive_process.kill()
+        fflive_zmq.close()
 
     # def embed_ffplay_window(self):
     #     if os.name == 'nt':  # Windows
@@ -1760,6 +2397,7 @@ Have fun!
                 self.fflive_a_process.kill()
                 self.fflive_a_process = None
             self.fflive_a_zmq.disconnect()
+            self.fflive_a_tempo_zmq.disconnect()
 
             if self.ffgac_a_process:
                 self.ffgac_a_process.kill()
@@ -1923,28 +2561,13 @@ Have fun!
             self.project_changed()
         return file_path
 
-    def on_script_save(self, _file_path):
+    def on_script_save(self, file_path):
         self.w.label_saving.configure(text='Saving...')
         self.after(1000, lambda: self.w.label_saving.configure(text=''))
+        if file_path and self.is_playing:
+            self.restart_on_dependency_change([file_path])
 
     def on_edit_share_script(self):
-        def find_imports(file_path):
-            ret = []
-            with open(file_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-            for line in lines:
-                js_lib_re = r'from\s+["\'](.+?)["\']|import\s+["\'](.+?)["\']'
-                js_path = re.search(js_lib_re, line)
-                if js_path:
-                    js_path = js_path.group(1) or js_path.group(2)
-                    if js_path:
-                        js_path = os.path.join(os.path.dirname(file_path), js_path)
-                        if not js_path.endswith('.js') and not js_path.endswith('.mjs'):
-                            js_path += '.js'
-                        if os.path.exists(js_path):
-                            ret.append(js_path)
-            return ret
-
         edited_scripts_dir = self.resolve_relative_path(EDITED_SCRIPTS_DIR)
         if self.selected_script and self.selected_script.buildin:
             # Copy the buildin script to the edited scripts directory
@@ -1956,14 +2579,11 @@ Have fun!
                 path = to_edited_path(self.selected_script.path)
                 path = find_next_output_file(path)
                 if copy_file(self.selected_script.path, path, replace=False):
-                    def find_recursive_js_imports_and_copy_them_too(file_path):
-                        for js_path in find_imports(file_path):
-                            dst_path = to_edited_path(js_path)
-                            if copy_file(js_path, dst_path, replace=False):
-                                print('Copied library to:', dst_path)
-                                find_recursive_js_imports_and_copy_them_too(js_path)
                     print('Copied script:', path)
-                    find_recursive_js_imports_and_copy_them_too(self.selected_script.path)
+                    for js_path in self.script_index.dependencies(self.selected_script.path):
+                        dst_path = to_edited_path(js_path)
+                        if copy_file(js_path, dst_path, replace=False):
+                            print('Copied library to:', dst_path)
                     self.editor.close_file()
                     self.update_scripts_list()
                     self.select_script(path)
@@ -1980,13 +2600,10 @@ Have fun!
                 zip_path = find_next_output_file(zip_path)
                 if zip_path:
                     with zipfile.ZipFile(zip_path, 'w') as z:
-                        def find_recursive_js_imports_and_add_them_too(file_path):
-                            for js_path in find_imports(file_path):
-                                z.write(js_path, os.path.relpath(js_path, edited_scripts_dir))
-                                print('Added library to zip:', js_path)
-                                find_recursive_js_imports_and_add_them_too(js_path)
                         z.write(self.selected_script.path, os.path.relpath(self.selected_script.path, edited_scripts_dir))
-                        find_recursive_js_imports_and_add_them_too(self.selected_script.path)
+                        for js_path in self.script_index.dependencies(self.selected_script.path):
+                            z.write(js_path, os.path.relpath(js_path, edited_scripts_dir))
+                            print('Added library to zip:', js_path)
                     print('Saved script as zip:', zip_path)
                     zip_name = os.path.basename(zip_path)
                     if messagebox.askokcancel('Share', f'Press OK to show bundled {zip_name} file and to open www browser.'):
@@ -2069,6 +2686,17 @@ Have fun!
             print('Error deleting script:', e)
             traceback.print_exc()
 
+    def on_show_script_dependents(self):
+        if not self.selected_script:
+            return
+        dependents = self.script_index.dependents(self.selected_script.path)
+        name = os.path.basename(self.selected_script.path)
+        if dependents:
+            names = '\n'.join(self.find_relative_path(path) for path in dependents)
+            messagebox.showinfo('Used by', f'{name} is imported by:\n\n{names}')
+        else:
+            messagebox.showinfo('Used by', f'No script imports {name}')
+
     def on_listbox_scripts_rmb(self, event):
         self.w.listbox_scripts.select_clear(0, tk.END)
         self.w.listbox_scripts.selection_set(self.w.listbox_scripts.nearest(event.y))
@@ -2084,8 +2712,16 @@ Have fun!
             state = tk.NORMAL if buildin else tk.DISABLED
             if buildin:
                 self.listbox_scripts_menu.add_command(label='Edit', command=self.on_edit_share_script, state=state)
+            if self.selected_script.type == Script.Type.HELPER:
+                self.listbox_scripts_menu.add_command(label='Used by...', command=self.on_show_script_dependents)
+            self.listbox_scripts_menu.add_command(label='Parameter curves...', command=self.on_edit_param_curves,
+                                                  state=tk.NORMAL if self.script_wrapper.can_wrap(self.selected_script) else tk.DISABLED)
+            self.listbox_scripts_menu.add_command(label='Profile...', command=self.on_profile_script,
+                                                  state=tk.NORMAL if self.script_wrapper.can_wrap(self.selected_script) else tk.DISABLED)
             self.listbox_scripts_menu.add_separator()
             self.listbox_scripts_menu.add_command(label='Reload list', command=self.update_scripts_list)
+            self.listbox_scripts_menu.add_command(label='Capture motion vectors...', command=self.on_capture_mvs,
+                                                  state=tk.DISABLED if self.mv_capture else tk.NORMAL)
             self.listbox_scripts_menu.post(event.x_root, event.y_root)
             self.listbox_scripts_menu.bind("<Leave>", lambda e: self.listbox_scripts_menu.unpost())
 
@@ -2104,6 +2740,12 @@ def show_info(message):
 def show_warning(message):
     messagebox.showwarning('Warning', message)
 
+def get_mtime_ns(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
 
 if __name__ == '__main__':
     app = LiveMosherApp()
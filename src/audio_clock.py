@@ -0,0 +1,84 @@
+import time
+from typing import Optional, TextIO
+
+from lib.colored_print import print_error
+
+# Loop gains, the error is audio time - video time in seconds
+KP = 0.2 # Tempo correction per second of error
+KI = 0.02 # Tempo correction per second of accumulated error (seconds * seconds)
+MAX_CORRECTION = 0.08 # Max tempo change around the video speed, larger errors are left to seek/pause
+SPEED_SMOOTHING = 0.2 # Low pass of the measured video speed, weight of the new value per update
+TEMPO_STEP = 0.002 # Smaller tempo changes aren't sent
+MIN_TEMPO_INTERVAL = 0.25 # Seconds between two tempo commands
+MIN_TEMPO = 0.5 # atempo range
+MAX_TEMPO = 100.0
+
+class AudioClock:
+    '''Phase locked loop keeping the audio process on the video clock. The video speed is the frequency
+    reference, the PI term on the time error nudges the audio tempo around it, so small drift is removed
+    by playing a few percent faster or slower instead of restarting the audio.
+    Every update can be appended to a CSV file to tune the gains.'''
+
+    def __init__(self, kp=KP, ki=KI, max_correction=MAX_CORRECTION, log_path: str = None):
+        self.kp = kp
+        self.ki = ki
+        self.max_correction = max_correction
+        self.log_path = log_path
+        self.log_file: TextIO = None
+        self.speed = 0.0 # Filtered video speed
+        self.integral = 0.0
+        self.tempo = 0.0 # Last tempo sent
+        self.last_t = None
+        self.last_tempo_t = 0.0
+
+    def reset(self, tempo: float):
+        '''Audio (re)started at the video time with `tempo`'''
+        self.speed = tempo
+        self.tempo = tempo
+        self.integral = 0.0
+        self.last_t = None
+        self.last_tempo_t = time.time()
+
+    def update(self, t: float, error: float, video_speed: float) -> Optional[float]:
+        '''New tempo for the audio, None when the change is too small to send'''
+        dt = t - self.last_t if self.last_t is not None else 0.0
+        self.last_t = t
+        self.speed += (video_speed - self.speed) * SPEED_SMOOTHING
+
+        correction = -(self.kp * error + self.ki * (self.integral + error * dt))
+        if abs(correction) < self.max_correction:
+            self.integral += error * dt # No windup while saturated
+        correction = max(-self.max_correction, min(self.max_correction, correction))
+        tempo = max(MIN_TEMPO, min(MAX_TEMPO, self.speed * (1 + correction)))
+
+        if abs(tempo - self.tempo) < TEMPO_STEP or t - self.last_tempo_t < MIN_TEMPO_INTERVAL:
+            return None
+        return tempo
+
+    def tempo_sent(self, t: float, tempo: float):
+        self.tempo = tempo
+        self.last_tempo_t = t
+
+    def hold(self):
+        '''Audio paused, the error isn't caused by the tempo'''
+        self.integral = 0.0
+        self.last_t = None
+
+    def log(self, t: float, video_time: float, audio_time: float, video_speed: float, event=''):
+        if not self.log_path:
+            return
+        try:
+            if not self.log_file:
+                self.log_file = open(self.log_path, 'a', encoding='utf-8')
+                if self.log_file.tell() == 0:
+                    self.log_file.write('time,video_time,audio_time,error,video_speed,tempo,integral,event\n')
+            self.log_file.write(f'{t:.3f},{video_time:.3f},{audio_time:.3f},{audio_time - video_time:.4f},'
+                                f'{video_speed:.4f},{self.tempo:.4f},{self.integral:.4f},{event}\n')
+        except OSError as e:
+            print_error(f'Error writing the audio clock log {self.log_path}: {e}')
+            self.log_path = None
+
+    def close(self):
+        if self.log_file:
+            self.log_file.close()
+            self.log_file = None
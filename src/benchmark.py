@@ -0,0 +1,280 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+from lib.colored_print import print_error, print_warn
+from lib.misc import IS_MAC, IS_WIN, normalize_path
+from script_index import is_script_file, parse_script
+
+# Renders every MAIN script of Examples headless and records its speed, so it's known which moshers can run live
+# and a new ffglitch build can be compared against the stored baseline:
+#   python benchmark.py                       run, compare against benchmark_baseline.json
+#   python benchmark.py --save-baseline       run and store the results as the new baseline
+#   python benchmark.py --scripts mv_ dd_     only scripts whose path contains one of the words
+
+RESULTS_VERSION = 1
+APP_DIR = normalize_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+EXAMPLES_DIR = os.path.join(APP_DIR, 'Examples')
+TUTORIAL_CLIP = os.path.join(EXAMPLES_DIR, 'tutorial', 'CEP00109_mpeg4.avi')
+SYNTHETIC_CLIP = 'synthetic_1080p.avi'
+MPEG4_ARGS = ['-mpv_flags', '+nopimb+forcemv', '-qscale:v', '0', '-g', 'max', '-sc_threshold', 'max', '-vcodec', 'mpeg4']
+
+
+class BenchScript(NamedTuple):
+    path: str
+    is_filter: bool
+
+
+class BenchResult(NamedTuple):
+    script: str # Relative to Examples
+    clip: str
+    frames: int
+    wall_s: float
+    fps: float
+    cpu_s: Optional[float] # ffgac + fflive, user + system
+    peak_rss_mb: Optional[float] # fflive
+    returncode: Optional[int]
+    error: str = ''
+
+
+def default_bin_dir():
+    return os.path.join(APP_DIR, 'bin', 'ffglitch', 'win' if IS_WIN else 'mac' if IS_MAC else 'linux')
+
+
+def find_scripts(root=EXAMPLES_DIR) -> List[BenchScript]:
+    '''MAIN scripts found the same way the script list does, helpers are skipped'''
+    scripts = []
+    for dir_path, dirs, files in os.walk(root):
+        dirs.sort()
+        for name in sorted(files):
+            if not is_script_file(name) or name.endswith('.py'):
+                continue
+            path = normalize_path(os.path.join(dir_path, name))
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    info = parse_script(f.read())
+            except (OSError, UnicodeDecodeError) as e:
+                print_warn(f'Skipping {path}: {e}')
+                continue
+            if info.is_main:
+                scripts.append(BenchScript(path, info.is_filter))
+    return scripts
+
+
+class Runner:
+    def __init__(self, bin_dir, timeout=120.0, max_frames=0):
+        self.bin_dir = bin_dir
+        self.timeout = timeout
+        self.max_frames = max_frames
+        self.env = os.environ.copy()
+        for var in ('LD_LIBRARY_PATH', 'DYLD_LIBRARY_PATH'):
+            self.env[var] = bin_dir + (os.pathsep + self.env[var] if var in self.env else '')
+
+    def bin(self, name):
+        return normalize_path(os.path.join(self.bin_dir, name + ('.exe' if IS_WIN else '')))
+
+    def make_synthetic_clip(self, path, seconds=10):
+        if os.path.exists(path):
+            return path
+        print(f'Generating {path}')
+        command = [self.bin('ffgac'), '-hide_banner', '-nostats', '-y', '-f', 'lavfi',
+                   '-i', f'testsrc2=size=1920x1080:rate=30:duration={seconds}', *MPEG4_ARGS, path]
+        ret = subprocess.run(command, env=self.env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=False)
+        if ret.returncode != 0:
+            print_error(f'Error generating the synthetic clip: {ret.stderr.decode(errors="replace")[-500:]}')
+            return None
+        return path
+
+    def run(self, script: BenchScript, clip) -> BenchResult:
+        ffgac_command = [
+            self.bin('ffgac'), '-nostats', '-hide_banner', '-i', clip, '-an',
+            *(['-frames:v', str(self.max_frames)] if self.max_frames else []),
+            *MPEG4_ARGS, '-f', 'rawvideo', '-',
+        ]
+        # No real headless mode in fflive (-nodisp disables video decoding), max speed into a tiny window instead
+        vf = 'setpts=0*PTS' + (f',script=file={script.path}' if script.is_filter else '')
+        fflive_command = [
+            self.bin('fflive'), '-i', '-', '-vf', vf, '-an', '-nostats', '-hide_banner',
+            '-window_title', f'benchmark {os.path.basename(script.path)}', '-x', '160', '-y', '90',
+            '-print_frameno', '-noframedropearly',
+            *([] if script.is_filter else ['-s', script.path]),
+            '-o', '-', '-autoexit',
+        ]
+        name = os.path.relpath(script.path, EXAMPLES_DIR).replace('\\', '/')
+        frames = [0]
+        def read_frames(pipe):
+            for line in pipe:
+                if b'FRAME_NO:' in line:
+                    try:
+                        frames[0] = max(frames[0], int(line.split(b'FRAME_NO:')[1].split()[0]) + 1)
+                    except (ValueError, IndexError):
+                        pass
+
+        start_t = time.time()
+        try:
+            ffgac = subprocess.Popen(ffgac_command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, env=self.env)
+            fflive = subprocess.Popen(fflive_command, stdin=ffgac.stdout, stdout=subprocess.DEVNULL,
+                                      stderr=subprocess.PIPE, env=self.env)
+            ffgac.stdout.close() # fflive owns the pipe now, ffgac gets SIGPIPE if fflive dies
+        except OSError as e:
+            return BenchResult(name, os.path.basename(clip), 0, 0.0, 0.0, None, None, None, str(e))
+        reader = threading.Thread(target=read_frames, args=(fflive.stderr,), daemon=True)
+        reader.start()
+
+        error = ''
+        timed_out = threading.Event()
+        def kill():
+            timed_out.set()
+            fflive.kill()
+            ffgac.kill()
+        timer = threading.Timer(self.timeout, kill)
+        timer.start()
+        fflive_usage, returncode = wait_with_usage(fflive)
+        wall_s = time.time() - start_t
+        ffgac_usage, _ = wait_with_usage(ffgac)
+        timer.cancel()
+        reader.join(1.0)
+        if timed_out.is_set():
+            error = f'timeout after {self.timeout:.0f}s'
+        elif returncode != 0:
+            error = f'fflive exited with {returncode}'
+
+        cpu_s = None
+        peak_rss_mb = None
+        if fflive_usage and ffgac_usage:
+            cpu_s = sum(u.ru_utime + u.ru_stime for u in (fflive_usage, ffgac_usage))
+            # ru_maxrss is in bytes on macOS, kilobytes elsewhere
+            peak_rss_mb = fflive_usage.ru_maxrss / (1024 * 1024 if IS_MAC else 1024)
+        return BenchResult(name, os.path.basename(clip), frames[0], wall_s, frames[0] / wall_s if wall_s > 0 else 0.0,
+                           cpu_s, peak_rss_mb, returncode, error)
+
+
+def wait_with_usage(process: subprocess.Popen):
+    '''Wait for the process and return its resource usage, None for the usage where wait4() isn't available'''
+    if not hasattr(os, 'wait4'):
+        return None, process.wait()
+    try:
+        _pid, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        return usage, process.returncode
+    except ChildProcessError:
+        return None, process.wait()
+
+
+def load_results(path) -> Dict:
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if data.get('version') != RESULTS_VERSION:
+        raise ValueError(f'Unsupported results version in {path}')
+    return data
+
+
+def save_results(path, results: List[BenchResult], bin_dir):
+    data = {
+        'version': RESULTS_VERSION,
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'platform': platform.platform(),
+        'python': sys.version.split()[0],
+        'bin_dir': bin_dir,
+        'results': [r._asdict() for r in results],
+    }
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def compare(results: List[BenchResult], baseline: Dict, threshold) -> List[str]:
+    '''Lines describing scripts that got slower than the baseline by more than `threshold` or started failing'''
+    base = {(r['script'], r['clip']): r for r in baseline.get('results', [])}
+    regressions = []
+    for r in results:
+        b = base.get((r.script, r.clip))
+        if not b:
+            continue
+        if r.error and not b.get('error'):
+            regressions.append(f'{r.script} [{r.clip}]: {r.error}, baseline {b["fps"]:.1f} fps')
+        elif not r.error and b['fps'] > 0 and r.fps < b['fps'] * (1 - threshold):
+            regressions.append(f'{r.script} [{r.clip}]: {r.fps:.1f} fps, baseline {b["fps"]:.1f} fps '
+                               f'({(r.fps / b["fps"] - 1) * 100:+.0f}%)')
+    return regressions
+
+
+def print_table(results: List[BenchResult], live_fps):
+    print(f'{"script":<64} {"clip":<22} {"frames":>7} {"fps":>8} {"wall s":>8} {"cpu s":>8} {"rss MB":>8}')
+    for r in results:
+        live = '' if r.error else ' live' if r.fps >= live_fps else ''
+        cpu = f'{r.cpu_s:8.2f}' if r.cpu_s is not None else f'{"-":>8}'
+        rss = f'{r.peak_rss_mb:8.1f}' if r.peak_rss_mb is not None else f'{"-":>8}'
+        print(f'{r.script:<64} {r.clip:<22} {r.frames:>7} {r.fps:8.1f} {r.wall_s:8.2f} {cpu} {rss}{live}'
+              + (f'  {r.error}' if r.error else ''))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Examples scripts headless')
+    parser.add_argument('--scripts', nargs='*', default=[], help='Only scripts whose path contains one of these')
+    parser.add_argument('--clip', action='append', help=f'Clips to render, default: the tutorial clip and a synthetic 1080p clip')
+    parser.add_argument('--no-synthetic', action='store_true', help='Skip the synthetic 1080p clip')
+    parser.add_argument('--bin-dir', default=default_bin_dir(), help='Directory with ffgac and fflive')
+    parser.add_argument('--work-dir', default=os.path.join(APP_DIR, 'benchmark'), help='Generated clips and results')
+    parser.add_argument('--out', default='', help='Results JSON, default: <work-dir>/results.json')
+    parser.add_argument('--baseline', default='', help='Baseline JSON, default: <work-dir>/benchmark_baseline.json')
+    parser.add_argument('--save-baseline', action='store_true', help='Store the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Flag scripts slower than the baseline by this ratio')
+    parser.add_argument('--frames', type=int, default=0, help='Render at most this many frames per clip')
+    parser.add_argument('--timeout', type=float, default=120.0, help='Seconds per script and clip')
+    parser.add_argument('--live-fps', type=float, default=30.0, help='Mark scripts at least this fast as live capable')
+    args = parser.parse_args()
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    out_path = args.out or os.path.join(args.work_dir, 'results.json')
+    baseline_path = args.baseline or os.path.join(args.work_dir, 'benchmark_baseline.json')
+    runner = Runner(args.bin_dir, timeout=args.timeout, max_frames=args.frames)
+
+    clips = args.clip or [TUTORIAL_CLIP]
+    if not args.clip and not args.no_synthetic:
+        synthetic = runner.make_synthetic_clip(os.path.join(args.work_dir, SYNTHETIC_CLIP))
+        if synthetic:
+            clips.append(synthetic)
+
+    scripts = [s for s in find_scripts() if not args.scripts or any(word in s.path for word in args.scripts)]
+    print(f'{len(scripts)} scripts, {len(clips)} clips, binaries: {args.bin_dir}')
+
+    results = []
+    for script in scripts:
+        for clip in clips:
+            result = runner.run(script, clip)
+            results.append(result)
+            print(f'{result.script} [{result.clip}]: ' + (result.error or f'{result.fps:.1f} fps'))
+
+    print_table(results, args.live_fps)
+    save_results(out_path, results, args.bin_dir)
+    print('Results saved to:', out_path)
+
+    if args.save_baseline:
+        save_results(baseline_path, results, args.bin_dir)
+        print('Baseline saved to:', baseline_path)
+        return 0
+    if not os.path.exists(baseline_path):
+        print_warn(f'No baseline at {baseline_path}, store one with --save-baseline')
+        return 0
+    try:
+        regressions = compare(results, load_results(baseline_path), args.threshold)
+    except (OSError, ValueError) as e:
+        print_error('Error loading baseline:', e)
+        return 2
+    for line in regressions:
+        print_error('Regression:', line)
+    if not regressions:
+        print('No regressions against', baseline_path)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
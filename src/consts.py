@@ -5,3 +5,4 @@ PROJECT_EXT = '.lmp'
 VERSION_FILE = 'version.txt'
 REPO_URL = 'https://github.com/pawelzwronek/LiveMosher'
 FFGLITCH_URL = 'https://ffglitch.org'
+BIN_DIR_ENV = 'LIVEMOSHER_BIN_DIR' # ffgac/fflive dir overriding the configured one, e.g. the ff_simulator.py binaries
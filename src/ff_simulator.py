@@ -0,0 +1,322 @@
+import os
+import struct
+import sys
+import threading
+import time
+from typing import Dict, List
+
+import zmq
+
+# Stand-ins for ffgac and fflive, to drive the frontend (start_ffplay, check_ffplay_process, sync_audio_and_video,
+# on_console) without the real binaries or a real video. They print the lines the app parses and answer the fflive
+# ZMQ control commands. Launched through bin/sim/ffgac and bin/sim/fflive:
+#   LIVEMOSHER_BIN_DIR=bin/sim python src/LiveMosherApp.py
+#
+# Behavior is set with environment variables, the app passes its environment to the processes:
+#   FFSIM_FPS=25              frame rate of the simulated video
+#   FFSIM_DURATION=20         duration in seconds
+#   FFSIM_SIZE=1280x720       video size
+#   FFSIM_STATS_HZ=2          ffgac 'frame=' and fflive 'fd=' stats lines per second
+#   FFSIM_LOG_RATE=0          extra '[quickjs]' script log lines per second from fflive
+#   FFSIM_STARTUP_MS=0        delay before fflive shows the first frame
+#   FFSIM_STALL=120:2.5       stall fflive at a frame for some seconds, comma separated list
+#   FFSIM_CRASH_AT=300        crash fflive at a frame, exit code 139 like a segfault
+#   FFSIM_MAX_SPEED=0         1: decode as fast as the pipe allows, like setpts=0*PTS
+
+PACKET_MAGIC = b'FSIM'
+PACKET_HEADER = '<4si'
+PACKET_SIZE = 4096 # A frame in the simulated raw stream, header + padding
+CRASH_EXIT_CODE = 139
+SIM_FILTERS = [('atempo', 'A->A', 'Adjust audio tempo.'), ('setpts', 'V->V', 'Set PTS for the output video frame.'),
+               ('drawbox', 'V->V', 'Draw a colored box on the input video.'), ('script', 'V->V', 'Run a script on the video.')]
+
+
+def env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+class SimConfig:
+    def __init__(self):
+        self.fps = env_float('FFSIM_FPS', 25)
+        self.duration = env_float('FFSIM_DURATION', 20)
+        self.size = os.environ.get('FFSIM_SIZE', '1280x720')
+        self.stats_hz = env_float('FFSIM_STATS_HZ', 2)
+        self.log_rate = env_float('FFSIM_LOG_RATE', 0)
+        self.startup_ms = env_float('FFSIM_STARTUP_MS', 0)
+        self.crash_at = int(env_float('FFSIM_CRASH_AT', -1))
+        self.max_speed = env_float('FFSIM_MAX_SPEED', 0) > 0
+        self.stalls: Dict[int, float] = {}
+        for item in filter(None, os.environ.get('FFSIM_STALL', '').split(',')):
+            try:
+                frame, seconds = item.split(':')
+                self.stalls[int(frame)] = float(seconds)
+            except ValueError:
+                print(f'ffsim: bad FFSIM_STALL item "{item}"', file=sys.stderr)
+
+    @property
+    def frames(self):
+        return int(self.duration * self.fps)
+
+
+def parse_args(argv: List[str]) -> Dict[str, str]:
+    '''ffmpeg style options, flags map to '' and the last positional argument is the output'''
+    flags = {'-accurate_seek', '-stats', '-nostats', '-hide_banner', '-an', '-vn', '-nodisp', '-start_paused', '-print_frameno',
+             '-blockffplaykeys', '-noframedropearly', '-autoexit', '-shortest', '-y', '-filters'}
+    opts = {}
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg in flags:
+            opts[arg] = ''
+            i += 1
+        elif arg.startswith('-') and arg != '-' and i + 1 < len(argv):
+            # Repeated -i keeps the first input, the only one the simulators read
+            if arg not in opts or arg != '-i':
+                opts[arg] = argv[i + 1]
+            i += 2
+        else:
+            opts['output'] = arg
+            i += 1
+    return opts
+
+
+def format_time(seconds):
+    return f'{int(seconds // 3600):02d}:{int(seconds // 60 % 60):02d}:{seconds % 60:05.2f}'
+
+
+def log(line):
+    sys.stderr.write(line + '\n')
+    sys.stderr.flush()
+
+
+def print_input_info(cfg: SimConfig, name):
+    log(f"Input #0, avi, from '{name}':")
+    log(f'  Duration: {format_time(cfg.duration)}, start: 0.000000, bitrate: 4000 kb/s')
+    log(f'  Stream #0:0: Video: mpeg4 (Simple Profile) (FMP4 / 0x34504D46), yuv420p, {cfg.size} [SAR 1:1 DAR 16:9], '
+        f'4000 kb/s, {cfg.fps:g} fps, {cfg.fps:g} tbr, {cfg.fps:g} tbn')
+
+
+def read_packet(stream):
+    data = stream.read(PACKET_SIZE)
+    if len(data) < PACKET_SIZE:
+        return None
+    return data
+
+
+def make_packet(frame):
+    return struct.pack(PACKET_HEADER, PACKET_MAGIC, frame).ljust(PACKET_SIZE, b'\0')
+
+
+def ffgac(argv: List[str]):
+    cfg = SimConfig()
+    opts = parse_args(argv)
+    stats = '-nostats' not in opts
+    source = opts.get('-i', '')
+
+    if source == '-':
+        # Recording muxer: stdin until EOF into the output file
+        output = opts.get('output')
+        written = 0
+        with open(output, 'wb') if output and output != '-' else open(os.devnull, 'wb') as f:
+            while True:
+                data = sys.stdin.buffer.read(65536)
+                if not data:
+                    break
+                f.write(data)
+                written += len(data)
+        log(f'ffsim ffgac: muxed {written} bytes')
+        return 0
+
+    print_input_info(cfg, source)
+    start_frame = round(float(opts.get('-ss', 0)) * cfg.fps)
+    end_frame = min(cfg.frames, round(float(opts['-to']) * cfg.fps) if '-to' in opts else cfg.frames)
+    out = sys.stdout.buffer
+    start_t = time.time()
+    next_stats_t = start_t
+    try:
+        for frame in range(start_frame, end_frame):
+            out.write(make_packet(frame)) # Blocks on a full pipe, like the real encoder
+            t = time.time()
+            if stats and cfg.stats_hz > 0 and t >= next_stats_t:
+                next_stats_t = t + 1 / cfg.stats_hz
+                done = frame - start_frame + 1
+                speed = (done / cfg.fps) / max(t - start_t, 1e-6)
+                sys.stderr.write(f'frame={done:5d} fps={done / max(t - start_t, 1e-6):3.0f} q=0.0 size={done * 4:8d}KiB '
+                                 f'time={format_time(done / cfg.fps)} bitrate=4000.0kbits/s speed={speed:.3g}x\r')
+                sys.stderr.flush()
+        out.flush()
+    except (BrokenPipeError, OSError):
+        return 0
+    return 0
+
+
+class FfliveState:
+    def __init__(self, paused):
+        self.paused = paused
+        self.steps = 0
+        self.volume = 100
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+
+
+def zmq_server(url, state: FfliveState, window_pos_size):
+    ctx = zmq.Context.instance()
+    rep = ctx.socket(zmq.REP)
+    rep.bind(url)
+    while True:
+        cmd = rep.recv().decode('utf-8', 'ignore')
+        with state.lock:
+            if cmd == 'pause':
+                state.paused = True
+                reply = '0:paused'
+            elif cmd == 'play':
+                state.paused = False
+                reply = '0:playing'
+            elif cmd == 'step':
+                state.paused = True
+                state.steps += 1
+                reply = '0:step'
+            elif cmd.startswith('volume'):
+                if ':' in cmd:
+                    state.volume = int(float(cmd.split(':', 1)[1]))
+                reply = f'0:{state.volume}'
+            elif cmd == 'window_pos_size':
+                reply = '0:' + ','.join(str(v) for v in window_pos_size)
+            elif cmd == 'window_maximized':
+                reply = '0:0'
+            else:
+                reply = f'1:unknown command {cmd}'
+        state.wake.set()
+        rep.send_string(reply)
+
+
+def fflive(argv: List[str]):
+    cfg = SimConfig()
+    opts = parse_args(argv)
+    if '-filters' in opts:
+        # No azmq, the app changes the audio speed by restarting the audio
+        for name, io, desc in SIM_FILTERS:
+            print(f' ... {name:<17} {io:<10} {desc}')
+        return 0
+    state = FfliveState('-start_paused' in opts)
+    print_frameno = '-print_frameno' in opts
+    output_video = opts.get('-o') == '-'
+    nodisp = '-nodisp' in opts
+    frame_counter = int(opts.get('-frame_counter_off', 0))
+    speed_ratio = 1.0
+    vf = opts.get('-vf', '')
+    if vf.startswith('setpts='):
+        try:
+            speed_ratio = float(vf.split('setpts=')[1].split('*PTS')[0].strip('()'))
+        except ValueError:
+            pass
+    max_speed = cfg.max_speed or speed_ratio == 0
+
+    window_pos_size = (int(opts.get('-left', 100)), int(opts.get('-top', 100)),
+                       int(opts.get('-x', cfg.size.split('x')[0])), int(opts.get('-y', cfg.size.split('x')[1])))
+    if '-zmq_url' in opts:
+        threading.Thread(target=zmq_server, args=(opts['-zmq_url'], state, window_pos_size), daemon=True).start()
+
+    # Frame numbers go where the real fflive prints them, stderr when stdout carries the video
+    frameno_out = sys.stderr if output_video else sys.stdout
+    lavfi = opts.get('-f') == 'lavfi'
+    source = opts.get('-i', opts.get('output', '')) # The audio player takes its input as the last argument
+    stdin = sys.stdin.buffer if source == '-' else None
+    if not lavfi and stdin is None:
+        print_input_info(cfg, source)
+
+    time.sleep(cfg.startup_ms / 1000)
+    frame_interval = 0 if max_speed else speed_ratio / cfg.fps
+    next_frame_t = time.time()
+    next_stats_t = next_frame_t
+    log_interval = 1 / cfg.log_rate if cfg.log_rate > 0 else 0
+    next_log_t = next_frame_t
+    log_no = 0
+    shown = 0
+
+    while True:
+        t = time.time()
+        with state.lock:
+            paused = state.paused
+            step = state.steps > 0
+            if step:
+                state.steps -= 1
+
+        if log_interval:
+            lines = []
+            while next_log_t <= t:
+                lines.append(f'[quickjs @ 0x55d0c0ffee00] log line {log_no} frame {frame_counter}')
+                log_no += 1
+                next_log_t += log_interval
+            if lines:
+                sys.stderr.write('\n'.join(lines) + '\n')
+                sys.stderr.flush()
+
+        if cfg.stats_hz > 0 and t >= next_stats_t and not nodisp:
+            next_stats_t = t + 1 / cfg.stats_hz
+            sys.stderr.write(f'{frame_counter / cfg.fps:7.2f} M-V:  0.000 fd=   0 aq=    0KB vq=  120KB sq=    0B \r')
+            sys.stderr.flush()
+
+        if (paused and not step) or (not step and t < next_frame_t):
+            wait = 0.05 if paused else max(0.0, next_frame_t - t)
+            if log_interval:
+                wait = min(wait, max(0.0, next_log_t - t))
+            state.wake.wait(wait)
+            state.wake.clear()
+            if paused:
+                next_frame_t = time.time()
+            continue
+
+        if lavfi:
+            packet = make_packet(shown)
+        else:
+            packet = read_packet(stdin) if stdin else None
+            if packet is None:
+                if '-autoexit' in opts:
+                    return 0
+                stdin = None
+                lavfi = False
+                state.wake.wait(0.1) # The window stays open on the last frame until killed
+                state.wake.clear()
+                continue
+
+        if shown in cfg.stalls:
+            time.sleep(cfg.stalls[shown])
+        if shown == cfg.crash_at:
+            log('ffsim fflive: simulated crash')
+            sys.stderr.flush()
+            os._exit(CRASH_EXIT_CODE) # pylint: disable=protected-access
+
+        if print_frameno and not nodisp:
+            frameno_out.write(f'FRAME_NO: {shown}\n')
+            frameno_out.flush()
+        if output_video:
+            try:
+                sys.stdout.buffer.write(packet)
+                sys.stdout.buffer.flush()
+            except (BrokenPipeError, OSError):
+                return 0
+        shown += 1
+        frame_counter += 1
+        next_frame_t = max(next_frame_t + frame_interval, time.time() - 1.0)
+
+
+def main(tool=None, argv=None):
+    tool = tool or os.path.splitext(os.path.basename(sys.argv[0]))[0]
+    argv = sys.argv[1:] if argv is None else argv
+    if tool == 'ffgac':
+        return ffgac(argv)
+    if tool == 'fflive':
+        return fflive(argv)
+    print(f'ffsim: unknown tool {tool}, expected ffgac or fflive', file=sys.stderr)
+    return 2
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Usage: ff_simulator.py ffgac|fflive [options]', file=sys.stderr)
+        sys.exit(2)
+    sys.exit(main(sys.argv[1], sys.argv[2:]))
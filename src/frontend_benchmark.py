@@ -0,0 +1,166 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from consts import BIN_DIR_ENV
+from lib.colored_print import print_error
+
+# Load and latency of the GUI thread while the real app drives the ffgac/fflive simulators (ff_simulator.py):
+#   python frontend_benchmark.py --rates 0 1000 10000 --seconds 10 --restarts 5
+# For each script log line rate it measures the GUI thread CPU time, how late Tk timers fire (event latency)
+# and how far playback keeps up, then restarts playback a few times and measures the restart latency:
+# how long restart_ffplay() blocks the GUI and how long until the first frame is reported.
+
+APP_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+SIM_BIN_DIR = os.path.join(APP_DIR, 'bin', 'sim')
+PROBE_MS = 10
+
+
+def percentiles(values, q=(50, 95, 99)) -> Dict[str, float]:
+    if not len(values):
+        return {}
+    return {**{f'p{p}': float(v) for p, v in zip(q, np.percentile(values, q))}, 'max': float(np.max(values))}
+
+
+class FrontendBench:
+    def __init__(self, app, args):
+        self.app = app
+        self.args = args
+        self.results: Dict = {'version': 1, 'rates': [], 'restarts': []}
+        self.steps: List = []
+        self.probe_lateness: List[float] = []
+        self.probe_timer = None
+        self.probe_due_t = 0.0
+        self.first_frame_t = None
+        self.video_path = ''
+
+        on_frame_progress = app.on_frame_progress
+        def on_frame_progress_hook(*a, **kw):
+            if self.first_frame_t is None:
+                self.first_frame_t = time.perf_counter()
+            return on_frame_progress(*a, **kw)
+        app.on_frame_progress = on_frame_progress_hook
+
+    def start(self):
+        # The simulators don't read the video, start_ffplay only checks that it exists
+        fd, self.video_path = tempfile.mkstemp(suffix='.avi', prefix='livemosher_bench_')
+        os.close(fd)
+        self.app.video_path = self.video_path
+        for rate in self.args.rates:
+            self.steps.append(lambda rate=rate: self.run_rate(rate))
+        for i in range(self.args.restarts):
+            self.steps.append(lambda i=i: self.run_restart(i))
+        self.steps.append(self.finish)
+        self.next_step()
+
+    def next_step(self):
+        self.steps.pop(0)()
+
+    def probe(self):
+        t = time.perf_counter()
+        self.probe_lateness.append((t - self.probe_due_t) * 1000)
+        self.probe_due_t = t + PROBE_MS / 1000
+        self.probe_timer = self.app.after(PROBE_MS, self.probe)
+
+    def start_probe(self):
+        self.probe_lateness = []
+        self.probe_due_t = time.perf_counter() + PROBE_MS / 1000
+        self.probe_timer = self.app.after(PROBE_MS, self.probe)
+
+    def stop_probe(self):
+        if self.probe_timer:
+            self.app.after_cancel(self.probe_timer)
+            self.probe_timer = None
+
+    def run_rate(self, rate):
+        os.environ['FFSIM_LOG_RATE'] = str(rate)
+        print(f'Log rate {rate} lines/s for {self.args.seconds}s')
+        self.first_frame_t = None
+        self.app.restart_ffplay()
+        # Measure once playing, the start itself is covered by the restart runs
+        self.app.after(1000, self.measure_rate, rate)
+
+    def measure_rate(self, rate):
+        self.start_probe()
+        start = (time.perf_counter(), time.thread_time(), self.app.current_frame)
+        def done():
+            self.stop_probe()
+            wall = time.perf_counter() - start[0]
+            frames = self.app.current_frame - start[2]
+            fps = float(os.environ.get('FFSIM_FPS', 25))
+            result = {
+                'log_rate': rate,
+                'seconds': wall,
+                'gui_cpu_percent': (time.thread_time() - start[1]) / wall * 100,
+                'event_lateness_ms': percentiles(self.probe_lateness),
+                'frames': frames,
+                'realtime_ratio': frames / (wall * fps),
+            }
+            self.results['rates'].append(result)
+            print(json.dumps(result))
+            self.next_step()
+        self.app.after(int(self.args.seconds * 1000), done)
+
+    def run_restart(self, i):
+        self.first_frame_t = None
+        t0 = time.perf_counter()
+        self.app.restart_ffplay()
+        blocked_ms = (time.perf_counter() - t0) * 1000
+        def wait_first_frame():
+            if self.first_frame_t is None and time.perf_counter() - t0 < 10:
+                self.app.after(1, wait_first_frame)
+                return
+            result = {
+                'run': i,
+                'blocked_ms': blocked_ms,
+                'first_frame_ms': (self.first_frame_t - t0) * 1000 if self.first_frame_t else None,
+            }
+            self.results['restarts'].append(result)
+            print(json.dumps(result))
+            self.app.after(500, self.next_step)
+        self.app.after(1, wait_first_frame)
+
+    def finish(self):
+        first_frames = [r['first_frame_ms'] for r in self.results['restarts'] if r['first_frame_ms'] is not None]
+        self.results['restart_first_frame_ms'] = percentiles(first_frames)
+        self.results['restart_blocked_ms'] = percentiles([r['blocked_ms'] for r in self.results['restarts']])
+        with open(self.args.out, 'w', encoding='utf-8') as f:
+            json.dump(self.results, f, indent=1)
+        print('Results saved to:', self.args.out)
+        self.app.kill_ffplay_processes()
+        os.remove(self.video_path)
+        self.app.dir_watcher.stop()
+        self.app.zmq_io.stop()
+        self.app.root.quit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='GUI thread load and latency against the ffgac/fflive simulators')
+    parser.add_argument('--rates', type=float, nargs='*', default=[0, 1000, 10000], help='Script log lines per second')
+    parser.add_argument('--seconds', type=float, default=10.0, help='Measurement time per rate')
+    parser.add_argument('--restarts', type=int, default=5, help='Playback restarts to time')
+    parser.add_argument('--out', default='frontend_benchmark.json', help='Results JSON')
+    args = parser.parse_args()
+
+    if not os.path.isdir(SIM_BIN_DIR):
+        print_error('Simulators not found in', SIM_BIN_DIR)
+        return 1
+    os.environ[BIN_DIR_ENV] = SIM_BIN_DIR
+
+    from LiveMosherApp import LiveMosherApp # pylint: disable=import-outside-toplevel
+    app = LiveMosherApp()
+    app.config['Main']['last_project_file'] = '' # Default empty project, no user video or script
+    bench = FrontendBench(app, args)
+    app.after(1500, bench.start)
+    app.mainloop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,223 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+from typing import Dict, List, Set, Tuple
+
+from lib.colored_print import print_warn
+from lib.misc import IS_WIN, IS_MAC
+
+#pylint: disable=broad-except
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_ATTRIB | IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class DirWatcher:
+    '''Recursive watcher for a few directory trees. Uses inotify on Linux, polls mtimes elsewhere.
+    Changes are collected in the watcher thread and handed out debounced by `poll()`, meant to be
+    called from a GUI timer, so no callbacks run on foreign threads.'''
+
+    def __init__(self, debounce=0.3, poll_interval=1.0):
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.roots: List[str] = []
+        self.running = False
+        self.thread: threading.Thread = None
+        self._lock = threading.Lock()
+        self._changed: Set[str] = set()
+        self._last_event_t = 0.0
+        self._roots_changed = threading.Event()
+        self._inotify = None
+        if not IS_WIN and not IS_MAC:
+            try:
+                self._inotify = _Inotify()
+            except OSError as e:
+                print_warn(f'inotify not available, polling script dirs: {e}')
+
+    @property
+    def backend(self):
+        return 'inotify' if self._inotify else 'polling'
+
+    def watch(self, roots: List[str]):
+        '''Set the watched trees. Cheap to call again, also picks up roots that didn't exist before.'''
+        roots = [os.path.abspath(r) for r in roots if r]
+        with self._lock:
+            self.roots = roots
+        self._roots_changed.set()
+        if not self.running:
+            self.running = True
+            self.thread = threading.Thread(target=self._run_inotify if self._inotify else self._run_polling, name='dir_watcher')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self._roots_changed.set()
+        if self.thread:
+            self.thread.join(1.0)
+            self.thread = None
+        if self._inotify:
+            self._inotify.close()
+            self._inotify = None
+
+    def poll(self) -> Set[str]:
+        '''Changed paths once no new events came for `debounce` seconds, otherwise an empty set'''
+        with self._lock:
+            if not self._changed or time.time() - self._last_event_t < self.debounce:
+                return set()
+            changed = self._changed
+            self._changed = set()
+            return changed
+
+    def _add_changes(self, paths):
+        if not paths:
+            return
+        with self._lock:
+            self._changed.update(paths)
+            self._last_event_t = time.time()
+
+    # inotify
+
+    def _run_inotify(self):
+        inotify = self._inotify
+        while self.running:
+            if self._roots_changed.is_set():
+                self._roots_changed.clear()
+                with self._lock:
+                    roots = list(self.roots)
+                inotify.sync_roots(roots)
+            try:
+                ready, _, _ = select.select([inotify.fd], [], [], 0.5)
+            except (OSError, ValueError):
+                break
+            if ready:
+                self._add_changes(inotify.read_events())
+
+    # Polling fallback
+
+    def _run_polling(self):
+        snapshot = None
+        while self.running:
+            with self._lock:
+                roots = list(self.roots)
+            self._roots_changed.clear()
+            current = _scan(roots)
+            if snapshot is not None:
+                changed = {p for p in snapshot.keys() | current.keys() if snapshot.get(p) != current.get(p)}
+                self._add_changes(changed)
+            snapshot = current
+            self._roots_changed.wait(self.poll_interval)
+
+
+def _scan(roots: List[str]) -> Dict[str, Tuple[int, int]]:
+    state = {}
+    stack = [r for r in roots if os.path.isdir(r)]
+    while stack:
+        path = stack.pop()
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    state[entry.path] = (st.st_mtime_ns, st.st_size)
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+        except OSError:
+            continue
+    return state
+
+
+class _Inotify:
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        self.wd_paths: Dict[int, str] = {}
+        self.path_wds: Dict[str, int] = {}
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def sync_roots(self, roots: List[str]):
+        # Dirs of roots no longer in the list would keep reporting and their watches pile up
+        for path in [p for p in self.path_wds if not any(p == r or p.startswith(os.path.join(r, '')) for r in roots)]:
+            self.rm_watch(path)
+        for root in roots:
+            if os.path.isdir(root):
+                self.add_tree(root)
+
+    def add_tree(self, root):
+        for path, dirs, _files in os.walk(root):
+            self.add_watch(path)
+            dirs[:] = [d for d in dirs if not os.path.islink(os.path.join(path, d))]
+
+    def add_watch(self, path):
+        if path in self.path_wds:
+            return
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            print_warn(f'inotify_add_watch {path}: {os.strerror(ctypes.get_errno())}')
+            return
+        self.wd_paths[wd] = path
+        self.path_wds[path] = wd
+
+    def rm_watch(self, path):
+        wd = self.path_wds.pop(path)
+        self.wd_paths.pop(wd, None)
+        self.libc.inotify_rm_watch(self.fd, wd) # Fails when the dir is already gone, the watch went with it
+
+    def read_events(self) -> Set[str]:
+        changed = set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+        pos = 0
+        while pos + _EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, pos)
+            pos += _EVENT_HEADER.size
+            name = data[pos:pos + length].rstrip(b'\0')
+            pos += length
+
+            if mask & IN_Q_OVERFLOW:
+                # Lost events, report every watched dir so the caller rescans
+                changed.update(self.path_wds)
+                continue
+            dir_path = self.wd_paths.get(wd)
+            if dir_path is None:
+                continue
+            if mask & IN_IGNORED:
+                self.path_wds.pop(self.wd_paths.pop(wd), None)
+                continue
+            path = os.path.join(dir_path, os.fsdecode(name)) if name else dir_path
+            changed.add(path)
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                # New subtree, its files may have landed before the watch did
+                self.add_tree(path)
+                for sub_root, _dirs, files in os.walk(path):
+                    changed.update(os.path.join(sub_root, f) for f in files)
+        return changed
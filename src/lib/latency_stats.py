@@ -0,0 +1,121 @@
+import bisect
+import json
+import re
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List
+
+# Log spaced bucket upper bounds in seconds, 0.1 ms .. ~13 s, 10 buckets per decade
+_BUCKETS = [10 ** (e / 10) / 10000 for e in range(0, 52)]
+_COMMAND_RE = re.compile(r'[:\s]')
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * (len(_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_left(_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p):
+        '''Upper bound of the bucket holding the p-th percentile (p in 0..100)'''
+        if not self.count:
+            return None
+        rank = p / 100 * self.count
+        seen = 0
+        for i, cnt in enumerate(self.counts):
+            seen += cnt
+            if cnt and seen >= rank:
+                return min(_BUCKETS[i], self.max) if i < len(_BUCKETS) else self.max
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+
+class LatencyStats:
+    '''Per command latency histograms, timeout/reconnect counters and a bounded trace of slow requests.
+    Written from the ZMQ I/O thread, read from the GUI thread.'''
+
+    def __init__(self, slow_threshold=0.1, max_trace=1000):
+        self.slow_threshold = slow_threshold
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.timeouts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.reconnects: Dict[str, int] = {}
+        self.slow_trace: Deque[dict] = deque(maxlen=max_trace)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def command_name(text: str):
+        '''"volume:100" -> "volume", "atempo tempo 1.02" -> "atempo", one histogram per command, not per value'''
+        return _COMMAND_RE.split(text.strip(), 1)[0] or '<empty>'
+
+    def record(self, channel: str, text: str, status: str, rtt: float, queued: float = 0.0):
+        command = self.command_name(text)
+        total = rtt + queued
+        with self._lock:
+            if status == 'ok':
+                self.histograms.setdefault(command, LatencyHistogram()).add(total)
+            elif status == 'timeout':
+                self.timeouts[command] = self.timeouts.get(command, 0) + 1
+            else:
+                self.errors[command] = self.errors.get(command, 0) + 1
+
+            if status != 'ok' or total >= self.slow_threshold:
+                self.slow_trace.append({
+                    't': time.time(),
+                    'channel': channel,
+                    'command': text,
+                    'status': status,
+                    'queued_ms': round(queued * 1000, 3),
+                    'rtt_ms': round(rtt * 1000, 3),
+                })
+
+    def record_reconnect(self, channel: str):
+        with self._lock:
+            self.reconnects[channel] = self.reconnects.get(channel, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            commands = {}
+            for command in sorted(set(self.histograms) | set(self.timeouts) | set(self.errors)):
+                hist = self.histograms.get(command) or LatencyHistogram()
+                def ms(value):
+                    return round(value * 1000, 3) if value is not None else None
+                commands[command] = {
+                    'count': hist.count,
+                    'mean_ms': ms(hist.mean()),
+                    'p50_ms': ms(hist.percentile(50)),
+                    'p95_ms': ms(hist.percentile(95)),
+                    'p99_ms': ms(hist.percentile(99)),
+                    'max_ms': ms(hist.max if hist.count else None),
+                    'timeouts': self.timeouts.get(command, 0),
+                    'errors': self.errors.get(command, 0),
+                }
+            return {
+                'commands': commands,
+                'reconnects': dict(self.reconnects),
+                'slow_threshold_ms': self.slow_threshold * 1000,
+                'slow_requests': list(self.slow_trace),
+            }
+
+    def summary(self) -> List[str]:
+        snap = self.snapshot()
+        lines = []
+        for command, st in snap['commands'].items():
+            lines.append(f'{command:<18} n={st["count"]:<6} p50={st["p50_ms"]} p95={st["p95_ms"]} p99={st["p99_ms"]} '
+                         f'max={st["max_ms"]} ms, timeouts={st["timeouts"]}, errors={st["errors"]}')
+        if snap['reconnects']:
+            lines.append('reconnects: ' + ', '.join(f'{k}={v}' for k, v in snap['reconnects'].items()))
+        return lines
+
+    def export(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, indent=2)
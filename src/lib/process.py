@@ -12,6 +12,7 @@ from typing import Callable, Dict, List, Union
 from enum import Enum
 from lib.colored_print import print_error
 from lib.misc import IS_WIN
+from lib.process_log import ProcessLogger
 
 if IS_WIN:
     import msvcrt
@@ -56,6 +57,8 @@ class Process:
         env: Dict[str, str] = None,
         binary_mode: bool = False,
         idle_priority = False,
+        logger: ProcessLogger = None,
+        log_stdout = True,
     ):
         self.name = name
         self.command = command
@@ -68,6 +71,12 @@ class Process:
         self._stderr_in = stderr
         self.env = env
         self.idle_priority = idle_priority
+        # Streams piped to a callback are also written to the log, DEVNULL streams are read only for the log.
+        # log_stdout=False keeps a binary stdout, e.g. encoded video, out of the log
+        self.logger = logger
+        self.log_stdout = log_stdout
+        self.log_only_out = False
+        self.log_only_err = False
 
         self.on_stdout = None
         self.on_stderr = None
@@ -89,8 +98,10 @@ class Process:
 
         r_fd_out = None
         r_fd_err = None
-        if isinstance(self._stdout_in, Callable):
-            self.on_stdout = self._stdout_in
+        self.log_only_out = bool(self.logger) and self.log_stdout and self._stdout_in == self.Pipe.DEVNULL
+        self.log_only_err = bool(self.logger) and self._stderr_in == self.Pipe.DEVNULL
+        if isinstance(self._stdout_in, Callable) or self.log_only_out:
+            self.on_stdout = self._stdout_in if not self.log_only_out else None
             if IS_WIN:
                 r_fd_out, w_fd_out = os.pipe()
             else:
@@ -100,8 +111,8 @@ class Process:
             w_fd_out = self._stdout_in.to_subprocess()
         self._stdout_out = w_fd_out
 
-        if isinstance(self._stderr_in, Callable):
-            self.on_stderr = self._stderr_in
+        if isinstance(self._stderr_in, Callable) or self.log_only_err:
+            self.on_stderr = self._stderr_in if not self.log_only_err else None
             if IS_WIN:
                 r_fd_err, w_fd_err = os.pipe()
             else:
@@ -113,10 +124,10 @@ class Process:
 
 
         if IS_WIN:
-            if self.on_stdout:
+            if self.on_stdout or self.log_only_out:
                 self.r_out = r_fd_out
                 set_pipe_non_blocking(self.r_out)
-            if self.on_stderr:
+            if self.on_stderr or self.log_only_err:
                 self.r_err = r_fd_err
                 set_pipe_non_blocking(self.r_err)
 
@@ -124,6 +135,8 @@ class Process:
             os.nice(19) # pylint: disable=maybe-no-member
 
         print('Running:',  ' '.join(self.command))
+        if self.logger:
+            self.logger.note('Running: ' + ' '.join(self.command))
         self.process = subprocess.Popen(self.command, # pylint: disable=subprocess-popen-preexec-fn
                                         stdin=self._stdin_in,
                                         stdout=self._stdout_out,
@@ -135,21 +148,22 @@ class Process:
             win32process.SetPriorityClass(self.process._handle, win32process.IDLE_PRIORITY_CLASS) # pylint: disable=possibly-used-before-assignment,no-member, c-extension-no-member, protected-access
 
         if not IS_WIN:
-            if self.on_stdout:
+            if self.on_stdout or self.log_only_out:
                 self.r_out = self.process.stdout
                 set_pipe_non_blocking(self.r_out)
 
-            if self.on_stderr:
+            if self.on_stderr or self.log_only_err:
                 self.r_err = self.process.stderr
                 set_pipe_non_blocking(self.r_err)
 
         self.stdout_queue = queue.Queue()
         self.stderr_queue = queue.Queue()
 
-        if self.on_stdout or self.on_stderr:
+        if self.on_stdout or self.on_stderr or self.log_only_out or self.log_only_err:
             self.check_pipe_thread = threading.Thread(target=self._pipes_reader)
             self.check_pipe_thread.daemon = True
             self.check_pipe_thread.start()
+        if self.on_stdout or self.on_stderr:
             self.check_pipe_timer = self._after(10, self._check_pipes_in_main_thread)
 
 
@@ -160,6 +174,9 @@ class Process:
     def kill(self, terminate=False):
         process = self.process
         self.process = None
+        if self.logger and process:
+            returncode = process.poll()
+            self.logger.note(f'Exit code: {returncode}' if returncode is not None else 'Stopped')
 
         # Wait fot the check thread to finish
         if self.check_pipe_thread:
@@ -246,6 +263,10 @@ class Process:
                     out = pipe.read(1024 * 1024)
                 if not out:
                     continue
+                if self.logger and (pipe != self.r_out or self.log_stdout):
+                    self.logger.write('stdout' if pipe == self.r_out else 'stderr', out)
+                if (self.log_only_out if pipe == self.r_out else self.log_only_err):
+                    continue
                 out = out.replace(b'\r\n', b'\n')
 
                 timestamp = time.time()
@@ -0,0 +1,199 @@
+import os
+import re
+import shutil
+import threading
+import time
+from collections import defaultdict
+from typing import BinaryIO, Dict, Iterable, List, Tuple
+
+from lib.colored_print import print_error
+
+#pylint: disable=broad-except
+
+# Per session directory in the log dir, one rotating file per process:
+#   <session>/<process>.log, <process>.log.1 .. <process>.log.<backup_count>, every line prefixed with the
+#   wall clock time and the stream
+MAX_BYTES = 10 * 1024 * 1024
+BACKUP_COUNT = 3
+MAX_QUEUED_BYTES = 8 * 1024 * 1024 # Output over this while the disk is slow is dropped, counted in the file
+FLUSH_INTERVAL = 0.5
+KEEP_SESSIONS = 20
+SESSION_DIR_RE = re.compile(r'^\d{8}_\d{6}$')
+
+
+class ProcessLogger:
+    '''Handle of one process, passed to Process'''
+
+    def __init__(self, writer: 'ProcessLogWriter', process: str):
+        self.writer = writer
+        self.process = process
+
+    def write(self, stream: str, data: bytes):
+        self.writer.write(self.process, stream, data)
+
+    def note(self, text: str):
+        '''App side events, the command line and exit code'''
+        self.writer.write(self.process, 'app', (text + '\n').encode('utf-8', errors='replace'))
+
+
+class _LogFile:
+    def __init__(self, path: str):
+        self.path = path
+        self.file: BinaryIO = open(path, 'ab')
+        self.size = self.file.tell()
+        self.open_stream: str = None # Stream of the unfinished last line
+
+
+class ProcessLogWriter:
+    '''Writes the output of all processes to per session rotating files from one thread. `write` only queues,
+    so the pipe reader threads never wait for the disk, and the queue is bounded.'''
+
+    def __init__(self, log_dir: str, session: str = None, processes: Iterable[str] = None,
+                 max_bytes=MAX_BYTES, backup_count=BACKUP_COUNT, max_queued_bytes=MAX_QUEUED_BYTES,
+                 keep_sessions=KEEP_SESSIONS):
+        self.log_dir = log_dir
+        self.session = session or time.strftime('%Y%m%d_%H%M%S')
+        self.session_dir = os.path.join(log_dir, self.session)
+        self.processes = set(processes) if processes is not None else None # None logs all processes
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.max_queued_bytes = max_queued_bytes
+        self.keep_sessions = keep_sessions
+        self.running = False
+        self.thread: threading.Thread = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pending: List[Tuple[str, str, float, bytes]] = []
+        self._queued_bytes = 0
+        self._dropped: Dict[str, int] = defaultdict(int)
+        self._files: Dict[str, _LogFile] = {}
+
+    def logger(self, process: str) -> ProcessLogger:
+        '''None when `process` isn't configured to be logged'''
+        if not self.running or (self.processes is not None and process not in self.processes):
+            return None
+        return ProcessLogger(self, process)
+
+    def start(self) -> bool:
+        try:
+            os.makedirs(self.session_dir, exist_ok=True)
+            self.remove_old_sessions()
+        except OSError as e:
+            print_error(f'Error creating the process log dir {self.session_dir}: {e}')
+            return False
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='process_log')
+        self.thread.daemon = True
+        self.thread.start()
+        return True
+
+    def stop(self):
+        self.running = False
+        self._wake.set()
+        if self.thread:
+            self.thread.join(2.0)
+            self.thread = None
+        for log_file in self._files.values():
+            log_file.file.close()
+        self._files = {}
+
+    def remove_old_sessions(self):
+        sessions = sorted(name for name in os.listdir(self.log_dir)
+                          if SESSION_DIR_RE.match(name) and name != self.session and os.path.isdir(os.path.join(self.log_dir, name)))
+        for session in sessions[:max(0, len(sessions) - self.keep_sessions + 1)]:
+            shutil.rmtree(os.path.join(self.log_dir, session), ignore_errors=True)
+
+    def write(self, process: str, stream: str, data: bytes):
+        if not data or not self.running:
+            return
+        with self._lock:
+            if self._queued_bytes + len(data) > self.max_queued_bytes:
+                self._dropped[process] += len(data)
+                self._wake.set()
+                return
+            self._pending.append((process, stream, time.time(), data))
+            self._queued_bytes += len(data)
+
+    def _run(self):
+        while self.running:
+            self._wake.wait(FLUSH_INTERVAL)
+            self._wake.clear()
+            self._flush()
+        self._flush()
+
+    def _flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+            dropped, self._dropped = self._dropped, defaultdict(int)
+            self._queued_bytes = 0
+        if not pending and not dropped:
+            return
+
+        chunks: Dict[str, List[bytes]] = defaultdict(list)
+        for process, stream, timestamp, data in pending:
+            log_file = self._file(process)
+            if not log_file:
+                continue
+            chunks[process].append(self._format(log_file, stream, timestamp, data))
+        for process, count in dropped.items():
+            log_file = self._file(process)
+            if log_file:
+                chunks[process].append(self._format(log_file, 'app', time.time(), f'{count} bytes of output dropped\n'.encode()))
+
+        for process, data in chunks.items():
+            log_file = self._files[process]
+            try:
+                data = b''.join(data)
+                log_file.file.write(data)
+                log_file.file.flush()
+                log_file.size += len(data)
+                if log_file.size >= self.max_bytes:
+                    self._rotate(process)
+            except Exception as e:
+                print_error(f'Process log write error for {process}: {e}')
+
+    def _file(self, process: str) -> _LogFile:
+        log_file = self._files.get(process)
+        if not log_file:
+            try:
+                log_file = self._files[process] = _LogFile(os.path.join(self.session_dir, process + '.log'))
+            except OSError as e:
+                print_error(f'Error opening the log file of {process}: {e}')
+                return None
+        return log_file
+
+    @staticmethod
+    def _format(log_file: _LogFile, stream: str, timestamp: float, data: bytes) -> bytes:
+        '''Prefixes every line with the time and stream, output cut in the middle of a line continues it'''
+        prefix = (time.strftime('%H:%M:%S', time.localtime(timestamp)) + f'.{int(timestamp * 1000 % 1000):03d} {stream}: ').encode()
+        lines = data.replace(b'\r\n', b'\n').replace(b'\r', b'\n').split(b'\n')
+        out = []
+        if log_file.open_stream not in (None, stream): # Other stream cut in the middle of a line
+            out.append(b'\n')
+        for i, line in enumerate(lines):
+            last = i == len(lines) - 1
+            if last and not line:
+                log_file.open_stream = None
+                break
+            if log_file.open_stream != stream:
+                out.append(prefix)
+            out.append(line)
+            if last:
+                log_file.open_stream = stream
+            else:
+                out.append(b'\n')
+                log_file.open_stream = None
+        return b''.join(out)
+
+    def _rotate(self, process: str):
+        log_file = self._files.pop(process)
+        log_file.file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f'{log_file.path}.{i}'
+            if os.path.exists(src):
+                os.replace(src, f'{log_file.path}.{i + 1}')
+        if self.backup_count > 0:
+            os.replace(log_file.path, log_file.path + '.1')
+        else:
+            os.remove(log_file.path)
+        self._file(process)
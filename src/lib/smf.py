@@ -0,0 +1,139 @@
+import struct
+from typing import List, NamedTuple, Tuple
+
+# Standard MIDI File reader, just enough to schedule channel messages against time
+
+class SmfError(Exception):
+    pass
+
+
+class SmfEvent(NamedTuple):
+    tick: int
+    track: int
+    data: Tuple[int, ...] # Channel message bytes, or (0xff, 0x51, tempo) for tempo changes
+
+
+class SmfFile(NamedTuple):
+    format: int
+    division: int
+    tracks: List[List[SmfEvent]]
+
+
+META_TEMPO = 0x51
+DEFAULT_TEMPO = 500000 # us per quarter note, 120 BPM
+
+_DATA_BYTES = {0x80: 2, 0x90: 2, 0xa0: 2, 0xb0: 2, 0xc0: 1, 0xd0: 1, 0xe0: 2}
+
+
+def _read_varlen(data: bytes, pos: int):
+    value = 0
+    for _ in range(4):
+        if pos >= len(data):
+            raise SmfError('Truncated variable length value')
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7f)
+        if not byte & 0x80:
+            return value, pos
+    raise SmfError('Variable length value too long')
+
+
+def _read_track(data: bytes, track_no: int) -> List[SmfEvent]:
+    events = []
+    pos = 0
+    tick = 0
+    status = 0
+    while pos < len(data):
+        delta, pos = _read_varlen(data, pos)
+        tick += delta
+        if pos >= len(data):
+            raise SmfError('Truncated event')
+        byte = data[pos]
+        if byte == 0xff:
+            meta_type = data[pos + 1]
+            length, pos = _read_varlen(data, pos + 2)
+            payload = data[pos:pos + length]
+            pos += length
+            if meta_type == 0x2f: # End of track
+                break
+            if meta_type == META_TEMPO and length == 3:
+                events.append(SmfEvent(tick, track_no, (0xff, META_TEMPO, int.from_bytes(payload, 'big'))))
+            continue
+        if byte in (0xf0, 0xf7):
+            length, pos = _read_varlen(data, pos + 1)
+            pos += length
+            continue
+
+        if byte & 0x80:
+            status = byte
+            pos += 1
+        elif not status:
+            raise SmfError('Running status without a status byte')
+        count = _DATA_BYTES.get(status & 0xf0)
+        if count is None:
+            raise SmfError(f'Unexpected status byte 0x{status:02x}')
+        if pos + count > len(data):
+            raise SmfError('Truncated channel message')
+        events.append(SmfEvent(tick, track_no, (status, *data[pos:pos + count])))
+        pos += count
+    return events
+
+
+def read_smf(path) -> SmfFile:
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:4] != b'MThd':
+        raise SmfError('Not a MIDI file')
+    header_len = struct.unpack('>I', data[4:8])[0]
+    fmt, ntracks, division = struct.unpack('>HHH', data[8:14])
+    pos = 8 + header_len
+    tracks = []
+    while pos + 8 <= len(data) and len(tracks) < ntracks:
+        chunk_type = data[pos:pos + 4]
+        chunk_len = struct.unpack('>I', data[pos + 4:pos + 8])[0]
+        chunk = data[pos + 8:pos + 8 + chunk_len]
+        pos += 8 + chunk_len
+        if chunk_type == b'MTrk':
+            tracks.append(_read_track(chunk, len(tracks)))
+    return SmfFile(fmt, division, tracks)
+
+
+def smf_timed_messages(smf: SmfFile, bpm: float = None) -> List[Tuple[float, Tuple[int, ...]]]:
+    '''All channel messages as (seconds, bytes), sorted by time.
+    Tempo follows the file's tempo map unless `bpm` is given. Format 2 tracks are played one after another.'''
+    if smf.division & 0x8000:
+        # SMPTE timing: -frames per second in the high byte, ticks per frame in the low byte
+        fps = -struct.unpack('b', bytes([smf.division >> 8]))[0]
+        ticks_per_second = (29.97 if fps == 29 else fps) * (smf.division & 0xff)
+        def to_seconds(events):
+            return [(e.tick / ticks_per_second, e.data) for e in events if e.data[0] != 0xff]
+    else:
+        ppq = smf.division or 96
+        def to_seconds(events):
+            ret = []
+            tempo = DEFAULT_TEMPO if not bpm else 60_000_000 / bpm
+            last_tick = 0
+            seconds = 0.0
+            for e in events:
+                seconds += (e.tick - last_tick) * tempo / ppq / 1_000_000
+                last_tick = e.tick
+                if e.data[0] == 0xff:
+                    if not bpm:
+                        tempo = e.data[2]
+                else:
+                    ret.append((seconds, e.data))
+            return ret
+
+    if smf.format == 2:
+        messages = []
+        offset = 0.0
+        for track in smf.tracks:
+            timed = to_seconds(track)
+            messages.extend((t + offset, data) for t, data in timed)
+            if timed:
+                offset += timed[-1][0]
+        return messages
+
+    # Format 0/1: one tempo map shared by all tracks, merge keeping the in-track order on equal ticks
+    merged = sorted((e for track in smf.tracks for e in track), key=lambda e: (e.tick, e.data[0] != 0xff, e.track))
+    return to_seconds(merged)
@@ -0,0 +1,94 @@
+import bisect
+import configparser
+import json
+from typing import Dict, List, NamedTuple, Tuple
+
+from lib.colored_print import print_error
+from midi_sender import is_note
+
+#pylint: disable=broad-except
+
+def merge_tables(*tables: Dict[int, List[List[int]]]) -> Dict[int, List[List[int]]]:
+    merged: Dict[int, List[List[int]]] = {}
+    for table in tables:
+        for frame, msgs in (table or {}).items():
+            merged.setdefault(frame, []).extend(msgs)
+    return merged
+
+
+class MidiEvent(NamedTuple):
+    frame: int
+    msg: Tuple[int, int, int]
+
+
+class MidiAutomation:
+    '''MIDI messages recorded against the frame number the script saw them on.
+    Played back by the script wrapper frame by frame, so a render reproduces the take
+    no matter if it runs faster or slower than realtime.'''
+
+    SECTION = 'MidiAutomation'
+
+    def __init__(self):
+        self.events: List[MidiEvent] = []
+        self._frames: List[int] = []
+        self.enabled = True
+        self.recording = False
+
+    def __len__(self):
+        return len(self.events)
+
+    def record(self, frame: int, msg):
+        event = MidiEvent(int(frame), tuple(int(v) for v in msg))
+        if not self._frames or event.frame >= self._frames[-1]:
+            self.events.append(event)
+            self._frames.append(event.frame)
+        else:
+            # Keep the arrival order of events within the same frame
+            i = bisect.bisect_right(self._frames, event.frame)
+            self.events.insert(i, event)
+            self._frames.insert(i, event.frame)
+
+    def clear(self):
+        self.events = []
+        self._frames = []
+
+    def table(self, start_frame=0) -> Dict[int, List[List[int]]]:
+        '''Events grouped by frame, starting at `start_frame`.
+        Controller values set before `start_frame` are chased into the first frame, so playback
+        started in the middle sees the same slider positions. Notes are not chased.'''
+        start_frame = int(start_frame or 0)
+        start = bisect.bisect_left(self._frames, start_frame)
+
+        chase: Dict[Tuple[int, int], List[int]] = {}
+        for event in self.events[:start]:
+            if not is_note(event.msg):
+                chase[(event.msg[0], event.msg[1])] = list(event.msg)
+
+        table: Dict[int, List[List[int]]] = {}
+        if chase:
+            table[start_frame] = list(chase.values())
+        for event in self.events[start:]:
+            table.setdefault(event.frame, []).append(list(event.msg))
+        return table
+
+    def load(self, project: configparser.ConfigParser):
+        self.clear()
+        if not project.has_section(self.SECTION):
+            self.enabled = True
+            return
+        section = project[self.SECTION]
+        self.enabled = section.get('enabled', 'True') == 'True'
+        try:
+            for frame, *msg in json.loads(section.get('events', '') or '[]'):
+                self.record(frame, msg)
+        except Exception as e:
+            print_error('Error loading MIDI automation:', e)
+            self.clear()
+
+    def save(self, project: configparser.ConfigParser):
+        if not self.events and self.enabled:
+            return
+        project[self.SECTION] = {
+            'enabled': str(self.enabled),
+            'events': json.dumps([[e.frame, *e.msg] for e in self.events], separators=(',', ':')),
+        }
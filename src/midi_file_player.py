@@ -0,0 +1,107 @@
+import configparser
+import os
+from typing import Callable, Dict, List
+
+from lib.colored_print import print_error
+from lib.smf import SmfError, read_smf, smf_timed_messages
+from midi_automation import MidiAutomation
+
+#pylint: disable=broad-except
+
+class MidiFilePlayer:
+    '''Plays a Standard MIDI File into the MIDI emulation, scheduled on video frames.
+    Events are converted to frame numbers once (tempo map or a fixed BPM, then `input_fps`), so they can
+    either be embedded frame-locked in the script wrapper, or streamed to the emulation socket as frames go by.'''
+
+    SECTION = 'MidiFile'
+
+    def __init__(self):
+        self.path = ''
+        self.bpm = 0.0 # 0 = use the file's tempo map
+        self.speed = 1.0
+        self.offset_frame = 0
+        self._messages = [] # (seconds, bytes)
+        self._events = MidiAutomation()
+        self._fps = None
+        self._stream_frames: List[int] = []
+        self._stream_table: Dict[int, List[List[int]]] = {}
+        self._stream_pos = 0
+
+    def __bool__(self):
+        return bool(self._messages)
+
+    def load(self, path, bpm=0.0, speed=1.0, offset_frame=0):
+        self.unload()
+        try:
+            smf = read_smf(path)
+            # Only 3 byte messages, that's what MIDIInput.parse_events() handles
+            self._messages = [(t, data) for t, data in smf_timed_messages(smf, bpm or None) if len(data) == 3]
+        except (OSError, SmfError, ValueError) as e:
+            print_error(f'Error loading MIDI file {path}:', e)
+            return False
+        self.path = path
+        self.bpm = bpm
+        self.speed = speed or 1.0
+        self.offset_frame = offset_frame
+        print(f'MIDI file: {os.path.basename(path)}, {len(self._messages)} events'
+              f'{f", {self._messages[-1][0]:.1f} s" if self._messages else ""}')
+        return True
+
+    def unload(self):
+        self.path = ''
+        self._messages = []
+        self._events = MidiAutomation()
+        self._fps = None
+        self.stop_stream()
+
+    def events(self, fps) -> MidiAutomation:
+        if fps != self._fps:
+            self._fps = fps
+            self._events = MidiAutomation()
+            if fps:
+                for seconds, data in self._messages:
+                    self._events.record(self.offset_frame + round(seconds / self.speed * fps), data)
+        return self._events
+
+    def table(self, fps, start_frame=0):
+        return self.events(fps).table(start_frame) if fps else {}
+
+    def start_stream(self, fps, start_frame=0):
+        self._stream_table = self.table(fps, start_frame)
+        self._stream_frames = sorted(self._stream_table)
+        self._stream_pos = 0
+
+    def stop_stream(self):
+        self._stream_table = {}
+        self._stream_frames = []
+        self._stream_pos = 0
+
+    def on_frame(self, frame_num, send: Callable[[List[int]], None]):
+        '''Stream everything due up to the next frame, it has to be in the socket before the script polls'''
+        while self._stream_pos < len(self._stream_frames) and self._stream_frames[self._stream_pos] <= frame_num + 1:
+            for msg in self._stream_table[self._stream_frames[self._stream_pos]]:
+                send(msg)
+            self._stream_pos += 1
+
+    def load_project(self, project: configparser.ConfigParser, resolve_path: Callable[[str], str]):
+        self.unload()
+        if not project.has_section(self.SECTION):
+            return
+        section = project[self.SECTION]
+        path = section.get('path', '')
+        if path:
+            try:
+                self.load(resolve_path(path), float(section.get('bpm', '0') or 0),
+                          float(section.get('speed', '1') or 1), int(section.get('offset_frame', '0') or 0))
+            except ValueError as e:
+                print_error('Error loading MIDI file settings:', e)
+
+    def save_project(self, project: configparser.ConfigParser, relative_path: Callable[[str], str]):
+        if not self.path:
+            return
+        project[self.SECTION] = {
+            'path': relative_path(self.path),
+            'bpm': f'{self.bpm:g}',
+            'speed': f'{self.speed:g}',
+            'offset_frame': str(self.offset_frame),
+        }
@@ -0,0 +1,92 @@
+import json
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, List, Tuple
+
+from lib.latency_stats import LatencyStats
+
+NOTE_OFF = 0x80
+NOTE_ON = 0x90
+
+def is_note(msg: List[int]):
+    return (msg[0] & 0xf0) in (NOTE_OFF, NOTE_ON)
+
+def encode(msg: List[int]) -> str:
+    '''Compact JSON, "[176,1,64]". midi.js JSON.parse()s what it pulls from the emulation socket.'''
+    return json.dumps(msg, separators=(',', ':'))
+
+
+class MidiSender:
+    '''Output stage for the ZMQ MIDI emulation.
+    Controller updates (sliders) are coalesced per (status, controller) and sent at most `rate_hz` times
+    per second, only the latest value survives. Note on/off are never dropped and never reordered
+    with the controller updates queued before them.
+    When frame telemetry is available, the send-to-frame latency is recorded into `stats`
+    and `on_delivered(frame_num, msg)` is called with the frame that first saw the message.'''
+
+    def __init__(self, send_cb: Callable[[str], None], after, after_cancel, rate_hz=60.0, stats: LatencyStats = None):
+        self.send_cb = send_cb
+        self._after = after
+        self._after_cancel = after_cancel
+        self.interval = 1.0 / rate_hz if rate_hz > 0 else 0.0
+        self.stats = stats
+        self.pending: Dict[Tuple[int, int], List[int]] = OrderedDict()
+        self.last_sent_t: Dict[Tuple[int, int], float] = {}
+        self.flush_timer = None
+        self.sent = 0
+        self.coalesced = 0
+        self.on_delivered: Callable[[int, List[int]], None] = None
+        self._in_flight: Deque[Tuple[float, List[int]]] = deque(maxlen=1000)
+
+    def send(self, msg: List[int]):
+        msg = [int(v) for v in msg]
+        if is_note(msg) or not self.interval:
+            self.flush()
+            self._send_now(msg)
+            return
+
+        key = (msg[0], msg[1])
+        now = time.time()
+        if key not in self.pending and now - self.last_sent_t.get(key, 0) >= self.interval:
+            self._send_now(msg)
+            self.last_sent_t[key] = now
+            return
+
+        if key in self.pending:
+            self.coalesced += 1
+        self.pending[key] = msg
+        if not self.flush_timer:
+            delay = max(0.0, self.interval - (now - self.last_sent_t.get(key, 0)))
+            self.flush_timer = self._after(max(1, round(delay * 1000)), self._on_flush_timer)
+
+    def flush(self):
+        if self.flush_timer:
+            self._after_cancel(self.flush_timer)
+            self.flush_timer = None
+        now = time.time()
+        for key, msg in self.pending.items():
+            self._send_now(msg)
+            self.last_sent_t[key] = now
+        self.pending.clear()
+
+    def reset(self):
+        self.flush()
+        self._in_flight.clear()
+
+    def on_frame(self, frame_wall_time: float, frame_num: int = None):
+        '''Called for every new telemetry sample. Everything sent before the frame was stamped reached it.'''
+        while self._in_flight and self._in_flight[0][0] <= frame_wall_time:
+            send_t, msg = self._in_flight.popleft()
+            if self.stats:
+                self.stats.record('midi_emu', 'midi_to_frame', 'ok', frame_wall_time - send_t)
+            if self.on_delivered and frame_num is not None:
+                self.on_delivered(frame_num, msg)
+
+    def _on_flush_timer(self):
+        self.flush_timer = None
+        self.flush()
+
+    def _send_now(self, msg: List[int]):
+        self.send_cb(encode(msg))
+        self.sent += 1
+        self._in_flight.append((time.time(), msg))
@@ -0,0 +1,287 @@
+import argparse
+import json
+import os
+import queue
+import shutil
+import struct
+import tempfile
+import threading
+
+import numpy as np
+import zmq
+
+from lib.colored_print import print_error, print_warn
+from lib.misc import normalize_path
+from zmq_io import ZmqIoThread
+
+#pylint: disable=broad-except
+
+# Capture file layout
+#   <name>.mvcap  'LMMVCAP1' then per frame: forward field, backward field (when present),
+#                 each an int32 (x, y) array over the macroblock grid, row-major
+#   <name>.mvidx  one INDEX_DTYPE record per frame, so a frame is found without scanning the data
+MAGIC = b'LMMVCAP1'
+FLAG_FORWARD = 1
+FLAG_BACKWARD = 2
+INDEX_DTYPE = np.dtype([('frame', '<i4'), ('flags', '<i4'), ('width', '<i4'), ('height', '<i4'), ('offset', '<i8')])
+
+# Header message sent by the capture script before the fields of a frame
+HEADER_TAG = b'LMMV'
+HEADER_FORMAT = '<4siiii' # tag, frame number, width, height, flags
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+MAX_QUEUED_FRAMES = 256 # Frames waiting for the writer thread, more are dropped and counted
+
+CAPTURE_SCRIPT = '''\
+// Generated by Live Mosher, captures motion vectors for mv_capture.py
+import * as zmq from "zmq";
+
+const CAPTURE_URL = $CAPTURE_URL;
+let zpush;
+let header;
+let frame_counter = $FRAME_COUNTER_OFF;
+
+export function setup(args)
+{
+  args.features = [ "mv" ];
+  const ctx = new zmq.Context();
+  zpush = ctx.socket(zmq.PUSH);
+  zpush.connect(CAPTURE_URL);
+  header = new Uint8FFArray($HEADER_SIZE);
+}
+
+function put_int32(offset, value)
+{
+  for ( let i = 0; i < 4; i++ )
+    header[offset + i] = (value >> (8 * i)) & 0xff;
+}
+
+export function glitch_frame(frame, stream)
+{
+  const frame_num = frame.frame_num ?? frame_counter;
+  frame_counter = frame_num + 1;
+  const mvs = frame["mv"];
+  const fwd = mvs ? mvs["forward"] : undefined;
+  const bwd = mvs ? mvs["backward"] : undefined;
+  const any = fwd ?? bwd;
+  const tag = $HEADER_TAG;
+  for ( let i = 0; i < 4; i++ )
+    header[i] = tag.charCodeAt(i);
+  put_int32(4, frame_num);
+  put_int32(8, any ? any.width : 0);
+  put_int32(12, any ? any.height : 0);
+  put_int32(16, (fwd ? $FLAG_FORWARD : 0) | (bwd ? $FLAG_BACKWARD : 0));
+  // Blocking sends, a headless capture can wait but must not drop frames
+  zpush.send(header);
+  if ( fwd )
+    zpush.send(fwd.toUint8FFArray());
+  if ( bwd )
+    zpush.send(bwd.toUint8FFArray());
+}
+'''
+
+
+def index_path(path):
+    return os.path.splitext(path)[0] + '.mvidx'
+
+
+class MvCaptureWriter:
+    '''PULL side of a capture run. The ZMQ I/O thread only assembles the frames and queues them,
+    a writer thread appends them to the capture file, so the disk never holds up the control sockets.'''
+
+    def __init__(self, io: ZmqIoThread, path, name='mv_capture', max_queued_frames=MAX_QUEUED_FRAMES):
+        self.io = io
+        self.path = path
+        self.name = name
+        self.url = ''
+        self.frames = 0 # Written
+        self.dropped_frames = 0 # Queue full, the writer fell behind
+        self.bad_messages = 0
+        self.script_dir = ''
+        self.thread: threading.Thread = None
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queued_frames)
+        self._data = None
+        self._index = None
+        self._offset = 0
+        self._header = None
+        self._fields = []
+        self._expected = []
+
+    def start(self):
+        self._data = open(self.path, 'wb')
+        self._data.write(MAGIC)
+        self._offset = len(MAGIC)
+        self._index = open(index_path(self.path), 'wb')
+        self.thread = threading.Thread(target=self._run, name='mv_capture')
+        self.thread.daemon = True
+        self.thread.start()
+        if not self.io.open_channel(self.name, zmq.PULL, 'tcp://127.0.0.1:*', bind=True, on_message=self._on_message):
+            self.close()
+            return False
+        self.url = self.io.get_endpoint(self.name)
+        return True
+
+    def generate_script(self, start_frame=0):
+        self.script_dir = tempfile.mkdtemp(prefix='livemosher_')
+        path = normalize_path(os.path.join(self.script_dir, 'mv_capture.js'))
+        source = CAPTURE_SCRIPT
+        for key, value in {
+            'CAPTURE_URL': json.dumps(self.url),
+            'FRAME_COUNTER_OFF': str(int(start_frame)),
+            'HEADER_SIZE': str(HEADER_SIZE),
+            'HEADER_TAG': json.dumps(HEADER_TAG.decode('ascii')),
+            'FLAG_FORWARD': str(FLAG_FORWARD),
+            'FLAG_BACKWARD': str(FLAG_BACKWARD),
+        }.items():
+            source = source.replace(f'${key}', value)
+        with open(path, 'w', encoding='utf-8', newline='\n') as f:
+            f.write(source)
+        return path
+
+    def close(self):
+        if self.url:
+            self.io.close_channel(self.name)
+            self.url = ''
+        if self.thread:
+            self._queue.put(None)
+            self.thread.join(5.0)
+            self.thread = None
+        for f in (self._data, self._index):
+            if f:
+                f.close()
+        self._data = None
+        self._index = None
+        if self.dropped_frames:
+            print_warn(f'MvCapture: {self.dropped_frames} frames dropped, the disk was too slow')
+        if self.script_dir:
+            shutil.rmtree(self.script_dir, ignore_errors=True)
+            self.script_dir = ''
+
+    def _on_message(self, msg: bytes):
+        '''I/O thread, no file access here'''
+        if not self._expected:
+            if len(msg) != HEADER_SIZE or not msg.startswith(HEADER_TAG):
+                self.bad_messages += 1
+                return
+            _tag, frame, width, height, flags = struct.unpack(HEADER_FORMAT, msg)
+            self._header = (frame, flags, width, height)
+            self._fields = []
+            self._expected = [f for f in (FLAG_FORWARD, FLAG_BACKWARD) if flags & f]
+        else:
+            self._expected.pop(0)
+            frame, _flags, width, height = self._header
+            if len(msg) != width * height * 2 * 4:
+                print_warn(f'MvCapture: frame {frame} field size {len(msg)} != {width}x{height}')
+                msg = msg[:width * height * 8].ljust(width * height * 8, b'\0')
+            self._fields.append(msg)
+        if not self._expected:
+            try:
+                self._queue.put_nowait((self._header, self._fields))
+            except queue.Full:
+                self.dropped_frames += 1
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            (frame, flags, width, height), fields = item
+            try:
+                self._index.write(np.array([(frame, flags, width, height, self._offset)], INDEX_DTYPE).tobytes())
+                for field in fields:
+                    self._data.write(field)
+                    self._offset += len(field)
+                self.frames += 1
+            except Exception as e:
+                print_error('MvCapture write error:', e)
+                break
+
+
+class MvCaptureFile:
+    '''Read side: memory maps the capture, fields are views into the file, nothing is loaded upfront'''
+
+    def __init__(self, path):
+        self.path = path
+        self.index = np.fromfile(index_path(path), dtype=INDEX_DTYPE)
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f'Not a motion vector capture: {path}')
+        self.data = np.memmap(path, dtype='<i4', mode='r')
+        self._by_frame = {int(frame): i for i, frame in enumerate(self.index['frame'])}
+
+    def __len__(self):
+        return len(self.index)
+
+    def find(self, frame):
+        '''Position in the index of a frame number, or None'''
+        return self._by_frame.get(int(frame))
+
+    def forward(self, i) -> np.ndarray:
+        return self._field(i, FLAG_FORWARD)
+
+    def backward(self, i) -> np.ndarray:
+        return self._field(i, FLAG_BACKWARD)
+
+    def _field(self, i, which):
+        frame, flags, width, height, offset = self.index[i]
+        if not flags & which:
+            return None
+        size = int(width) * int(height) * 2
+        start = int(offset) // 4
+        if which == FLAG_BACKWARD and flags & FLAG_FORWARD:
+            start += size
+        return self.data[start:start + size].reshape(int(height), int(width), 2)
+
+    def frame_stats(self) -> np.ndarray:
+        '''Per frame mean vector, mean length and divergence of the forward field.
+        Negative divergence: vectors converge (sink), positive: they spread out (rise).'''
+        stats = np.zeros(len(self), dtype=[('frame', '<i4'), ('mean_x', '<f4'), ('mean_y', '<f4'),
+                                           ('mean_len', '<f4'), ('divergence', '<f4')])
+        stats['frame'] = self.index['frame']
+        for i in range(len(self)):
+            fwd = self.forward(i)
+            if fwd is None or not fwd.size:
+                continue
+            field = fwd.astype(np.float32)
+            stats['mean_x'][i], stats['mean_y'][i] = field.reshape(-1, 2).mean(axis=0)
+            stats['mean_len'][i] = np.hypot(field[..., 0], field[..., 1]).mean()
+            if min(field.shape[:2]) > 1:
+                stats['divergence'][i] = (np.gradient(field[..., 0], axis=1) + np.gradient(field[..., 1], axis=0)).mean()
+        return stats
+
+    def moving_average(self, i, tail_length=3) -> np.ndarray:
+        '''Forward field averaged over the last `tail_length` frames, like mv_average.js'''
+        fields = [self.forward(j) for j in range(max(0, i - tail_length + 1), i + 1)]
+        fields = [f for f in fields if f is not None] # I-frames have no forward field
+        fields = [f for f in fields if f.shape == fields[-1].shape]
+        if not fields:
+            return None
+        return (np.sum(fields, axis=0, dtype=np.int64) // len(fields)).astype(np.int32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Motion vector capture tools')
+    sub = parser.add_subparsers(dest='command', required=True)
+    stats = sub.add_parser('stats', help='Per frame statistics as CSV')
+    stats.add_argument('capture')
+    info = sub.add_parser('info', help='Summary of a capture')
+    info.add_argument('capture')
+    args = parser.parse_args()
+
+    try:
+        capture = MvCaptureFile(args.capture)
+    except (OSError, ValueError) as e:
+        print_error(e)
+        return
+    if args.command == 'info':
+        frames = capture.index['frame']
+        print(f'{args.capture}: {len(capture)} frames'
+              + (f' ({frames.min()}..{frames.max()}), grid {capture.index["width"][0]}x{capture.index["height"][0]}'
+                 if len(capture) else ''))
+    elif args.command == 'stats':
+        print('frame,mean_x,mean_y,mean_len,divergence')
+        for row in capture.frame_stats():
+            print(','.join(f'{v:g}' for v in row))
+
+
+if __name__ == '__main__':
+    main()
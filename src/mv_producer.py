@@ -0,0 +1,286 @@
+import argparse
+import importlib.util
+import math
+import os
+import threading
+import time
+from typing import List
+
+import numpy as np
+import zmq
+
+from lib.colored_print import print_error, print_warn
+from lib.latency_stats import LatencyHistogram
+from mv_capture import MvCaptureFile
+
+#pylint: disable=broad-except
+
+# Serves motion vector fields to Examples/zmq-demo/mv_receiver.js. The reply is what `new MV2DArray(data)`
+# expects: int32 (x, y) pairs, row-major over the macroblock grid, native (little) endian.
+
+DEFAULT_URL = 'tcp://127.0.0.1:5556'
+MB_SIZE = 16
+MODES = ('zoom', 'rotate', 'wave', 'noise', 'image', 'replay')
+RING_SIZE = 3
+
+
+def mb_grid(width, height):
+    return max(1, math.ceil(height / MB_SIZE)), max(1, math.ceil(width / MB_SIZE))
+
+
+class MvField:
+    '''Preallocated buffers for one macroblock grid, everything per frame is computed in place.'''
+
+    def __init__(self, rows, cols, mode='zoom', scale=8.0, source=''):
+        self.rows = rows
+        self.cols = cols
+        self.mode = mode
+        self.scale = scale
+        self.source = source
+        self.nbytes = rows * cols * 2 * 4
+
+        # Normalized coordinates, -1..1 across the frame, centre at 0
+        y = np.linspace(-1.0, 1.0, rows, dtype=np.float32)[:, None]
+        x = np.linspace(-1.0, 1.0, cols, dtype=np.float32)[None, :]
+        self.gx = np.broadcast_to(x, (rows, cols)).copy()
+        self.gy = np.broadcast_to(y, (rows, cols)).copy()
+        self.fx = np.empty((rows, cols), np.float32)
+        self.fy = np.empty((rows, cols), np.float32)
+        self.tmp = np.empty((rows, cols), np.float32)
+        self.ring = [np.zeros((rows, cols, 2), np.int32) for _ in range(RING_SIZE)]
+        self.rng = np.random.default_rng()
+
+        self.image_x = None
+        self.image_y = None
+        self.replay = None
+        if mode == 'image':
+            self.image_x, self.image_y = self._load_image_field(source)
+        elif mode == 'replay':
+            self.replay = self._load_replay(source)
+
+    def compute(self, frame: int, fps: float, slot: int) -> np.ndarray:
+        out = self.ring[slot]
+        t = frame / (fps or 25.0)
+        fx, fy, tmp = self.fx, self.fy, self.tmp
+
+        if self.mode == 'replay':
+            self._copy_replay(frame, out)
+            return out
+
+        if self.mode == 'zoom':
+            gain = self.scale * math.sin(t * 2 * math.pi * 0.25)
+            np.multiply(self.gx, gain, out=fx)
+            np.multiply(self.gy, gain, out=fy)
+        elif self.mode == 'rotate':
+            gain = self.scale * math.sin(t * 2 * math.pi * 0.1)
+            np.multiply(self.gy, -gain, out=fx)
+            np.multiply(self.gx, gain, out=fy)
+        elif self.mode == 'wave':
+            phase = t * 2 * math.pi * 0.5
+            np.multiply(self.gy, 3 * math.pi, out=tmp)
+            np.add(tmp, phase, out=tmp)
+            np.sin(tmp, out=fx)
+            np.multiply(fx, self.scale, out=fx)
+            np.multiply(self.gx, 3 * math.pi, out=tmp)
+            np.add(tmp, phase, out=tmp)
+            np.cos(tmp, out=fy)
+            np.multiply(fy, self.scale, out=fy)
+        elif self.mode == 'noise':
+            self.rng.standard_normal(out=fx, dtype=np.float32)
+            self.rng.standard_normal(out=fy, dtype=np.float32)
+            np.multiply(fx, self.scale, out=fx)
+            np.multiply(fy, self.scale, out=fy)
+        elif self.mode == 'image':
+            gain = self.scale * (0.5 + 0.5 * math.sin(t * 2 * math.pi * 0.25))
+            np.multiply(self.image_x, gain, out=fx)
+            np.multiply(self.image_y, gain, out=fy)
+
+        np.rint(fx, out=fx)
+        np.rint(fy, out=fy)
+        np.copyto(out[..., 0], fx, casting='unsafe')
+        np.copyto(out[..., 1], fy, casting='unsafe')
+        return out
+
+    def _load_image_field(self, path):
+        '''Gradient of the image luminance resampled to the macroblock grid, normalized to -1..1'''
+        from PIL import Image # pylint: disable=import-outside-toplevel
+        with Image.open(path) as img:
+            luma = np.asarray(img.convert('L').resize((self.cols, self.rows)), dtype=np.float32)
+        grad_y, grad_x = np.gradient(luma)
+        peak = max(float(np.abs(grad_x).max()), float(np.abs(grad_y).max()), 1e-6)
+        return (grad_x / peak).astype(np.float32), (grad_y / peak).astype(np.float32)
+
+    def _load_replay(self, path):
+        '''Captured fields, an .mvcap capture or a (frames, rows, cols, 2) .npy array, memory mapped, never loaded whole'''
+        if os.path.splitext(path)[1].lower() == '.mvcap':
+            return MvCaptureFile(path)
+        data = np.load(path, mmap_mode='r')
+        if data.ndim != 4 or data.shape[-1] != 2:
+            raise ValueError(f'Expected (frames, rows, cols, 2) array, got {data.shape}')
+        return data
+
+    def _copy_replay(self, frame, out: np.ndarray):
+        out.fill(0)
+        if self.replay is None or not len(self.replay):
+            return
+        if isinstance(self.replay, MvCaptureFile):
+            src = self.replay.forward(frame % len(self.replay))
+            if src is None:
+                return
+        else:
+            src = self.replay[frame % len(self.replay)]
+        rows = min(self.rows, src.shape[0])
+        cols = min(self.cols, src.shape[1])
+        np.copyto(out[:rows, :cols], src[:rows, :cols], casting='unsafe')
+
+
+class MvProducer:
+    '''REP service answering every request with the next motion vector field.
+    Runs in its own thread, so computing fields never stalls the app's control sockets.
+    Replies are sent zero-copy from a ring of preallocated buffers, a buffer is reused only
+    after ZMQ is done with it.'''
+
+    def __init__(self, ctx: zmq.Context = None, url=DEFAULT_URL, mode='zoom', scale=8.0, source=''):
+        self.context = ctx or zmq.Context.instance()
+        self.url = url
+        self.mode = mode
+        self.scale = scale
+        self.source = source
+        self.fps = 25.0
+        self.frame = 0
+        self.field: MvField = None
+        self.compute_hist = LatencyHistogram()
+        self.deadline_misses = 0
+        self.requests = 0
+        self.thread: threading.Thread = None
+        self.running = False
+        self._grid = None
+        self._lock = threading.Lock()
+
+    def set_video(self, width, height, fps=None, start_frame=None):
+        '''Grid follows the input video, `start_frame` restarts the field animation (on each run)'''
+        with self._lock:
+            self._grid = mb_grid(width, height)
+            self.fps = fps or self.fps
+            if start_frame is not None:
+                self.frame = start_frame
+
+    def start(self):
+        if self.running:
+            return True
+        if self.mode not in MODES:
+            print_error(f'MvProducer: unknown mode "{self.mode}", one of: {", ".join(MODES)}')
+            return False
+        if self.mode == 'image' and importlib.util.find_spec('PIL') is None:
+            print_error('MvProducer: the "image" mode needs Pillow (pip install pillow)')
+            return False
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='mv_producer')
+        self.thread.daemon = True
+        self.thread.start()
+        return True
+
+    def stop(self, timeout=1.0):
+        if not self.running:
+            return
+        self.running = False
+        self.thread.join(timeout)
+        if self.compute_hist.count:
+            print(f'MvProducer: {self.requests} fields, compute p50={self.compute_hist.percentile(50) * 1000:.2f} '
+                  f'p99={self.compute_hist.percentile(99) * 1000:.2f} ms, deadline misses: {self.deadline_misses}')
+
+    def next_field(self, slot: int) -> np.ndarray:
+        with self._lock:
+            grid = self._grid or mb_grid(1920, 1080)
+            if not self.field or (self.field.rows, self.field.cols) != grid:
+                self.field = MvField(*grid, mode=self.mode, scale=self.scale, source=self.source)
+            frame = self.frame
+            self.frame += 1
+        return self.field.compute(frame, self.fps, slot)
+
+    def _run(self):
+        socket = self.context.socket(zmq.REP)
+        socket.setsockopt(zmq.LINGER, 0)
+        try:
+            socket.bind(self.url)
+        except zmq.error.ZMQError as e:
+            print_error(f'MvProducer: bind {self.url} failed:', e)
+            socket.close()
+            self.running = False
+            return
+        print(f'MvProducer: serving "{self.mode}" fields on {self.url}')
+
+        trackers: List[zmq.MessageTracker] = [None] * RING_SIZE
+        slot = 0
+        poller = zmq.Poller()
+        poller.register(socket, zmq.POLLIN)
+        while self.running:
+            if not poller.poll(100):
+                continue
+            try:
+                socket.recv(zmq.NOBLOCK)
+            except zmq.error.Again:
+                continue
+            self.requests += 1
+
+            tracker = trackers[slot]
+            if tracker is not None and not tracker.done:
+                tracker.wait(1.0)
+
+            t0 = time.perf_counter()
+            try:
+                out = self.next_field(slot)
+            except Exception as e:
+                print_error('MvProducer:', e)
+                self.running = False
+                socket.send(b'')
+                break
+            elapsed = time.perf_counter() - t0
+            self.compute_hist.add(elapsed)
+            if elapsed > 1 / (self.fps or 25.0):
+                self.deadline_misses += 1
+                print_warn(f'MvProducer: field took {elapsed * 1000:.1f} ms')
+
+            trackers[slot] = socket.send(memoryview(out).cast('B'), copy=False, track=True)
+            slot = (slot + 1) % RING_SIZE
+
+        socket.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Motion vector producer for Examples/zmq-demo/mv_receiver.js')
+    parser.add_argument('--mode', choices=MODES, default='zoom')
+    parser.add_argument('--size', default='1920x1080', help='Video size, the grid is in 16x16 macroblocks')
+    parser.add_argument('--fps', type=float, default=25.0)
+    parser.add_argument('--scale', type=float, default=8.0, help='Peak vector length')
+    parser.add_argument('--source', default='', help='Image for "image" mode, .mvcap or .npy capture for "replay" mode')
+    parser.add_argument('--url', default=DEFAULT_URL)
+    parser.add_argument('--bench', type=int, default=0, help='Only time N fields and exit')
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.split('x'))
+    producer = MvProducer(url=args.url, mode=args.mode, scale=args.scale, source=args.source)
+    producer.set_video(width, height, args.fps, 0)
+
+    if args.bench:
+        hist = LatencyHistogram()
+        for i in range(args.bench):
+            t0 = time.perf_counter()
+            producer.next_field(i % RING_SIZE)
+            hist.add(time.perf_counter() - t0)
+        rows, cols = mb_grid(width, height)
+        print(f'{args.mode} {cols}x{rows} MBs: mean={hist.mean() * 1000:.3f} p99={hist.percentile(99) * 1000:.3f} '
+              f'max={hist.max * 1000:.3f} ms, budget {1000 / args.fps:.1f} ms')
+        return
+
+    producer.start()
+    try:
+        while producer.running:
+            time.sleep(0.2)
+    except KeyboardInterrupt:
+        pass
+    producer.stop()
+
+
+if __name__ == '__main__':
+    main()
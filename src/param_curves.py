@@ -0,0 +1,100 @@
+import json
+import re
+from typing import Dict, List, NamedTuple, Tuple
+
+import numpy as np
+
+# Keyframed script parameters. Text form, one parameter per line:
+#   pan_x: 0=0 100=12.5:smooth 250=0:step
+# The interpolation after a key applies to the segment that starts at that key, 'linear' when omitted.
+
+INTERPOLATIONS = ('linear', 'smooth', 'step')
+
+class CurveError(ValueError):
+    pass
+
+
+class Keyframe(NamedTuple):
+    frame: int
+    value: float
+    interp: str = 'linear'
+
+
+Curves = Dict[str, List[Keyframe]]
+
+_KEY_RE = re.compile(r'^(-?\d+)=([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)(?::(\w+))?$')
+
+
+def parse_curves(text: str) -> Curves:
+    curves: Curves = {}
+    for line_no, line in enumerate(text.splitlines(), 1):
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        if ':' not in line:
+            raise CurveError(f'Line {line_no}: expected "name: frame=value ..."')
+        name, keys_text = line.split(':', 1)
+        name = name.strip()
+        keys = []
+        for token in keys_text.split():
+            match = _KEY_RE.match(token)
+            if not match:
+                raise CurveError(f'Line {line_no}: bad keyframe "{token}"')
+            interp = match.group(3) or 'linear'
+            if interp not in INTERPOLATIONS:
+                raise CurveError(f'Line {line_no}: unknown interpolation "{interp}", one of: {", ".join(INTERPOLATIONS)}')
+            keys.append(Keyframe(int(match.group(1)), float(match.group(2)), interp))
+        if not name or not keys:
+            raise CurveError(f'Line {line_no}: no name or keyframes')
+        curves[name] = sorted(keys, key=lambda k: k.frame)
+    return curves
+
+
+def format_curves(curves: Curves) -> str:
+    lines = []
+    for name, keys in curves.items():
+        tokens = [f'{k.frame}={k.value:g}' + (f':{k.interp}' if k.interp != 'linear' else '') for k in keys]
+        lines.append(f'{name}: {" ".join(tokens)}')
+    return '\n'.join(lines)
+
+
+def curves_to_json(curves: Curves) -> str:
+    return json.dumps({name: [list(k) for k in keys] for name, keys in curves.items()}, separators=(',', ':')) if curves else ''
+
+
+def curves_from_json(text: str) -> Curves:
+    if not text:
+        return {}
+    return {name: [Keyframe(int(f), float(v), str(i)) for f, v, i in keys] for name, keys in json.loads(text).items()}
+
+
+def evaluate_curve(keys: List[Keyframe], frames: np.ndarray) -> np.ndarray:
+    '''Vectorized evaluation, values hold before the first and after the last keyframe'''
+    key_frames = np.array([k.frame for k in keys], dtype=np.float64)
+    key_values = np.array([k.value for k in keys], dtype=np.float64)
+    if len(keys) == 1:
+        return np.full(frames.shape, key_values[0])
+
+    seg = np.clip(np.searchsorted(key_frames, frames, side='right') - 1, 0, len(keys) - 2)
+    f0 = key_frames[seg]
+    f1 = key_frames[seg + 1]
+    t = np.clip((frames - f0) / np.maximum(f1 - f0, 1), 0.0, 1.0)
+
+    interp = np.array([INTERPOLATIONS.index(k.interp) for k in keys])[seg]
+    t = np.where(interp == INTERPOLATIONS.index('smooth'), t * t * (3 - 2 * t), t)
+    t = np.where(interp == INTERPOLATIONS.index('step'), (t >= 1.0).astype(np.float64), t)
+    return key_values[seg] + (key_values[seg + 1] - key_values[seg]) * t
+
+
+def compile_curves(curves: Curves) -> Tuple[List[str], int, np.ndarray]:
+    '''Per frame lookup table, row-major [frame][parameter], covering frame 0 up to the last keyframe.
+    Scripts index it with a clamped frame number, no interpolation at run time.'''
+    names = list(curves)
+    if not names:
+        return [], 0, np.zeros(0)
+    last = max(max(k.frame for k in keys) for keys in curves.values())
+    frames = np.arange(max(last, 0) + 1, dtype=np.float64)
+    table = np.empty((len(frames), len(names)), dtype=np.float64)
+    for i, name in enumerate(names):
+        table[:, i] = evaluate_curve(curves[name], frames)
+    return names, len(frames), table.ravel()
@@ -6,9 +6,10 @@ class Script:
         MAIN = 1
         HELPER = 2
 
-    def __init__(self, path = '', parameters='', buildin=False):
+    def __init__(self, path = '', parameters='', buildin=False, curves=''):
         self.path = path
         self.parameters = parameters
+        self.curves = curves # Keyframed parameters, JSON, see param_curves.py
         self.type = Script.Type.MAIN
         self.is_filter = False  # -vf script="script.js"
         self.is_in_project = False
@@ -0,0 +1,192 @@
+import json
+import locale
+import os
+import re
+from typing import Dict, List, NamedTuple
+
+from lib.colored_print import print_error
+from lib.misc import normalize_path
+from script import Script
+
+#pylint: disable=broad-except
+
+INDEX_VERSION = 1
+SCRIPT_EXTS = ('.js', '.mjs', '.py')
+
+_MAIN_RE = re.compile(r'export +function +(glitch_frame|filter) *\(')
+_IMPORT_RE = re.compile(r'from\s+["\'](.+?)["\']|import\s+["\'](.+?)["\']')
+
+
+class ScriptInfo(NamedTuple):
+    mtime_ns: int
+    size: int
+    is_main: bool
+    is_filter: bool
+    imports: List[str] # As written in the source, e.g. "./helpers.mjs", "zmq"
+
+
+def parse_script(source: str, mtime_ns=0, size=0) -> ScriptInfo:
+    main = _MAIN_RE.search(source)
+    imports = [m.group(1) or m.group(2) for m in _IMPORT_RE.finditer(source)]
+    return ScriptInfo(mtime_ns, size, bool(main), bool(main) and main.group(1) == 'filter', imports)
+
+
+def _starting_underscore(name):
+    name = os.path.splitext(name)[0]
+    return re.sub(r'^(_+)', 'ZZZ', name)
+
+def resolve_import(path, specifier):
+    '''File an import specifier of `path` refers to, resolved like fflive does for relative modules.
+    None for specifiers that aren't files, e.g. the "zmq" module.'''
+    resolved = normalize_path(os.path.join(os.path.dirname(path), specifier))
+    if not resolved.endswith(('.js', '.mjs')):
+        resolved += '.js'
+    return resolved if os.path.isfile(resolved) else None
+
+
+def sort_key(name):
+    '''Collation key of a file name, same order as locale.strcoll, names starting with _ go last'''
+    return locale.strxfrm(_starting_underscore(name))
+
+
+class ScriptIndex:
+    '''Persistent per file cache of what the script list needs to know about each script.
+    A file is read again only when its mtime or size changed.'''
+
+    def __init__(self, cache_path=''):
+        self.cache_path = cache_path
+        self.entries: Dict[str, ScriptInfo] = {}
+        self.dirty = False
+        self.parsed = 0
+        self._seen = set()
+        # Import graph, edges come from the cached entries, the reverse edges are rebuilt when an entry changed
+        self.generation = 0
+        self._dependents: Dict[str, List[str]] = None
+        self._dependents_generation = -1
+
+    def load(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != INDEX_VERSION or data.get('locale') != locale.setlocale(locale.LC_COLLATE):
+                return
+            self.entries = {path: ScriptInfo(*entry) for path, entry in data.get('scripts', {}).items()}
+            self.generation += 1
+        except Exception as e:
+            print_error('Error loading script index:', e)
+            self.entries = {}
+
+    def save(self):
+        if not self.cache_path or not self.dirty:
+            return
+        try:
+            tmp_path = self.cache_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'version': INDEX_VERSION,
+                    'locale': locale.setlocale(locale.LC_COLLATE),
+                    'scripts': {path: list(info) for path, info in self.entries.items()},
+                }, f, separators=(',', ':'))
+            os.replace(tmp_path, self.cache_path)
+            self.dirty = False
+        except Exception as e:
+            print_error('Error saving script index:', e)
+
+    def begin_scan(self):
+        self._seen = set()
+        self.parsed = 0
+
+    def end_scan(self, roots: List[str]):
+        '''Drop entries under the scanned roots that weren't seen, they were deleted or renamed'''
+        prefixes = tuple(normalize_root(root) for root in roots if root)
+        for path in [p for p in self.entries if p.startswith(prefixes) and p not in self._seen]:
+            del self.entries[path]
+            self.dirty = True
+            self.generation += 1
+
+    def info(self, path) -> ScriptInfo:
+        self._seen.add(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            if self.entries.pop(path, None):
+                self.dirty = True
+                self.generation += 1
+            return None
+        info = self.entries.get(path)
+        if info and info.mtime_ns == st.st_mtime_ns and info.size == st.st_size:
+            return info
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                info = parse_script(f.read(), st.st_mtime_ns, st.st_size)
+        except (OSError, UnicodeDecodeError) as e:
+            print_error(f'Error reading script {path}:', e)
+            info = ScriptInfo(st.st_mtime_ns, st.st_size, False, False, [])
+        self.entries[path] = info
+        self.parsed += 1
+        self.dirty = True
+        self.generation += 1
+        return info
+
+    def script(self, path, buildin=False) -> Script:
+        script = Script(path, buildin=buildin)
+        info = self.info(path)
+        if info:
+            script.type = Script.Type.MAIN if info.is_main else Script.Type.HELPER
+            script.is_filter = info.is_filter
+        else:
+            script.type = Script.Type.HELPER
+        return script
+
+
+    def imports(self, path) -> List[str]:
+        '''Files directly imported by a script'''
+        info = self.info(path)
+        if not info:
+            return []
+        resolved = (resolve_import(path, specifier) for specifier in info.imports)
+        return list(dict.fromkeys(p for p in resolved if p and p != path))
+
+    def dependencies(self, path) -> List[str]:
+        '''Every file a script imports, directly or through other helpers, in import order'''
+        ret = []
+        seen = {path}
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            new = [p for p in self.imports(current) if p not in seen]
+            seen.update(new)
+            ret.extend(new)
+            stack.extend(reversed(new))
+        return ret
+
+    def dependents(self, path) -> List[str]:
+        '''Indexed scripts that import `path`, directly or through other helpers'''
+        if self._dependents_generation != self.generation:
+            self._dependents = {}
+            for script_path in list(self.entries):
+                for imported in self.imports(script_path):
+                    self._dependents.setdefault(imported, []).append(script_path)
+            # After the loop, imports() may have re-parsed changed files
+            self._dependents_generation = self.generation
+        ret = []
+        seen = {path}
+        stack = [path]
+        while stack:
+            for script_path in self._dependents.get(stack.pop(), []):
+                if script_path not in seen:
+                    seen.add(script_path)
+                    ret.append(script_path)
+                    stack.append(script_path)
+        return sorted(ret)
+
+
+def normalize_root(root):
+    root = root.replace('\\', '/')
+    return root if root.endswith('/') else root + '/'
+
+
+def is_script_file(name):
+    return name.endswith(SCRIPT_EXTS)
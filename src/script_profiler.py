@@ -0,0 +1,129 @@
+import os
+import re
+import struct
+import threading
+from collections import deque
+from typing import List, NamedTuple, Tuple
+
+import numpy as np
+
+from lib.misc import normalize_path
+
+# Per frame profile published by the script wrapper next to the telemetry record (see script_wrapper.py):
+#   tag 'LMTP', frame number, function count N,
+#   N x float64 inclusive time [ms], N x float64 self time [ms], N x uint32 calls
+# Function 0 is the script entry point (glitch_frame/filter), the rest are exported helper functions.
+PROFILE_TAG = b'LMTP'
+PROFILE_HEADER = '<4siI'
+PROFILE_HEADER_SIZE = struct.calcsize(PROFILE_HEADER)
+
+_EXPORT_FUNCTION_RE = re.compile(r'^([ \t]*)export\s+function\s+([A-Za-z_$][\w$]*)\s*\(', re.MULTILINE)
+
+
+def profile_size(count):
+    return PROFILE_HEADER_SIZE + count * (8 + 8 + 4)
+
+
+def instrument_source(source: str, first_id: int, prefix: str) -> Tuple[str, List[str]]:
+    '''Route every `export function name(` through globalThis.livemosher_prof_call. The wrapper stays a
+    hoisted function declaration and is put on the same line, so error line numbers don't move.'''
+    names = []
+    def replace(match):
+        indent, name = match.group(1), match.group(2)
+        func_id = first_id + len(names)
+        names.append(f'{prefix}{name}')
+        return (f'{indent}export function {name}(...lm_args) {{ return globalThis.livemosher_prof_call({func_id}, {name}__lm, this, lm_args); }} '
+                f'function {name}__lm(')
+    return _EXPORT_FUNCTION_RE.sub(replace, source), names
+
+
+def instrument_scripts(script_path, helper_paths: List[str], out_dir) -> Tuple[str, List[str]]:
+    '''Copy the script and its helpers to `out_dir`, keeping their relative layout so the imports resolve
+    to the instrumented copies. Returns the path of the copied script and the names of the profiled functions.'''
+    helper_paths = [p for p in helper_paths if p.endswith(('.js', '.mjs'))]
+    if not helper_paths:
+        return script_path, []
+    paths = [os.path.abspath(p) for p in [script_path, *helper_paths]]
+    root = os.path.commonpath([os.path.dirname(p) for p in paths])
+    names = []
+    for i, path in enumerate(paths):
+        with open(path, 'r', encoding='utf-8') as f:
+            source = f.read()
+        if i > 0:
+            source, new_names = instrument_source(source, 1 + len(names), f'{os.path.basename(path)}:')
+            names.extend(new_names)
+        dst = os.path.join(out_dir, os.path.relpath(path, root))
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        with open(dst, 'w', encoding='utf-8', newline='\n') as f:
+            f.write(source)
+    return normalize_path(os.path.join(out_dir, os.path.relpath(paths[0], root))), names
+
+
+class FunctionStats(NamedTuple):
+    name: str
+    calls: int
+    total_ms: float
+    self_ms: float
+
+
+class ScriptProfiler:
+    '''Collects the profile records. Fed from the ZMQ I/O thread, read from the GUI.'''
+
+    def __init__(self, history=600):
+        self.history = history
+        self.names: List[str] = []
+        self.frames = 0
+        self.bad_messages = 0
+        self.frame_ms = deque(maxlen=history)
+        self._total = np.zeros(0)
+        self._self = np.zeros(0)
+        self._calls = np.zeros(0, dtype=np.int64)
+        self._lock = threading.Lock()
+
+    def reset(self, names: List[str] = None):
+        with self._lock:
+            if names is not None:
+                self.names = list(names)
+            self.frames = 0
+            self.frame_ms.clear()
+            self._total = np.zeros(len(self.names))
+            self._self = np.zeros(len(self.names))
+            self._calls = np.zeros(len(self.names), dtype=np.int64)
+
+    def on_message(self, msg: bytes):
+        if len(msg) < PROFILE_HEADER_SIZE or not msg.startswith(PROFILE_TAG):
+            self.bad_messages += 1
+            return
+        _tag, _frame_num, count = struct.unpack_from(PROFILE_HEADER, msg)
+        with self._lock:
+            if count != len(self.names) or len(msg) != profile_size(count):
+                self.bad_messages += 1
+                return
+            total = np.frombuffer(msg, '<f8', count, PROFILE_HEADER_SIZE)
+            self_ms = np.frombuffer(msg, '<f8', count, PROFILE_HEADER_SIZE + count * 8)
+            calls = np.frombuffer(msg, '<u4', count, PROFILE_HEADER_SIZE + count * 16)
+            self._total += total
+            self._self += self_ms
+            self._calls += calls
+            self.frame_ms.append(float(total[0]))
+            self.frames += 1
+
+    def summary(self) -> List[FunctionStats]:
+        '''Per function totals since the last reset, most self time first'''
+        with self._lock:
+            rows = [FunctionStats(name, int(self._calls[i]), float(self._total[i]), float(self._self[i]))
+                    for i, name in enumerate(self.names)]
+        return sorted(rows, key=lambda row: row.self_ms, reverse=True)
+
+    def histogram(self, bins=20, max_ms=None) -> Tuple[np.ndarray, np.ndarray]:
+        '''Counts and bin edges of the entry point time over the last `history` frames'''
+        with self._lock:
+            values = np.array(self.frame_ms)
+        if not len(values):
+            return np.zeros(bins, dtype=np.int64), np.linspace(0, max_ms or 1, bins + 1)
+        return np.histogram(values, bins=bins, range=(0, max_ms or max(float(values.max()), 1e-3)))
+
+    def percentiles(self, q=(50, 95, 99)) -> List[float]:
+        with self._lock:
+            values = np.array(self.frame_ms)
+        return list(np.percentile(values, q)) if len(values) else []
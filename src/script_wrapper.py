@@ -0,0 +1,412 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+from typing import Dict, List, Tuple
+
+from lib.colored_print import print_error
+from lib.misc import normalize_path
+from script import Script
+from script_profiler import PROFILE_HEADER_SIZE, PROFILE_TAG, instrument_scripts, profile_size
+from telemetry import TELEMETRY_SIZE, TELEMETRY_TAG
+
+#pylint: disable=broad-except
+
+WRAPPABLE_EXTS = ('.js', '.mjs')
+_RELATIVE_IMPORT_RE = re.compile(r'''((?:\bfrom|\bimport)\s*\(?\s*)(["'])(\.\.?/[^"']*)\2''')
+
+_HEADER = '''\
+// Generated by Live Mosher for $SCRIPT_NAME
+// Don't edit, it's rewritten on every run and when the script is saved
+$IMPORTS
+import * as script from $SCRIPT_PATH;
+
+const now_ms = (typeof performance !== "undefined") ? () => performance.now() : () => Date.now();
+'''
+
+_TELEMETRY = '''
+const TELEMETRY_URL = $TELEMETRY_URL;
+const TELEMETRY_TAG = $TELEMETRY_TAG;
+const TELEMETRY_SIZE = $TELEMETRY_SIZE;
+const tm_buf = new ArrayBuffer(TELEMETRY_SIZE);
+const tm_view = new DataView(tm_buf);
+const tm_bytes = new Uint8Array(tm_buf);
+let tm_pub;
+let tm_msg;
+let tm_seq = 0;
+
+function telemetry_setup()
+{
+  // Kept when fflive reloads the rewritten wrapper
+  tm_pub = globalThis.livemosher_tm_pub;
+  if ( !tm_pub )
+  {
+    const ctx = new zmq.Context();
+    tm_pub = globalThis.livemosher_tm_pub = ctx.socket(zmq.PUB);
+    tm_pub.connect(TELEMETRY_URL);
+  }
+  tm_msg = new Uint8FFArray(TELEMETRY_SIZE);
+  for ( let i = 0; i < TELEMETRY_TAG.length; i++ )
+    tm_view.setUint8(i, TELEMETRY_TAG.charCodeAt(i));
+}
+
+function telemetry_send(frame_num, pts, script_ms)
+{
+  tm_view.setUint32(4, tm_seq++, true);
+  tm_view.setInt32(8, frame_num, true);
+  tm_view.setFloat64(12, (pts === undefined || pts === null) ? NaN : Number(pts), true);
+  tm_view.setFloat64(20, Date.now() / 1000, true);
+  tm_view.setFloat64(28, script_ms, true);
+  for ( let i = 0; i < TELEMETRY_SIZE; i++ )
+    tm_msg[i] = tm_bytes[i];
+  tm_pub.send(tm_msg, zmq.DONTWAIT);
+}
+'''
+
+_MIDI_AUTOMATION = '''
+// Recorded MIDI automation, frame number -> [[status, data1, data2], ...]
+const MIDI_AUTOMATION = $MIDI_AUTOMATION;
+const MIDI_QUEUE_MAX = 4096;
+
+// Every MIDIInput (midi.js) reads its messages from rtmidi.In, the queued automation is read first.
+// While the queue isn't empty the input reports an open port, so it's read without a MIDI device.
+function midi_automation_setup()
+{
+  if ( globalThis.livemosher_midi_queue )
+    return; // Patched before this reload of the wrapper
+  const queue = globalThis.livemosher_midi_queue = [];
+  const proto = rtmidi.In.prototype;
+  const is_port_open = proto.isPortOpen;
+  const get_message = proto.getMessage;
+  proto.isPortOpen = function () { return queue.length > 0 || is_port_open.call(this); };
+  proto.getMessage = function () { return queue.length > 0 ? queue.shift() : get_message.call(this); };
+}
+
+function midi_automation_queue(frame_num)
+{
+  const events = MIDI_AUTOMATION[frame_num];
+  if ( events === undefined )
+    return;
+  const queue = globalThis.livemosher_midi_queue;
+  for ( const msg of events )
+    queue.push(msg);
+  if ( queue.length > MIDI_QUEUE_MAX )
+    queue.splice(0, queue.length - MIDI_QUEUE_MAX);
+}
+'''
+
+_PARAMS = '''
+// Keyframed parameters pre-evaluated per frame, row-major [frame][parameter]
+const PARAM_NAMES = $PARAM_NAMES;
+const PARAM_FRAMES = $PARAM_FRAMES;
+const PARAM_TABLE = new Float64Array($PARAM_TABLE);
+const param_values = {};
+let script_params;
+globalThis.livemosher_params = param_values;
+
+function params_update(frame_num)
+{
+  const row = Math.min(Math.max(frame_num, 0), PARAM_FRAMES - 1) * PARAM_NAMES.length;
+  for ( let i = 0; i < PARAM_NAMES.length; i++ )
+  {
+    const value = PARAM_TABLE[row + i];
+    param_values[PARAM_NAMES[i]] = value;
+    if ( script_params )
+      script_params[PARAM_NAMES[i]] = value;
+  }
+}
+
+function params_setup(args)
+{
+  // Mirrored only into a params object passed with -sp. A missing or scalar args.params is left as it is,
+  // scripts doing math on it would get an object, they can read globalThis.livemosher_params instead.
+  if ( typeof args.params === "object" && args.params !== null )
+    script_params = args.params;
+  params_update($FRAME_COUNTER_OFF);
+}
+'''
+
+_PROFILER = '''
+// Per frame profile, sent on the telemetry socket. Function 0 is the entry point,
+// instrumented helpers call prof_call() through globalThis.livemosher_prof_call
+const PROF_TAG = $PROFILE_TAG;
+const PROF_COUNT = $PROFILE_COUNT;
+const PROF_HEADER_SIZE = $PROFILE_HEADER_SIZE;
+const PROF_SIZE = $PROFILE_SIZE;
+const prof_total = new Float64Array(PROF_COUNT);
+const prof_self = new Float64Array(PROF_COUNT);
+const prof_calls = new Uint32Array(PROF_COUNT);
+const prof_buf = new ArrayBuffer(PROF_SIZE);
+const prof_view = new DataView(prof_buf);
+const prof_bytes = new Uint8Array(prof_buf);
+let prof_msg;
+// Time spent in instrumented callees of each open call, [0] is the entry point
+let prof_stack = [ 0 ];
+
+function prof_call(id, fn, self, args)
+{
+  prof_stack.push(0);
+  const t0 = now_ms();
+  try
+  {
+    return fn.apply(self, args);
+  }
+  finally
+  {
+    const dt = now_ms() - t0;
+    prof_total[id] += dt;
+    prof_self[id] += dt - prof_stack.pop();
+    prof_calls[id]++;
+    prof_stack[prof_stack.length - 1] += dt;
+  }
+}
+globalThis.livemosher_prof_call = prof_call;
+
+function prof_setup()
+{
+  prof_msg = new Uint8FFArray(PROF_SIZE);
+  for ( let i = 0; i < PROF_TAG.length; i++ )
+    prof_view.setUint8(i, PROF_TAG.charCodeAt(i));
+  prof_view.setUint32(8, PROF_COUNT, true);
+}
+
+function prof_begin()
+{
+  prof_total.fill(0);
+  prof_self.fill(0);
+  prof_calls.fill(0);
+  prof_stack = [ 0 ];
+}
+
+function prof_send(frame_num, script_ms)
+{
+  prof_total[0] = script_ms;
+  prof_self[0] = script_ms - prof_stack[0];
+  prof_calls[0] = 1;
+  prof_view.setInt32(4, frame_num, true);
+  for ( let i = 0; i < PROF_COUNT; i++ )
+  {
+    prof_view.setFloat64(PROF_HEADER_SIZE + i * 8, prof_total[i], true);
+    prof_view.setFloat64(PROF_HEADER_SIZE + (PROF_COUNT + i) * 8, prof_self[i], true);
+    prof_view.setUint32(PROF_HEADER_SIZE + PROF_COUNT * 16 + i * 4, prof_calls[i], true);
+  }
+  for ( let i = 0; i < PROF_SIZE; i++ )
+    prof_msg[i] = prof_bytes[i];
+  tm_pub.send(prof_msg, zmq.DONTWAIT);
+}
+'''
+
+_SETUP = '''
+export function setup(args)
+{
+$PRE_SETUP_HOOKS
+  let ret;
+  if ( script.setup )
+    ret = script.setup(args);
+$SETUP_HOOKS
+  return ret;
+}
+'''
+
+_GLITCH_FRAME = '''
+export function glitch_frame(frame, stream)
+{
+  const frame_num = frame.frame_num;
+$BEFORE_HOOKS
+  const t0 = now_ms();
+  const ret = script.glitch_frame(frame, stream);
+  const script_ms = now_ms() - t0;
+$AFTER_HOOKS
+  return ret;
+}
+'''
+
+_FILTER = '''
+const FRAME_COUNTER_OFF = $FRAME_COUNTER_OFF;
+let filter_frames = 0;
+
+export function filter(args)
+{
+  const frame_num = args.frame_num ?? (FRAME_COUNTER_OFF + filter_frames++);
+  const frame = args;
+$BEFORE_HOOKS
+  const t0 = now_ms();
+  const ret = script.filter(args);
+  const script_ms = now_ms() - t0;
+$AFTER_HOOKS
+  return ret;
+}
+'''
+
+
+def _fill(template: str, **values):
+    for key, value in values.items():
+        template = template.replace(f'${key}', value)
+    return template
+
+def _indent(lines):
+    return '\n'.join(f'  {line}' for line in lines)
+
+def versioned_path(script_path, out_dir, version):
+    name, ext = os.path.splitext(os.path.basename(script_path))
+    return normalize_path(os.path.join(out_dir, f'{name}.v{version}{ext}'))
+
+def versioned_copy(script_path, import_path, out_dir, version):
+    '''Copy of the script under a new module name. Its relative imports are made absolute, resolved from
+    `import_path`, the script or its instrumented copy, so they keep loading the same files.'''
+    with open(script_path, 'r', encoding='utf-8') as f:
+        source = f.read()
+    import_dir = os.path.dirname(os.path.abspath(import_path))
+    source = _RELATIVE_IMPORT_RE.sub(
+        lambda m: m.group(1) + json.dumps(normalize_path(os.path.join(import_dir, m.group(3)))), source)
+    os.makedirs(out_dir, exist_ok=True)
+    path = versioned_path(script_path, out_dir, version)
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        f.write(source)
+    return path
+
+
+class ScriptWrapper:
+    '''Generates a JS module that imports the selected script and wraps its entry points
+    (setup, glitch_frame/filter) to hook app features into the script runtime without touching the script.'''
+
+    def __init__(self):
+        self.wrapper_dir = ''
+        self.profile_names: List[str] = [] # Functions profiled by the last generated wrapper
+        self.script: Script = None # Wrapped by the last generated wrapper, None when not wrapped
+        self.path = '' # Of the last generated wrapper
+        self.version = 0 # Reloads of the script since the wrapper was generated
+        self._import_path = '' # The script or its instrumented copy
+        self._imports: List[str] = []
+        self._parts: List[Tuple[str, dict]] = [] # Templates filled when the source is written
+        self._hooks: Dict[str, List[str]] = {}
+
+    def can_wrap(self, script: Script):
+        return bool(script and script.path and script.type == Script.Type.MAIN
+                    and os.path.splitext(script.path)[1].lower() in WRAPPABLE_EXTS)
+
+    def generate(self, script: Script, start_frame=0, telemetry_url='', midi_automation: dict = None, param_table=None,
+                 profile=False, profile_helpers: List[str] = None):
+        '''Write the wrapper module and return its path. Returns the script's own path when nothing to wrap.
+        `param_table` is (names, frames, values) from param_curves.compile_curves().
+        `profile` needs the telemetry channel, `profile_helpers` are helper files whose exported functions get profiled too.'''
+        self.profile_names = []
+        self.script = None
+        self.version = 0
+        profile = profile and bool(telemetry_url)
+        if not self.can_wrap(script) or not (telemetry_url or midi_automation or (param_table and param_table[0])):
+            return script.path
+
+        imports = []
+        hooks = {'PRE_SETUP_HOOKS': [], 'SETUP_HOOKS': [], 'BEFORE_HOOKS': [], 'AFTER_HOOKS': []}
+        parts = []
+
+        if telemetry_url:
+            imports.append('import * as zmq from "zmq";')
+            parts.append((_TELEMETRY, dict(TELEMETRY_URL=json.dumps(telemetry_url),
+                                           TELEMETRY_TAG=json.dumps(TELEMETRY_TAG.decode('ascii')),
+                                           TELEMETRY_SIZE=str(TELEMETRY_SIZE))))
+            hooks['SETUP_HOOKS'].append('telemetry_setup();')
+            hooks['AFTER_HOOKS'].append('telemetry_send(frame_num, frame.pts, script_ms);')
+
+        if midi_automation:
+            parts.append((_MIDI_AUTOMATION,
+                          dict(MIDI_AUTOMATION=json.dumps({str(k): v for k, v in midi_automation.items()}, separators=(',', ':')))))
+            imports.append('import * as rtmidi from "rtmidi";')
+            hooks['PRE_SETUP_HOOKS'].append('midi_automation_setup();')
+            hooks['BEFORE_HOOKS'].append('midi_automation_queue(frame_num);')
+
+        if param_table and param_table[0]:
+            names, frames, values = param_table
+            parts.append((_PARAMS, dict(PARAM_NAMES=json.dumps(names),
+                                        PARAM_FRAMES=str(frames),
+                                        PARAM_TABLE=json.dumps([float(f'{v:.6g}') for v in values], separators=(',', ':')))))
+            hooks['PRE_SETUP_HOOKS'].append('params_setup(args);')
+            hooks['BEFORE_HOOKS'].append('params_update(frame_num);')
+
+        try:
+            if not self.wrapper_dir or not os.path.isdir(self.wrapper_dir):
+                self.wrapper_dir = tempfile.mkdtemp(prefix='livemosher_')
+        except Exception as e:
+            print_error('ScriptWrapper.generate:', e)
+            return script.path
+
+        script_path = script.path
+        if profile:
+            entry_name = 'filter' if script.is_filter else 'glitch_frame'
+            helper_names = []
+            if profile_helpers:
+                try:
+                    profile_dir = os.path.join(self.wrapper_dir, 'profile')
+                    shutil.rmtree(profile_dir, ignore_errors=True)
+                    script_path, helper_names = instrument_scripts(script.path, profile_helpers, profile_dir)
+                except Exception as e:
+                    print_error('Error instrumenting helpers for profiling:', e)
+                    script_path, helper_names = script.path, []
+            self.profile_names = [f'{os.path.basename(script.path)}:{entry_name}', *helper_names]
+            parts.append((_PROFILER, dict(PROFILE_TAG=json.dumps(PROFILE_TAG.decode('ascii')),
+                                          PROFILE_COUNT=str(len(self.profile_names)),
+                                          PROFILE_HEADER_SIZE=str(PROFILE_HEADER_SIZE),
+                                          PROFILE_SIZE=str(profile_size(len(self.profile_names))))))
+            hooks['SETUP_HOOKS'].append('prof_setup();')
+            # Last before hook, the time of the other hooks isn't the script's
+            hooks['BEFORE_HOOKS'].append('prof_begin();')
+            hooks['AFTER_HOOKS'].append('prof_send(frame_num, script_ms);')
+
+        shutil.rmtree(os.path.join(self.wrapper_dir, 'versions'), ignore_errors=True)
+        self._import_path = script_path
+        self._imports = imports
+        self._parts = parts
+        self._hooks = hooks
+        ext = os.path.splitext(script.path)[1]
+        path = normalize_path(os.path.join(self.wrapper_dir, f'wrap_{os.path.splitext(os.path.basename(script.path))[0]}{ext}'))
+        if not self._write(path, script, script_path, start_frame):
+            return script.path
+        self.script = script
+        self.path = path
+        return path
+
+    def reload(self, start_frame=0) -> bool:
+        '''Make the running wrapper import the edited script. The script is copied under a new name, the module
+        of the old one stays cached in fflive, and the wrapper is rewritten in place so fflive reloads it.'''
+        if not self.script:
+            return False
+        try:
+            version = self.version + 1
+            copy_path = versioned_copy(self.script.path, self._import_path, os.path.join(self.wrapper_dir, 'versions'), version)
+        except Exception as e:
+            print_error('ScriptWrapper.reload:', e)
+            return False
+        if not self._write(self.path, self.script, copy_path, start_frame):
+            return False
+        self.version = version
+        old_copy = versioned_path(self.script.path, os.path.join(self.wrapper_dir, 'versions'), version - 2)
+        if os.path.exists(old_copy):
+            os.remove(old_copy)
+        return True
+
+    def _write(self, path, script: Script, import_path, start_frame) -> bool:
+        start_frame = str(int(start_frame or 0))
+        entry = _FILTER if script.is_filter else _GLITCH_FRAME
+        source = _fill(_HEADER,
+                       SCRIPT_NAME=os.path.basename(script.path),
+                       IMPORTS='\n'.join(self._imports),
+                       SCRIPT_PATH=json.dumps(normalize_path(os.path.abspath(import_path))))
+        source += ''.join(_fill(template, FRAME_COUNTER_OFF=start_frame, **values) for template, values in self._parts)
+        source += _fill(_SETUP, **{key: _indent(self._hooks[key]) for key in ('PRE_SETUP_HOOKS', 'SETUP_HOOKS')})
+        source += _fill(entry, FRAME_COUNTER_OFF=start_frame,
+                        **{key: _indent(self._hooks[key]) for key in ('BEFORE_HOOKS', 'AFTER_HOOKS')})
+        try:
+            with open(path, 'w', encoding='utf-8', newline='\n') as f:
+                f.write(source)
+            return True
+        except Exception as e:
+            print_error('ScriptWrapper.generate:', e)
+            return False
+
+    def cleanup(self):
+        if self.wrapper_dir:
+            shutil.rmtree(self.wrapper_dir, ignore_errors=True)
+            self.wrapper_dir = ''
+        self.script = None
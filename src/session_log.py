@@ -0,0 +1,269 @@
+import os
+import queue
+import re
+import threading
+import time
+from typing import Iterable, List, NamedTuple, Tuple
+
+import numpy as np
+
+from lib.colored_print import print_error
+
+#pylint: disable=broad-except
+
+# Session log layout, one set of files per app session in the log dir
+#   <session>.log      the lines of all processes, UTF-8 without ANSI codes, one per line
+#   <session>.logidx   one INDEX_DTYPE record per line, so lines are found by time, process and level
+#                      without scanning or loading the text
+#   <session>.logproc  process names, one per line, the index stores the position in this list
+INDEX_DTYPE = np.dtype([('time', '<f8'), ('offset', '<i8'), ('process', 'u1'), ('level', 'u1')])
+LOG_EXT = '.log'
+INDEX_EXT = '.logidx'
+PROCESS_EXT = '.logproc'
+KEEP_SESSIONS = 20
+MAX_RESULTS = 100000
+SEARCH_CHUNK = 16 * 1024 * 1024
+
+# Same values as the libav AV_LOG_* levels, lower is more severe
+LEVEL_ERROR = 16
+LEVEL_WARNING = 24
+LEVEL_INFO = 32
+LEVEL_VERBOSE = 40
+LEVEL_NAMES = {LEVEL_ERROR: 'error', LEVEL_WARNING: 'warning', LEVEL_INFO: 'info', LEVEL_VERBOSE: 'verbose'}
+
+# fflive colors the lines by level, see _ff_play_colors in widget/ansi_colors.py
+_FF_COLOR_LEVELS = {12: LEVEL_ERROR, 14: LEVEL_WARNING, 7: LEVEL_INFO, 10: LEVEL_VERBOSE, 8: LEVEL_VERBOSE}
+_ANSI_COLOR_LEVELS = {31: LEVEL_ERROR, 91: LEVEL_ERROR, 33: LEVEL_WARNING, 93: LEVEL_WARNING}
+_SGR_RE = re.compile(r'\x1b\[([0-9;]*)m')
+_ANSI_RE = re.compile(r'\x1b(\[[0-9;=]*[a-zA-Z]|\([AB012])?')
+_ERROR_RE = re.compile(r'\b(error|failed|fatal|exception)\b', re.IGNORECASE)
+_WARNING_RE = re.compile(r'\bwarning\b', re.IGNORECASE)
+
+
+def line_level(text: str) -> int:
+    '''Level from the fflive/console colors, from the wording for the uncolored ffgac output'''
+    level = None
+    if '\x1b' in text:
+        for codes in _SGR_RE.findall(text):
+            for code in codes.split(';'):
+                if not code.isdigit():
+                    continue
+                code = int(code)
+                code_level = _FF_COLOR_LEVELS.get(code - 300) if code >= 300 else _ANSI_COLOR_LEVELS.get(code)
+                if code_level and (level is None or code_level < level):
+                    level = code_level
+    if level is not None:
+        return level
+    if _ERROR_RE.search(text):
+        return LEVEL_ERROR
+    if _WARNING_RE.search(text):
+        return LEVEL_WARNING
+    return LEVEL_INFO
+
+
+def strip_ansi(text: str) -> str:
+    return _ANSI_RE.sub('', text) if '\x1b' in text else text
+
+
+class LogLine(NamedTuple):
+    number: int
+    time: float
+    process: str
+    level: int
+    text: str
+
+
+class SessionLog:
+    '''Appends the output of all pipeline processes to the session files from a writer thread, `append` never
+    touches the disk. The index is also kept in memory for the queries, called from the GUI thread.'''
+
+    def __init__(self, log_dir: str, keep_sessions=KEEP_SESSIONS):
+        self.log_dir = log_dir
+        self.keep_sessions = keep_sessions
+        self.start_time = time.time()
+        self.name = time.strftime('%Y%m%d_%H%M%S', time.localtime(self.start_time))
+        self.path = os.path.join(log_dir, self.name)
+        self.processes: List[str] = []
+        self.thread: threading.Thread = None
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._index = np.zeros(4096, dtype=INDEX_DTYPE)
+        self._count = 0
+        self._size = 0
+        self._data_file = None
+        self._index_file = None
+        self._process_file = None
+
+    @property
+    def count(self):
+        return self._count
+
+    def start(self) -> bool:
+        try:
+            os.makedirs(self.log_dir, exist_ok=True)
+            self.remove_old_sessions()
+            self._data_file = open(self.path + LOG_EXT, 'wb')
+            self._index_file = open(self.path + INDEX_EXT, 'wb')
+            self._process_file = open(self.path + PROCESS_EXT, 'w', encoding='utf-8')
+        except OSError as e:
+            print_error(f'Error creating the session log in {self.log_dir}: {e}')
+            self.close_files()
+            return False
+        self.thread = threading.Thread(target=self._run, name='session_log')
+        self.thread.daemon = True
+        self.thread.start()
+        return True
+
+    def stop(self):
+        if self.thread:
+            self._queue.put(None)
+            self.thread.join(2.0)
+            self.thread = None
+        self.close_files()
+
+    def close_files(self):
+        for f in (self._data_file, self._index_file, self._process_file):
+            if f:
+                f.close()
+        self._data_file = self._index_file = self._process_file = None
+
+    def remove_old_sessions(self):
+        sessions = sorted({os.path.splitext(name)[0] for name in os.listdir(self.log_dir) if name.endswith(INDEX_EXT)})
+        for session in sessions[:max(0, len(sessions) - self.keep_sessions + 1)]:
+            for ext in (LOG_EXT, INDEX_EXT, PROCESS_EXT):
+                try:
+                    os.remove(os.path.join(self.log_dir, session + ext))
+                except OSError:
+                    pass
+
+    def append(self, process: str, lines: Iterable[Tuple[str, float]], level: int = None):
+        '''Queue (text, timestamp) lines, the level is taken from the text unless given'''
+        now = time.time()
+        lines = [(text, timestamp or now) for text, timestamp in lines]
+        if lines and self.thread:
+            self._queue.put((process, lines, level))
+
+    def _run(self):
+        while True:
+            batches = [self._queue.get()]
+            while not self._queue.empty():
+                batches.append(self._queue.get())
+            try:
+                self._write([b for b in batches if b is not None])
+            except Exception as e:
+                print_error(f'Session log write error: {e}')
+                break
+            if None in batches:
+                break
+
+    def _write(self, batches):
+        data = []
+        records = []
+        offset = self._size
+        for process, lines, level in batches:
+            if process not in self.processes:
+                self.processes.append(process)
+                self._process_file.write(process + '\n')
+                self._process_file.flush()
+            process_id = self.processes.index(process)
+            for text, timestamp in lines:
+                text_level = level or line_level(text)
+                encoded = (strip_ansi(text).strip('\r\n').replace('\n', ' ') + '\n').encode('utf-8', errors='replace')
+                data.append(encoded)
+                records.append((timestamp, offset, process_id, text_level))
+                offset += len(encoded)
+        if not records:
+            return
+        records = np.array(records, dtype=INDEX_DTYPE)
+        self._data_file.write(b''.join(data))
+        self._data_file.flush()
+        self._index_file.write(records.tobytes())
+        self._index_file.flush()
+
+        # Publish the lines only once their text is on disk
+        with self._lock:
+            count = self._count + len(records)
+            if count > len(self._index):
+                index = np.zeros(max(count, len(self._index) * 2), dtype=INDEX_DTYPE)
+                index[:self._count] = self._index[:self._count]
+                self._index = index
+            self._index[self._count:count] = records
+            self._count = count
+            self._size = offset
+
+    def index(self) -> np.ndarray:
+        return self._snapshot()[0]
+
+    def _snapshot(self) -> Tuple[np.ndarray, int]:
+        '''Published index records and the data size they cover'''
+        with self._lock:
+            return self._index[:self._count], self._size
+
+    def process_id(self, process: str):
+        return self.processes.index(process) if process in self.processes else None
+
+    def find(self, text='', max_level: int = None, process: str = None, max_results=MAX_RESULTS) -> np.ndarray:
+        '''Numbers of the lines containing `text` (ASCII case insensitive), at `max_level` or more severe.
+        Only a text search stops at `max_results`, the index alone filters millions of lines quickly.'''
+        index, size = self._snapshot()
+        mask = np.ones(len(index), dtype=bool)
+        if max_level is not None:
+            mask &= index['level'] <= max_level
+        if process:
+            process_id = self.process_id(process)
+            if process_id is None:
+                return np.zeros(0, dtype=np.int64)
+            mask &= index['process'] == process_id
+        if not text:
+            return np.flatnonzero(mask)
+
+        if not size:
+            return np.zeros(0, dtype=np.int64)
+        needle = text.lower().encode('utf-8')
+        offsets = np.ascontiguousarray(index['offset'])
+        found = []
+        found_cnt = 0
+        with open(self.path + LOG_EXT, 'rb') as f:
+            line = 0
+            # Whole lines per chunk, a match can't span chunks
+            while line < len(index) and found_cnt < max_results:
+                start = int(offsets[line])
+                end_line = max(line + 1, int(np.searchsorted(offsets, start + SEARCH_CHUNK)))
+                end = int(offsets[end_line]) if end_line < len(index) else size
+                f.seek(start)
+                data = f.read(end - start).lower()
+                positions = []
+                pos = data.find(needle)
+                while pos >= 0:
+                    positions.append(pos)
+                    pos = data.find(needle, data.find(b'\n', pos) + 1) # One result per line
+                if positions:
+                    lines = np.searchsorted(offsets, np.array(positions) + start, 'right') - 1
+                    lines = lines[mask[lines]]
+                    found.append(lines)
+                    found_cnt += len(lines)
+                line = end_line
+        return np.concatenate(found)[:max_results] if found else np.zeros(0, dtype=np.int64)
+
+    @staticmethod
+    def _line_end(index, size, line):
+        return int(index['offset'][line + 1]) if line + 1 < len(index) else size
+
+    def line_at_time(self, t: float, lines: np.ndarray = None) -> int:
+        '''Position of the first line logged at `t` or later, in `lines` when given'''
+        times = self.index()['time']
+        if lines is not None:
+            times = times[lines]
+        return int(np.searchsorted(times, t))
+
+    def read(self, lines: Iterable[int]) -> List[LogLine]:
+        index, size = self._snapshot()
+        result = []
+        with open(self.path + LOG_EXT, 'rb') as f:
+            for line in lines:
+                record = index[line]
+                f.seek(int(record['offset']))
+                text = f.read(self._line_end(index, size, line) - int(record['offset'])).decode('utf-8', errors='replace')
+                result.append(LogLine(int(line), float(record['time']), self.processes[record['process']],
+                                      int(record['level']), text.rstrip('\n')))
+        return result
@@ -0,0 +1,135 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from typing import List
+
+from pygments import lex
+
+from benchmark import TUTORIAL_CLIP, MPEG4_ARGS, Runner, default_bin_dir, find_scripts
+from lib.colored_print import print_error
+from widget.ansi_colors import AnsiColorLexer
+from widget.sgr_parser import SgrParser
+
+# Console coloring speed, the Pygments AnsiColorLexer path against the SgrParser, on recorded fflive output:
+#   python sgr_benchmark.py --record fflive.log   record fflive stderr colored the way the app runs it
+#   python sgr_benchmark.py fflive.log            compare both on the recording
+#   python sgr_benchmark.py --synthetic 50000     compare on generated lines in the fflive log format
+# Both have to give the same spans and tags, the benchmark fails otherwise.
+
+
+def record(out_path, bin_dir, script_path, frames):
+    '''Runs ffgac | fflive with the environment of LiveMosherApp.start_ffplay and saves the fflive stderr'''
+    runner = Runner(bin_dir)
+    env = runner.env
+    env['AV_LOG_FORCE_COLOR'] = '1'
+    env['TERM'] = '1'
+    env.pop('AV_LOG_FORCE_256COLOR', None)
+    env.pop('AV_LOG_FORCE_NOCOLOR', None)
+    ffgac_command = [
+        runner.bin('ffgac'), '-nostats', '-hide_banner', '-i', TUTORIAL_CLIP, '-an', '-frames:v', str(frames),
+        *MPEG4_ARGS, '-f', 'rawvideo', '-',
+    ]
+    fflive_command = [
+        runner.bin('fflive'), '-i', '-', '-an', '-loglevel', 'verbose', '-hide_banner', '-x', '160', '-y', '90',
+        '-s', script_path, '-o', '-', '-autoexit',
+    ]
+    with open(out_path, 'wb') as out:
+        ffgac = subprocess.Popen(ffgac_command, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        fflive = subprocess.Popen(fflive_command, env=env, stdin=ffgac.stdout, stdout=subprocess.DEVNULL, stderr=out)
+        ffgac.stdout.close()
+        fflive.wait()
+        ffgac.wait()
+    print(f'Recorded {os.path.getsize(out_path)} bytes to {out_path}')
+
+
+def load_lines(path) -> List[str]:
+    '''Lines split the way lib.process splits the process output'''
+    with open(path, 'rb') as f:
+        data = f.read()
+    return [line.decode('utf-8', errors='ignore') for line in data.replace(b'\r\n', b'\n').replace(b'\r', b'\n').split(b'\n')]
+
+
+def synthetic_lines(count, seed=0) -> List[str]:
+    '''Mostly plain script output with some colored libav messages, as fflive prints them'''
+    rnd = random.Random(seed)
+    contexts = ['libx264 @ 0x55d1c2a3b140', 'mpeg4 @ 0x55d1c2a41f00', 'avi @ 0x55d1c2a3a2c0', 'fflive']
+    levels = [12, 14, 7, 10, 13, 11, 5, 9]
+    lines = []
+    for i in range(count):
+        if rnd.random() < 0.7:
+            lines.append(f'frame {i}: mv sum {rnd.randrange(-500, 500)} {rnd.randrange(-500, 500)}')
+        else:
+            lines.append(f'\x1b[0;3{rnd.choice(levels):02d}m[{rnd.choice(contexts)}] \x1b[0m'
+                         f'\x1b[0;3{rnd.choice(levels):02d}mframe={i} qp={rnd.randrange(52)}\x1b[0m')
+    return lines
+
+
+def spans_pygments(lines):
+    lexer = AnsiColorLexer()
+    return [[(content, str(token)) for token, content in lex(line, lexer) if content] for line in lines]
+
+
+def spans_sgr_parser(lines):
+    parser = SgrParser()
+    return [[span for span in parser.parse_line(line) if span[0]] for line in lines]
+
+
+def best_time(func, lines, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(lines)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Console ANSI coloring, Pygments lexer against SgrParser')
+    parser.add_argument('log', nargs='?', help='Recorded fflive output')
+    parser.add_argument('--record', metavar='PATH', help='Record fflive output to PATH and exit')
+    parser.add_argument('--script', help='Script to record with, the first example script by default')
+    parser.add_argument('--frames', type=int, default=300, help='Frames to record')
+    parser.add_argument('--synthetic', type=int, default=0, metavar='LINES', help='Benchmark generated lines')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--bin-dir', default=default_bin_dir())
+    args = parser.parse_args()
+
+    if args.record:
+        scripts = [s for s in find_scripts() if not s.is_filter]
+        script_path = args.script or (scripts[0].path if scripts else None)
+        if not script_path:
+            print_error('No script to record with')
+            return 1
+        record(args.record, args.bin_dir, script_path, args.frames)
+        return 0
+
+    if args.log:
+        lines = load_lines(args.log)
+    elif args.synthetic:
+        lines = synthetic_lines(args.synthetic)
+    else:
+        parser.error('a recorded log or --synthetic is needed')
+
+    if spans_pygments(lines) != spans_sgr_parser(lines):
+        print_error('The spans differ')
+        return 1
+
+    pygments_s = best_time(spans_pygments, lines, args.repeat)
+    sgr_parser_s = best_time(spans_sgr_parser, lines, args.repeat)
+    colored = sum('\x1b' in line for line in lines)
+    print(json.dumps({
+        'lines': len(lines),
+        'colored_lines': colored,
+        'pygments_us_per_line': pygments_s / len(lines) * 1e6,
+        'sgr_parser_us_per_line': sgr_parser_s / len(lines) * 1e6,
+        'speedup': pygments_s / sgr_parser_s,
+    }))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
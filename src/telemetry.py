@@ -0,0 +1,77 @@
+import struct
+import threading
+import time
+from typing import Callable, Dict, NamedTuple
+
+import zmq
+
+from zmq_io import ZmqIoThread
+
+# Binary record published by the script wrapper once per frame (see script_wrapper.py):
+#   tag 'LMTF', sequence number, frame number, PTS, wall-clock time [s], script time [ms]
+TELEMETRY_TAG = b'LMTF'
+TELEMETRY_FORMAT = '<4sIiddd'
+TELEMETRY_SIZE = struct.calcsize(TELEMETRY_FORMAT)
+
+
+class TelemetrySample(NamedTuple):
+    seq: int
+    frame_num: int
+    pts: float
+    wall_time: float
+    script_ms: float
+    received_t: float
+
+
+class TelemetrySubscriber:
+    '''SUB side of the telemetry channel. Lives in the ZMQ I/O thread and keeps only the latest sample.
+    Readers on other threads just grab `latest`, a reference swap is atomic, no locking needed.'''
+
+    def __init__(self, io: ZmqIoThread, name='telemetry'):
+        self.io = io
+        self.name = name
+        self.url = ''
+        self.latest: TelemetrySample = None
+        self.frames_received = 0
+        self.bad_messages = 0
+        self.handlers: Dict[bytes, Callable[[bytes], None]] = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self.url:
+            return True
+        if not self.io.open_channel(self.name, zmq.SUB, 'tcp://127.0.0.1:*', bind=True, on_message=self._on_message):
+            return False
+        self.url = self.io.get_endpoint(self.name)
+        return bool(self.url)
+
+    def stop(self):
+        if self.url:
+            self.io.close_channel(self.name)
+            self.url = ''
+
+    def reset(self):
+        with self._lock:
+            self.latest = None
+            self.frames_received = 0
+
+    def add_handler(self, tag: bytes, cb: Callable[[bytes], None]):
+        '''Other records published on the same channel, cb(msg) is called from the ZMQ I/O thread'''
+        self.handlers[tag] = cb
+
+    def is_alive(self, max_age=1.0):
+        sample = self.latest
+        return sample is not None and time.time() - sample.received_t < max_age
+
+    def _on_message(self, msg: bytes):
+        handler = self.handlers.get(bytes(msg[:4]))
+        if handler:
+            handler(msg)
+            return
+        if len(msg) != TELEMETRY_SIZE or not msg.startswith(TELEMETRY_TAG):
+            self.bad_messages += 1
+            return
+        _tag, seq, frame_num, pts, wall_time, script_ms = struct.unpack(TELEMETRY_FORMAT, msg)
+        with self._lock:
+            self.latest = TelemetrySample(seq, frame_num, pts, wall_time, script_ms, time.time())
+            self.frames_received += 1
@@ -1,25 +1,35 @@
 '''Wrapper around the Tkinter Text widget'''
+import os
 import webbrowser
 import tkinter as tk
 from tkinter import ttk
 
 from tkinter import font as tkfont
 
-from pygments import lex
 from pygments.lexers import JavascriptLexer
 from pygments.styles.emacs import EmacsStyle
 from pygments.token import Number
 
 try:
     from widget.autoscroll import ScrolledText
+    from widget.incremental_lexer import LexerThread, TRIPLE_SLASH_TAG
 except ImportError:
     from autoscroll import ScrolledText
+    from incremental_lexer import LexerThread, TRIPLE_SLASH_TAG
 
 DEFAULTSTYLE = EmacsStyle
+HIGHLIGHT_POLL_MS = 10
 
 class CodeEditor():
     def __init__(self, text_widget: tk.Text, lexer=JavascriptLexer(), style=DEFAULTSTYLE, readonly=False, font_size=12, line_numbers=True, autosave=True):
         self.lexer = lexer
+        self.lexer_thread = LexerThread(lexer)
+        self.syntax_tags = set() # Tags added by highlight_syntax
+        self.highlight_version = 0 # Of the last text snapshot given to the lexer thread
+        self.highlight_batches = [] # Of the result being applied
+        self.highlight_batches_version = 0
+        self.highlight_timer = None
+        self.highlight_idle = None
         self.autosave = autosave
 
         monospace_fonts = ['Lucida Console','Consolas',
@@ -70,6 +80,7 @@ class CodeEditor():
             text_widget.bind("<Control-Left>", lambda _: self.move_cursor_to_next_word(-1))
             text_widget.bind("<Control-Right>", lambda _: self.move_cursor_to_next_word(1))
             text_widget.bind("<Control-slash>", lambda _: self.comment_line())
+            text_widget.bind("<<Modified>>", self.on_modified)
 
         text_widget.bind("<Control-Return>", self.on_ctrl_enter)
         text_widget.bind("<<Copy>>", self.copy_to_clipboard)
@@ -125,12 +136,16 @@ Right-click for more options
                                underline=cfg['underline'])
 
         # Define token for triple slashes: ///
-        self.text_widget.tag_configure('Token.Comment.TripleSlash', foreground='green', font=(*font, 'bold'))
+        self.text_widget.tag_configure(TRIPLE_SLASH_TAG, foreground='green', font=(*font, 'bold'))
 
         self.filepath: str = None
         self.read_only = False
         self.save_timer = None
         self.saved_hash: int = None
+        # Bumped on every edit from the <<Modified>> event, the text is read only when saving
+        self.edit_generation = 0
+        self.saved_generation = 0
+        self.highlight_generation = None
 
         self.on_save_cb: callable = None
         self.on_ctrl_enter_cb: callable = None
@@ -199,6 +214,7 @@ Right-click for more options
             s = self.text_widget.index('sel.first')
             e = self.text_widget.index('sel.last')
             selection = self.text_widget.get('sel.first', 'sel.last')
+            self.invalidate_selection()
         except tk.TclError:
             s = e = None
             selection = None
@@ -318,29 +334,49 @@ Right-click for more options
 
         return 'break'
 
+    def on_modified(self, _event=None):
+        '''Counts the edits. The modified flag is reset so Tk reports the next edit too.'''
+        if self.text_widget.edit_modified():
+            self.text_widget.edit_modified(False)
+            self.edit_generation += 1
+            if self.on_edit_cb:
+                self.on_edit_cb()
+
+    @property
+    def is_dirty(self):
+        self.on_modified() # The event may still be queued
+        return self.edit_generation != self.saved_generation
+
     def save_in(self, delay):
         if self.save_timer:
             self.text_widget.after_cancel(self.save_timer)
-        self.save_timer = self.text_widget.after(delay, self.save, hash(self.get_text()))
+        self.save_timer = self.text_widget.after(delay, self.save, self.edit_generation)
 
-    def save(self, hash_to_save=None):
+    def save(self, generation=None):
+        '''Writes the file if edited since the last save. With `generation` only if there was no edit since.'''
+        self.save_timer = None
         if not self.filepath:
             raise ValueError('No filepath set')
         if self.read_only:
             raise ValueError('File is read only')
 
-        text = self.get_text()
-        hash1 = hash(text)
-        if not hash_to_save or hash1 == hash_to_save:
-            if hash1 != self.saved_hash:
-                print(f'Saving file: {self.filepath}')
-                with open(self.filepath, 'w', encoding='utf-8', newline='\n') as f:
-                    f.write(text)
-                self.saved_hash = hash1
-                if self.on_save_cb:
-                    self.on_save_cb(self.filepath)
-        else:
+        if not self.is_dirty:
+            return
+        if generation is not None and generation != self.edit_generation:
             print('File changed, not saving')
+            return
+        text = self.get_text()
+        text_hash = hash(text)
+        if text_hash != self.saved_hash: # Undone back to the saved text otherwise
+            print(f'Saving file: {self.filepath}')
+            tmp_path = self.filepath + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8', newline='\n') as f:
+                f.write(text)
+            os.replace(tmp_path, self.filepath)
+            self.saved_hash = text_hash
+            if self.on_save_cb:
+                self.on_save_cb(self.filepath)
+        self.saved_generation = self.edit_generation
 
     def set_on_save_cb(self, cb):
         self.on_save_cb = cb
@@ -369,7 +405,6 @@ Right-click for more options
             return 4 - len(line) % 4
 
     last_tab_size = 4
-    code_at_press = ''
     def on_key_press(self, event):
         keyname = event.keysym
         try:
@@ -398,7 +433,7 @@ Right-click for more options
                     if not ret:
                         return detect_tabs(line)
         finally:
-            self.code_at_press = self.get_text()
+            self.invalidate_selection() # Typing replaces it
 
     def on_key_release(self, event):
         keyname = event.keysym
@@ -416,44 +451,73 @@ Right-click for more options
         elif is_alt and (keyname == 'Down' or keyname == 'Up' or keyname == 'Alt_L'):
             return 'break'
 
-        code = self.get_text()
-        if code != self.code_at_press:
+        self.on_modified()
+        if self.edit_generation != self.highlight_generation:
             self.highlight_syntax()
-        if self.filepath and self.autosave:
+        if self.filepath and self.autosave and self.edit_generation != self.saved_generation:
             self.save_in(3000)
 
 
-    def highlight_syntax(self):
-        code = self.text_widget.get("1.0", "end")  # Get all the text in the widget
-        code = code.replace('\r\n', '\n')
-
-        # Remove all tags
-        for tag in self.text_widget.tag_names():
-            self.text_widget.tag_remove(tag, "1.0", "end")
-
-        self.text_widget.mark_set("range_start", "1.0")
-
-        # Fix for offseting lexer when first lines are empty
-        idx = 0
-        while idx < len(code):
-            if code[idx] == '\n':
-                self.text_widget.mark_set("range_end", "range_start + 1c")
-                self.text_widget.mark_set("range_start", "range_end")
-            else:
-                break
-            idx += 1
-
-        for token, content in lex(code, self.lexer):
-            self.text_widget.mark_set("range_end", f"range_start + {len(content)}c")
-            tag_name = str(token)
-            if content.lstrip().startswith('///'):
-                tag_name = 'Token.Comment.TripleSlash'
-            self.text_widget.tag_add(tag_name, "range_start", "range_end")
-            self.text_widget.mark_set("range_start", "range_end")
-
-        if hash(code) != self.saved_hash:
-            if self.on_edit_cb:
-                self.on_edit_cb()
+    def highlight_syntax(self, code=None):
+        '''Lex the text in the lexer thread, the changed lines are re-tagged when the result arrives'''
+        if code is None:
+            code = self.text_widget.get("1.0", "end")  # Get all the text in the widget
+
+        self._drop_highlight_batches()
+        self.on_modified()
+        self.highlight_version += 1
+        self.highlight_generation = self.edit_generation
+        self.lexer_thread.submit(self.highlight_version, code)
+        if not self.highlight_timer:
+            self.highlight_timer = self.text_widget.after(HIGHLIGHT_POLL_MS, self._poll_highlight)
+
+    def _poll_highlight(self):
+        self.highlight_timer = None
+        update = None
+        done = False
+        while not self.lexer_thread.results.empty():
+            version, update = self.lexer_thread.results.get()
+            done = version == self.highlight_version # Older results are for text that changed since
+        if not done:
+            self.highlight_timer = self.text_widget.after(HIGHLIGHT_POLL_MS, self._poll_highlight)
+            return
+        if update:
+            self.highlight_batches = list(update.batches)
+            self.highlight_batches_version = self.highlight_version
+            self.highlight_idle = self.text_widget.after_idle(self._apply_highlight_batch)
+
+    def _apply_highlight_batch(self):
+        '''One batch per idle callback, so key presses are handled in between'''
+        self.highlight_idle = None
+        batch = self.highlight_batches.pop(0)
+        end = f'{batch.end_line}.0' if batch.end_line else 'end'
+        for tag in self.syntax_tags:
+            self.text_widget.tag_remove(tag, f'{batch.first_line}.0', end)
+        for tag, indices in batch.spans.items():
+            self.text_widget.tag_add(tag, *indices)
+        self.syntax_tags.update(batch.spans)
+        if self.highlight_batches:
+            self.highlight_idle = self.text_widget.after_idle(self._apply_highlight_batch)
+        else:
+            self.lexer_thread.applied(self.highlight_batches_version)
+
+    def _drop_highlight_batches(self):
+        '''Stop applying a result, its indices are wrong once the text changes'''
+        if self.highlight_idle:
+            self.text_widget.after_cancel(self.highlight_idle)
+            self.highlight_idle = None
+        if self.highlight_batches:
+            self.lexer_thread.applied(self.highlight_batches_version, self.highlight_batches[0].first_line)
+            self.highlight_batches = []
+
+    def invalidate_selection(self):
+        '''The selected lines are highlighted again even if the text replacing the selection is the same'''
+        try:
+            first = int(self.text_widget.index('sel.first').split('.')[0])
+            last = int(self.text_widget.index('sel.last').split('.')[0])
+        except tk.TclError:
+            return
+        self.lexer_thread.invalidate(self.highlight_version, first, last)
 
     def get_text(self):
         return self.text_widget.get("1.0", "end-1c")
@@ -461,6 +525,16 @@ Right-click for more options
     def set_text(self, txt = '', color=None):
         self.text_widget.delete("1.0", "end")
         self.text_widget.insert("1.0", txt)
+        if self.highlight_idle:
+            self.text_widget.after_cancel(self.highlight_idle)
+            self.highlight_idle = None
+        self.highlight_batches = []
+        if self.highlight_timer:
+            self.text_widget.after_cancel(self.highlight_timer)
+            self.highlight_timer = None
+        self.highlight_version += 1 # Results in flight are for the old text
+        self.highlight_generation = None
+        self.lexer_thread.reset()
         if color:
             self.text_widget.config(fg=color)
         else:
@@ -482,6 +556,8 @@ Right-click for more options
         self.text_widget.config(state=tk.NORMAL)
         self.set_text(text_content)
         self.text_widget.edit_reset()
+        self.on_modified()
+        self.saved_generation = self.edit_generation
         self.text_widget.config(state=tk.NORMAL if not read_only else tk.DISABLED)
         self.filepath = filepath
         self.read_only = read_only
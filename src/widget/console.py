@@ -1,10 +1,14 @@
 # This file contains the CodeEditor class, which is a wrapper around the Tkinter Text widget
+import atexit
+import os
+import tempfile
 import time
 from enum import Enum
+from typing import Iterable, List, Tuple
 import tkinter as tk
+from tkinter import simpledialog
 
 import pygments
-from pygments import lex
 from pygments.style import Style
 try:
     from code_editor import CodeEditor
@@ -14,10 +18,17 @@ try:
     from widget.ansi_colors import AnsiColorLexer, color_tokens, foreground_color, background_color
 except ImportError:
     from ansi_colors import AnsiColorLexer, color_tokens, foreground_color, background_color
+try:
+    from widget.sgr_parser import SgrParser
+except ImportError:
+    from sgr_parser import SgrParser
 
 #pylint: disable=broad-except
 
 TEST_COLORS = False
+MAX_LINES = 5000 # Lines kept in the widget, all lines are in the log file
+TRIM_LINES = 500 # Removed at once when over MAX_LINES
+SEARCH_MAX_RESULTS = 2000
 
 class Color(Enum):
     BLACK = 30
@@ -73,16 +84,24 @@ class AnsiColorStyle(Style):
     background_color = background_color
 
 class Console():
-    def __init__(self, text_widget: tk.Text, print_time=True, font_size=10):
+    def __init__(self, text_widget: tk.Text, print_time=True, font_size=10, max_lines=MAX_LINES):
         self.editor = CodeEditor(text_widget, lexer=AnsiColorLexer(), style=AnsiColorStyle, readonly=True, font_size=font_size, line_numbers=False)
         text_widget = self.editor.text_widget
         self.text_widget = text_widget
         self.print_time = print_time
         self.timestamp_color = 'Token.Color.White'
+        self.sgr_parser = SgrParser() # Tags match the AnsiColorLexer token names of the editor
 
         self.start_time = time.time()
+        self.max_lines = max_lines
+        self.pending: List[Tuple[str, str]] = [] # (timestamp, text), inserted together when idle
+        self.flush_idle = None
+        self.log_file = None
+        self.log_path: str = None
 
         self.editor.on_key = lambda _: None
+        self.editor.menu.add_separator()
+        self.editor.menu.add_command(label="Search full log...", command=self.on_search_log)
         self.text_widget.config(state=tk.DISABLED)
 
         self.mouse_pressed = False
@@ -120,21 +139,51 @@ Output #0, mp4, to '5.mp4':
 
     line_height = None
     def log(self, text, color: Color = None, bg_color: Color = None, timestamp=None):
-        if timestamp:
-            t = timestamp - self.start_time
-        else:
-            t = time.time() - self.start_time
-        timestamp_ = f'{int(t // 60):02d}:{int(t % 60):02d}.{int(t * 100 % 100):02d}' if self.print_time else None
+        self.log_lines([(text, timestamp)], color, bg_color)
 
+    def log_lines(self, lines: Iterable[Tuple[str, float]], color: Color = None, bg_color: Color = None):
+        '''Queue (text, timestamp) lines, all lines queued until the GUI is idle are inserted at once'''
+        color_asci = ''
         if color or bg_color:
             color_asci = (color.to_ansi() if color else '') + (bg_color.to_ansi_bg() if bg_color else '')
-            text = f'{color_asci}{text}\033[0m'
+        for text, timestamp in lines:
+            if timestamp:
+                t = timestamp - self.start_time
+            else:
+                t = time.time() - self.start_time
+            timestamp_ = f'{int(t // 60):02d}:{int(t % 60):02d}.{int(t * 100 % 100):02d}' if self.print_time else None
+            if color_asci:
+                text = f'{color_asci}{text}\033[0m'
+            self.pending.append((timestamp_, text))
+        if not self.flush_idle:
+            self.flush_idle = self.text_widget.after_idle(self.flush)
+
+    def flush(self):
+        '''Insert the queued lines with one state change, one insert and one scroll check'''
+        self.flush_idle = None
+        if not self.pending:
+            return
+        lines, self.pending = self.pending, []
+
+        args = []
+        log_lines = []
+        for timestamp_, text in lines:
+            log_line = []
+            if timestamp_:
+                args += (f'{timestamp_}: ', self.timestamp_color)
+                log_line.append(f'{timestamp_}: ')
+            for content, tag in self.sgr_parser.parse_line(text):
+                args += (content, tag)
+                log_line.append(content)
+            log_lines.append(''.join(log_line))
+        self.write_log_file(log_lines)
 
         self.text_widget.config(state=tk.NORMAL)
-        for i, (token, content) in enumerate(lex(text, self.editor.lexer)):
-            if i == 0 and timestamp_:
-                self.text_widget.insert(tk.END, f'{timestamp_}: ', self.timestamp_color)
-            self.text_widget.insert(tk.END, content, str(token))
+        self.text_widget.insert(tk.END, *args)
+        lines_cnt = int(self.text_widget.index(tk.END).split('.')[0])
+        if lines_cnt > self.max_lines + TRIM_LINES:
+            self.text_widget.delete('1.0', f'{lines_cnt - self.max_lines}.0')
+            lines_cnt = self.max_lines
 
         try:
             if self.line_height is None:
@@ -146,7 +195,6 @@ Output #0, mp4, to '5.mp4':
 
         # Stop autoscroling if the user scrolls up
         if self.line_height is not None:
-            lines_cnt = int(self.text_widget.index(tk.END).split('.')[0])
             yview_height = lines_cnt * self.line_height
             scroll_y_pos = self.text_widget.yview()[1]
             widget_height = self.text_widget.winfo_height()
@@ -159,8 +207,57 @@ Output #0, mp4, to '5.mp4':
 
         self.text_widget.config(state=tk.DISABLED)
 
+    def write_log_file(self, lines: List[str]):
+        '''Every line also goes to a temporary file, the widget only keeps the last `max_lines`'''
+        if not self.log_file:
+            fd, self.log_path = tempfile.mkstemp(prefix='livemosher_console_', suffix='.log')
+            self.log_file = os.fdopen(fd, 'w', encoding='utf-8')
+            atexit.register(self.remove_log_file)
+        self.log_file.write(''.join(lines))
+
+    def remove_log_file(self):
+        if self.log_file:
+            self.log_file.close()
+            self.log_file = None
+            try:
+                os.remove(self.log_path)
+            except OSError:
+                pass
+
+    def search_log(self, text: str, max_results=SEARCH_MAX_RESULTS) -> List[str]:
+        '''Lines of the log file since the last clear() containing `text`, case insensitive'''
+        self.flush()
+        if not self.log_file:
+            return []
+        self.log_file.flush()
+        text = text.lower()
+        results = []
+        with open(self.log_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if text in line.lower():
+                    results.append(line)
+                    if len(results) >= max_results:
+                        break
+        return results
+
+    def on_search_log(self):
+        text = simpledialog.askstring('Search console log', 'Find lines containing:', parent=self.text_widget)
+        if not text:
+            return
+        results = self.search_log(text)
+        top = tk.Toplevel(self.text_widget)
+        top.title(f'Console log: "{text}" - {len(results)}{"+" if len(results) >= SEARCH_MAX_RESULTS else ""} lines')
+        result_text = tk.Text(top, wrap='none', font=self.text_widget.cget('font'))
+        result_text.pack(fill=tk.BOTH, expand=True)
+        result_text.insert('1.0', ''.join(results) or 'No matches')
+        result_text.config(state=tk.DISABLED)
+
     def clear(self):
         self.start_time = time.time()
+        self.pending = []
+        if self.log_file:
+            self.log_file.seek(0)
+            self.log_file.truncate()
         self.text_widget.config(state=tk.NORMAL)
         self.text_widget.delete("1.0", tk.END)
         # Remove all tags
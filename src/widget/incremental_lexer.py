@@ -0,0 +1,368 @@
+'''Incremental Pygments lexing for the code editor'''
+import queue
+import re
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from pygments.token import Error, Whitespace, _TokenType
+
+TRIPLE_SLASH_TAG = 'Token.Comment.TripleSlash'
+BATCH_LINES = 100 # Lines per LexBatch, a batch only starts at a line start with a token boundary
+
+
+class LexBatch(NamedTuple):
+    first_line: int # Tk line numbers, the tags in [first_line.0, end_line.0) are replaced
+    end_line: Optional[int] # None: up to the end of the text
+    spans: Dict[str, List[str]] # Tag name -> flat list of start/end Tk indices, for one tag_add per tag
+
+
+class LexUpdate(NamedTuple):
+    first_line: int
+    end_line: Optional[int]
+    batches: List[LexBatch] # Consecutive, covering first_line to end_line
+
+
+def multiline_opening(pattern: str, flags: int) -> str:
+    '''The literal text every match of the regex `pattern` starts with, if the rest of the match can span lines.
+    When such a rule fails after the opening, like an unterminated string or comment, it may have scanned up to
+    the end of the text. '' for other rules.'''
+    spans_lines = False
+    depth = 0
+    negated_class = None # The content of the [^...] class being parsed
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if negated_class is not None:
+            if c == ']' and negated_class:
+                spans_lines = spans_lines or not ('\\n' in negated_class or '\\s' in negated_class)
+                negated_class = None
+            else:
+                negated_class += pattern[i:i + 2] if c == '\\' else c
+                i += 1 if c == '\\' else 0
+        elif c == '\\':
+            spans_lines = spans_lines or pattern[i + 1:i + 2] in ('n', 's')
+            i += 1
+        elif c == '[':
+            if pattern[i + 1:i + 2] == '^':
+                negated_class = ''
+                i += 1
+            else:
+                i = pattern.find(']', i + 2) # Other classes are only skipped, their content is not parsed
+                if i < 0:
+                    return ''
+        elif c == '.':
+            spans_lines = spans_lines or bool(flags & re.DOTALL)
+        elif c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif c == '|' and depth == 0:
+            return '' # Top level alternatives
+        i += 1
+    if not spans_lines:
+        return ''
+
+    prefix = ''
+    i = 0
+    while i < len(pattern):
+        if pattern[i] == '\\' and i + 1 < len(pattern) and not pattern[i + 1].isalnum():
+            char, size = pattern[i + 1], 2
+        elif pattern[i] not in '.^$*+?{}[]()|\\':
+            char, size = pattern[i], 1
+        else:
+            break
+        if pattern[i + size:i + size + 1] in ('*', '+', '?', '{') and pattern[i + size:i + size + 1]:
+            break
+        prefix += char
+        i += size
+    return prefix
+
+
+def tag_name(token, content):
+    if content.lstrip().startswith('///'):
+        return TRIPLE_SLASH_TAG
+    return str(token)
+
+
+class IncrementalLexer:
+    '''Remembers the lexer state stack at every line start where a token starts. After an edit it lexes from the
+    last such line before the first changed line, and stops at the first line after the changed lines where the
+    state stack is again the one of the previous run: from there on the tokens, and the tags, are unchanged.
+
+    A rule that fails after its opening text matched, like an unterminated string or comment, may have scanned
+    to the end of the text, so an edit anywhere after it can change its result. Such lines are remembered and
+    lexing restarts from the first of them before the edit.
+
+    Needs a RegexLexer (like JavascriptLexer), other lexers are lexed in full every time.'''
+
+    def __init__(self, lexer):
+        self.lexer = lexer
+        self.incremental = hasattr(lexer, '_tokens')
+        self.lines: List[Optional[str]] = []
+        self.states: List[Optional[tuple]] = []
+        self.fragile: List[bool] = []
+        self.rules = {}
+        if self.incremental:
+            for state, rules in lexer._tokens.items(): # pylint: disable=protected-access
+                self.rules[state] = [(rexmatch, action, new_state, multiline_opening(rexmatch.__self__.pattern, rexmatch.__self__.flags))
+                                     for rexmatch, action, new_state in rules]
+
+    def reset(self):
+        '''Forget the previous text, the next update lexes everything'''
+        self.lines = []
+        self.states = []
+        self.fragile = []
+
+    def snapshot(self):
+        return self.lines, self.states, self.fragile
+
+    def restore(self, snapshot):
+        '''Back to the state of snapshot(), when the update since then was not applied to the widget'''
+        self.lines, self.states, self.fragile = snapshot
+
+    def invalidate(self, first_line, last_line=None):
+        '''Force the Tk lines `first_line` to `last_line` to be lexed again. For edits that could delete and
+        re-insert the same text, like replacing a selection: the line looks unchanged but lost its tags.'''
+        self.lines = list(self.lines) # A snapshot may share the list
+        for line in range(max(first_line, 1), min(last_line or first_line, len(self.lines)) + 1):
+            self.lines[line - 1] = None
+
+    def update(self, text: str) -> Optional[LexUpdate]:
+        '''Lex the changed part of `text`, the whole Text widget content. None when nothing changed.'''
+        lines = text.split('\n')
+        old_lines, old_states, old_fragile = self.lines, self.states, self.fragile
+        if not self.incremental:
+            old_lines, old_states, old_fragile = [], [], []
+
+        count = min(len(lines), len(old_lines))
+        prefix = 0
+        while prefix < count and lines[prefix] == old_lines[prefix]:
+            prefix += 1
+        if prefix == len(lines) == len(old_lines):
+            return None
+        suffix = 0
+        while suffix < count - prefix and lines[-1 - suffix] == old_lines[-1 - suffix]:
+            suffix += 1
+        changed_end = len(lines) - suffix # Lines from here on are the old lines shifted by `delta`
+        delta = len(lines) - len(old_lines)
+
+        # The token ending at the start of the first changed line could have been longer with the new text,
+        # so restart at least one line earlier
+        start = max(prefix - 1, 0)
+        if True in old_fragile[:start]:
+            start = old_fragile.index(True)
+        while start > 0 and old_states[start] is None:
+            start -= 1
+        stack = list(old_states[start]) if old_states else ['root']
+
+        pos = sum(len(line) + 1 for line in lines[:start])
+        new_states: List[Optional[tuple]] = [None] * (len(lines) - start)
+        new_fragile = [False] * (len(lines) - start)
+        batches = [LexBatch(start + 1, None, {})]
+        spans = batches[-1].spans
+
+        # Line of the positions passed to locate(), they only grow
+        line = start
+        line_start = pos
+        next_line_start = pos + len(lines[line]) + 1
+        def locate(p):
+            nonlocal line, line_start, next_line_start
+            while p >= next_line_start and line + 1 < len(lines):
+                line += 1
+                line_start = next_line_start
+                next_line_start += len(lines[line]) + 1
+            return f'{line + 1}.{p - line_start}'
+
+        def add(p, token, content):
+            if content:
+                indices = spans.setdefault(tag_name(token, content), [])
+                indices.append(locate(p))
+                indices.append(locate(p + len(content)))
+
+        end_line = None
+        if self.incremental:
+            statetokens = self.rules[stack[-1]]
+            # RegexLexer.get_tokens_unprocessed, with the state stack recorded at line starts
+            checked_line = -1
+            while True:
+                locate(pos)
+                # The first state at the line start, empty matches there can still change it
+                if pos == line_start and line != checked_line:
+                    checked_line = line
+                    state = tuple(stack)
+                    old_line = line - delta
+                    if line >= changed_end and line > start and 0 <= old_line < len(old_states) and old_states[old_line] == state:
+                        end_line = line
+                        break
+                    new_states[line - start] = state
+                    if line - batches[-1].first_line >= BATCH_LINES - 1:
+                        batches[-1] = batches[-1]._replace(end_line=line + 1)
+                        batches.append(LexBatch(line + 1, None, {}))
+                        spans = batches[-1].spans
+                for rexmatch, action, new_state, opening in statetokens:
+                    m = rexmatch(text, pos)
+                    if not m:
+                        if opening and text.startswith(opening, pos):
+                            new_fragile[line - start] = True
+                        continue
+                    if action is not None:
+                        if type(action) is _TokenType: # pylint: disable=unidiomatic-typecheck
+                            add(pos, action, m.group())
+                        else:
+                            for p, token, content in action(self.lexer, m):
+                                add(p, token, content)
+                    pos = m.end()
+                    if new_state is not None:
+                        if isinstance(new_state, tuple):
+                            for state in new_state:
+                                if state == '#pop':
+                                    if len(stack) > 1:
+                                        stack.pop()
+                                elif state == '#push':
+                                    stack.append(stack[-1])
+                                else:
+                                    stack.append(state)
+                        elif isinstance(new_state, int):
+                            if abs(new_state) >= len(stack):
+                                del stack[1:]
+                            else:
+                                del stack[new_state:]
+                        elif new_state == '#push':
+                            stack.append(stack[-1])
+                        statetokens = self.rules[stack[-1]]
+                    break
+                else:
+                    if pos >= len(text):
+                        break
+                    if text[pos] == '\n':
+                        stack = ['root']
+                        statetokens = self.rules['root']
+                        add(pos, Whitespace, '\n')
+                    else:
+                        add(pos, Error, text[pos])
+                    pos += 1
+        else:
+            for p, token, content in self.lexer.get_tokens_unprocessed(text):
+                add(p, token, content)
+
+        if end_line is None:
+            self.states = old_states[:start] + new_states
+            self.fragile = old_fragile[:start] + new_fragile
+        else:
+            self.states = old_states[:start] + new_states[:end_line - start] + old_states[end_line - delta:]
+            self.fragile = old_fragile[:start] + new_fragile[:end_line - start] + old_fragile[end_line - delta:]
+        self.states[0] = ('root',)
+        self.lines = lines
+        end_line = end_line + 1 if end_line is not None else None
+        batches[-1] = batches[-1]._replace(end_line=end_line)
+        return LexUpdate(start + 1, end_line, batches)
+
+
+class LexerThread:
+    '''Runs an IncrementalLexer in a worker thread, so typing never waits for Pygments.
+
+    The Tk thread submits text snapshots with increasing versions and takes the results from `results`. Only the
+    newest pending snapshot is lexed. A result is applied to the widget batch by batch and only if no newer
+    snapshot was submitted meanwhile, so the GUI reports with applied() how far it got before submitting the next
+    snapshot. The lexer then keeps the lexed state up to there, or goes back to the state the tags still match.'''
+
+    def __init__(self, lexer):
+        self.lexer = IncrementalLexer(lexer)
+        self.results: queue.Queue[Tuple[int, LexUpdate]] = queue.Queue()
+        self.thread: threading.Thread = None
+        self.running = False
+        self._cond = threading.Condition()
+        self._pending: Tuple[int, str] = None
+        self._invalidated: List[Tuple[int, int, int]] = [] # (version of the text, first line, last line)
+        self._reset = False
+        self._applied: Tuple[int, Optional[int]] = None # (version, Tk line up to which it was applied, None: all)
+        self._base = self.lexer.snapshot() # State matching the tags in the widget
+        self._base_version = 0
+        self._result: Tuple[int, LexUpdate] = None # Last result, until it's known if it was applied
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='lexer')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self, timeout=1.0):
+        if not self.running:
+            return
+        with self._cond:
+            self.running = False
+            self._cond.notify()
+        self.thread.join(timeout)
+
+    def submit(self, version: int, text: str):
+        '''Lex `text`, replaces a snapshot not taken by the worker yet'''
+        self.start()
+        with self._cond:
+            self._pending = (version, text)
+            self._cond.notify()
+
+    def invalidate(self, version: int, first_line, last_line=None):
+        '''IncrementalLexer.invalidate() for the lines of the text submitted as `version`'''
+        with self._cond:
+            self._invalidated.append((version, first_line, last_line or first_line))
+
+    def reset(self):
+        '''The widget text was replaced, the next snapshot is lexed in full'''
+        with self._cond:
+            self._reset = True
+            self._invalidated.clear()
+
+    def applied(self, version: int, up_to_line: Optional[int] = None):
+        '''The result of `version` was applied to the widget up to the Tk line `up_to_line`, None: completely'''
+        with self._cond:
+            self._applied = (version, up_to_line)
+
+    def _take(self):
+        with self._cond:
+            while self.running and not self._pending:
+                self._cond.wait()
+            if not self.running:
+                return None
+            version, text = self._pending
+            self._pending = None
+
+            # Bring the lexer to the state of the tags in the widget
+            if self._result:
+                result_version, update = self._result
+                self._result = None
+                if self._applied and self._applied[0] == result_version:
+                    up_to_line = self._applied[1]
+                    if up_to_line is not None:
+                        self.lexer.invalidate(up_to_line, update.end_line - 1 if update.end_line else len(self.lexer.lines))
+                    self._base_version = result_version
+                else:
+                    self.lexer.restore(self._base)
+            self._applied = None
+            if self._reset:
+                self._reset = False
+                self.lexer.reset()
+            for text_version, first_line, last_line in self._invalidated:
+                if text_version == self._base_version:
+                    self.lexer.invalidate(first_line, last_line)
+                else:
+                    # Lines of a text that was never highlighted, can't be mapped to the lexed one
+                    self.lexer.reset()
+            self._invalidated.clear()
+            self._base = self.lexer.snapshot()
+            return version, text
+
+    def _run(self):
+        while True:
+            job = self._take()
+            if not job:
+                return
+            version, text = job
+            update = self.lexer.update(text)
+            if update:
+                with self._cond:
+                    self._result = (version, update)
+            else:
+                self._base_version = version
+            self.results.put((version, update))
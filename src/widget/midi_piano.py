@@ -69,6 +69,29 @@ class MidiPiano:
         label.place(x=x + 83, y=y)
         self.label_midi_message = label
 
+        y += 24
+        self.is_automation_rec = tk.IntVar(value=0)
+        self.is_automation_play = tk.IntVar(value=1)
+        check = tk.Checkbutton(self.frame, text='Record automation', variable=self.is_automation_rec,
+                               command=self._on_automation_change)
+        check.place(x=x - 4, y=y)
+        y += 20
+        check = tk.Checkbutton(self.frame, text='Play automation', variable=self.is_automation_play,
+                               command=self._on_automation_change)
+        check.place(x=x - 4, y=y)
+        y += 22
+        self.label_automation = tk.Label(self.frame, text='')
+        self.label_automation.place(x=x, y=y + 2)
+        button = tk.Button(self.frame, text='Clear', command=self._on_automation_clear)
+        button.place(x=x + 120, y=y, height=20)
+
+        x += 220
+        y = canvas_height + 10
+        button = tk.Button(self.frame, text='MIDI file...', command=self._on_midi_file)
+        button.place(x=x, y=y, height=20)
+        self.label_midi_file = tk.Label(self.frame, text='-')
+        self.label_midi_file.place(x=x, y=y + 24)
+
         self.canvas.bind("<Button-1>", self._on_canvas_press)
         self.canvas.bind("<ButtonRelease-1>", self._on_canvas_release)
         self.canvas.bind("<Motion>", self._on_canvas_hover)
@@ -80,7 +103,7 @@ class MidiPiano:
             child.config(highlightthickness=0)
             if bg_color:
                 child.config(bg=bg_color)
-            if isinstance(child, tk.Label):
+            if isinstance(child, (tk.Label, tk.Checkbutton, tk.Button)):
                 child.configure(font="-family {Segoe UI} -size 8")
 
     def destroy(self):
@@ -228,6 +251,37 @@ class MidiPiano:
         self.label_velocity.config(text=str(msg[2]))
         self.label_midi_message.config(text=str(msg))
 
+    on_automation_cb = None
+    on_automation_clear_cb = None
+    def set_on_automation_cb(self, cb, clear_cb=None):
+        '''cb(record: bool, play: bool)'''
+        self.on_automation_cb = cb
+        self.on_automation_clear_cb = clear_cb
+
+    def set_automation_state(self, record, play, events_count=0):
+        self.is_automation_rec.set(1 if record else 0)
+        self.is_automation_play.set(1 if play else 0)
+        self.label_automation.config(text=f'{events_count} events')
+
+    on_midi_file_cb = None
+    def set_on_midi_file_cb(self, cb):
+        self.on_midi_file_cb = cb
+
+    def set_midi_file(self, name):
+        self.label_midi_file.config(text=name or '-')
+
+    def _on_midi_file(self):
+        if self.on_midi_file_cb:
+            self.on_midi_file_cb()
+
+    def _on_automation_change(self):
+        if self.on_automation_cb:
+            self.on_automation_cb(self.is_automation_rec.get() == 1, self.is_automation_play.get() == 1)
+
+    def _on_automation_clear(self):
+        if self.on_automation_clear_cb:
+            self.on_automation_clear_cb()
+
 if __name__ == "__main__":
     root = tk.Tk()
     piano = MidiPiano(root)
@@ -0,0 +1,59 @@
+import tkinter as tk
+from tkinter import messagebox
+
+from param_curves import CurveError, parse_curves
+
+HELP_TEXT = '''One parameter per line:  name: frame=value[:interp] ...
+interp applies from that key to the next one: linear (default), smooth, step
+Values are set in globalThis.livemosher_params, and in args.params when the script parameters are an object
+(also for array params: "0: 0=1 100=5"), a number or missing args.params is left unchanged'''
+
+class ParamCurvesDialog:
+
+    def __init__(self, _root, title='Parameter curves', text='', bg_color=None):
+        self.frame = _root
+        self.frame.title(title)
+        self.frame.protocol('WM_DELETE_WINDOW', self._on_exit)
+
+        label = tk.Label(self.frame, text=HELP_TEXT, justify=tk.LEFT, anchor='w')
+        label.pack(fill=tk.X, padx=6, pady=(6, 2))
+
+        self.text = tk.Text(self.frame, width=80, height=12, undo=True)
+        self.text.pack(fill=tk.BOTH, expand=True, padx=6)
+        self.text.insert('1.0', text)
+
+        buttons = tk.Frame(self.frame)
+        buttons.pack(fill=tk.X, padx=6, pady=6)
+        tk.Button(buttons, text='Cancel', width=8, command=self._on_exit).pack(side=tk.RIGHT)
+        tk.Button(buttons, text='OK', width=8, command=self._on_ok).pack(side=tk.RIGHT, padx=6)
+
+        if bg_color:
+            for widget in (self.frame, label, buttons):
+                widget.config(bg=bg_color)
+
+        self.text.focus_set()
+
+    on_ok_cb = None
+    def set_on_ok_cb(self, cb):
+        '''cb(curves: dict)'''
+        self.on_ok_cb = cb
+
+    def destroy(self):
+        self.frame.destroy()
+        self.frame = None
+
+    def is_destroyed(self):
+        return not self.frame
+
+    def _on_exit(self):
+        self.destroy()
+
+    def _on_ok(self):
+        try:
+            curves = parse_curves(self.text.get('1.0', tk.END))
+        except CurveError as e:
+            messagebox.showwarning('Parameter curves', str(e), parent=self.frame)
+            return
+        if self.on_ok_cb:
+            self.on_ok_cb(curves)
+        self.destroy()
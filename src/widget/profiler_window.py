@@ -0,0 +1,123 @@
+import tkinter as tk
+from tkinter import ttk
+
+from script_profiler import ScriptProfiler
+
+HISTOGRAM_WIDTH = 480
+HISTOGRAM_HEIGHT = 140
+HISTOGRAM_BINS = 24
+BAR_CHARS = 20
+REFRESH_MS = 500
+
+class ProfilerWindow:
+    '''Rolling histogram of the script time per frame and a per function summary, most self time first'''
+
+    def __init__(self, _root, profiler: ScriptProfiler, title='Script profiler', bg_color=None):
+        self.frame = _root
+        self.profiler = profiler
+        self.frame_budget_ms = 0.0
+        self.frame.title(title)
+        self.frame.protocol('WM_DELETE_WINDOW', self._on_exit)
+
+        self.label_stats = tk.Label(self.frame, text='Waiting for frames...', justify=tk.LEFT, anchor='w')
+        self.label_stats.pack(fill=tk.X, padx=6, pady=(6, 2))
+
+        self.canvas = tk.Canvas(self.frame, width=HISTOGRAM_WIDTH, height=HISTOGRAM_HEIGHT, bg='#ffffff', highlightthickness=0)
+        self.canvas.pack(fill=tk.X, padx=6)
+
+        columns = ('calls', 'total', 'self', 'share')
+        self.tree = ttk.Treeview(self.frame, columns=columns, height=10)
+        self.tree.heading('#0', text='Function')
+        self.tree.heading('calls', text='Calls/frame')
+        self.tree.heading('total', text='Total ms/frame')
+        self.tree.heading('self', text='Self ms/frame')
+        self.tree.heading('share', text='Self time')
+        self.tree.column('#0', width=220)
+        for column in ('calls', 'total', 'self'):
+            self.tree.column(column, width=90, anchor='e')
+        self.tree.column('share', width=170)
+        self.tree.pack(fill=tk.BOTH, expand=True, padx=6, pady=6)
+
+        buttons = tk.Frame(self.frame)
+        buttons.pack(fill=tk.X, padx=6, pady=(0, 6))
+        tk.Button(buttons, text='Reset', width=8, command=self._on_reset).pack(side=tk.RIGHT)
+
+        if bg_color:
+            for widget in (self.frame, self.label_stats, buttons):
+                widget.config(bg=bg_color)
+
+        self.refresh_timer = self.frame.after(REFRESH_MS, self._refresh)
+
+    on_exit_cb = None
+    def set_on_exit_cb(self, cb):
+        self.on_exit_cb = cb
+
+    def set_frame_budget(self, fps):
+        '''Draws the time one frame may take at `fps`'''
+        self.frame_budget_ms = 1000 / fps if fps else 0.0
+
+    def destroy(self):
+        if self.refresh_timer:
+            self.frame.after_cancel(self.refresh_timer)
+            self.refresh_timer = None
+        self.frame.destroy()
+        self.frame = None
+
+    def is_destroyed(self):
+        return not self.frame
+
+    def _on_exit(self):
+        self.destroy()
+        if self.on_exit_cb:
+            self.on_exit_cb()
+
+    def _on_reset(self):
+        self.profiler.reset()
+        self._refresh(reschedule=False)
+
+    def _refresh(self, reschedule=True):
+        if reschedule:
+            self.refresh_timer = self.frame.after(REFRESH_MS, self._refresh)
+        if not self.profiler.frames:
+            return
+        self._draw_histogram()
+        self._update_summary()
+
+    def _draw_histogram(self):
+        max_ms = None
+        percentiles = self.profiler.percentiles()
+        if percentiles:
+            max_ms = max(percentiles[-1] * 1.2, self.frame_budget_ms * 1.2, 1.0)
+        counts, edges = self.profiler.histogram(HISTOGRAM_BINS, max_ms)
+        self.canvas.delete('all')
+        peak = max(int(counts.max()), 1)
+        bar_width = HISTOGRAM_WIDTH / len(counts)
+        plot_height = HISTOGRAM_HEIGHT - 16
+        for i, count in enumerate(counts):
+            height = plot_height * count / peak
+            self.canvas.create_rectangle(i * bar_width + 1, plot_height - height, (i + 1) * bar_width - 1, plot_height,
+                                         fill='#6f8fbf', outline='')
+        self.canvas.create_text(2, HISTOGRAM_HEIGHT - 2, text='0 ms', anchor='sw')
+        self.canvas.create_text(HISTOGRAM_WIDTH - 2, HISTOGRAM_HEIGHT - 2, text=f'{edges[-1]:.1f} ms', anchor='se')
+        if self.frame_budget_ms and edges[-1] > 0:
+            x = HISTOGRAM_WIDTH * self.frame_budget_ms / edges[-1]
+            self.canvas.create_line(x, 0, x, plot_height, fill='#cf3f3f', dash=(3, 2))
+            self.canvas.create_text(x + 3, 2, text=f'frame {self.frame_budget_ms:.1f} ms', anchor='nw', fill='#cf3f3f')
+
+        p50, p95, p99 = percentiles
+        self.label_stats.config(text=f'Frames: {self.profiler.frames}    script time p50: {p50:.2f} ms'
+                                     f'    p95: {p95:.2f} ms    p99: {p99:.2f} ms')
+
+    def _update_summary(self):
+        frames = max(self.profiler.frames, 1)
+        rows = self.profiler.summary()
+        all_self_ms = sum(row.self_ms for row in rows) or 1.0
+        self.tree.delete(*self.tree.get_children())
+        for row in rows:
+            share = row.self_ms / all_self_ms
+            self.tree.insert('', tk.END, text=row.name, values=(
+                f'{row.calls / frames:.1f}',
+                f'{row.total_ms / frames:.3f}',
+                f'{row.self_ms / frames:.3f}',
+                f'{"█" * round(share * BAR_CHARS):<{BAR_CHARS}} {share * 100:.0f}%',
+            ))
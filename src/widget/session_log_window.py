@@ -0,0 +1,120 @@
+import tkinter as tk
+from tkinter import ttk
+
+import numpy as np
+
+from session_log import LEVEL_ERROR, LEVEL_WARNING, MAX_RESULTS, SessionLog
+
+PAGE_LINES = 500
+ALL_PROCESSES = 'All processes'
+LEVEL_COLORS = {LEVEL_ERROR: '#FF2929', LEVEL_WARNING: '#DA9C00'}
+
+class SessionLogWindow:
+    '''Pages through the session log, only the shown page is read from disk and put into the text widget'''
+
+    def __init__(self, _root, session_log: SessionLog, title='Session log', bg_color=None, font=None):
+        self.frame = _root
+        self.session_log = session_log
+        self.lines = np.zeros(0, dtype=np.int64) # Line numbers matching the filter
+        self.page_start = 0
+        self.frame.title(title)
+        self.frame.protocol('WM_DELETE_WINDOW', self._on_exit)
+
+        bar = tk.Frame(self.frame)
+        bar.pack(fill=tk.X, padx=6, pady=(6, 2))
+        self.search_var = tk.StringVar()
+        entry_search = ttk.Entry(bar, textvariable=self.search_var, width=30)
+        entry_search.pack(side=tk.LEFT)
+        entry_search.bind('<Return>', lambda _: self.refresh())
+        ttk.Button(bar, text='Find', width=6, command=self.refresh).pack(side=tk.LEFT, padx=(2, 8))
+        self.errors_only_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(bar, text='Errors only', variable=self.errors_only_var, command=self.refresh).pack(side=tk.LEFT)
+        self.process_var = tk.StringVar(value=ALL_PROCESSES)
+        self.combo_process = ttk.Combobox(bar, textvariable=self.process_var, state='readonly', width=14,
+                                          postcommand=self._update_processes)
+        self.combo_process.pack(side=tk.LEFT, padx=8)
+        self.combo_process.bind('<<ComboboxSelected>>', lambda _: self.refresh())
+        self.time_var = tk.StringVar()
+        entry_time = ttk.Entry(bar, textvariable=self.time_var, width=9)
+        entry_time.pack(side=tk.RIGHT)
+        entry_time.bind('<Return>', lambda _: self.jump_to_time())
+        tk.Label(bar, text='Go to mm:ss').pack(side=tk.RIGHT, padx=2)
+
+        text_frame = tk.Frame(self.frame)
+        text_frame.pack(fill=tk.BOTH, expand=True, padx=6)
+        self.text = tk.Text(text_frame, wrap='none', width=120, height=30, font=font)
+        scrollbar = ttk.Scrollbar(text_frame, command=self.text.yview)
+        self.text.configure(yscrollcommand=scrollbar.set, state=tk.DISABLED)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        for level, color in LEVEL_COLORS.items():
+            self.text.tag_configure(str(level), foreground=color)
+        self.text.tag_configure('time', foreground='#838383')
+
+        buttons = tk.Frame(self.frame)
+        buttons.pack(fill=tk.X, padx=6, pady=6)
+        self.label_position = tk.Label(buttons, anchor='w')
+        self.label_position.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        ttk.Button(buttons, text='Last', width=6, command=lambda: self.show_page(len(self.lines))).pack(side=tk.RIGHT)
+        ttk.Button(buttons, text='>', width=3, command=lambda: self.show_page(self.page_start + PAGE_LINES)).pack(side=tk.RIGHT)
+        ttk.Button(buttons, text='<', width=3, command=lambda: self.show_page(self.page_start - PAGE_LINES)).pack(side=tk.RIGHT)
+        ttk.Button(buttons, text='First', width=6, command=lambda: self.show_page(0)).pack(side=tk.RIGHT)
+
+        if bg_color:
+            for widget in (self.frame, bar, buttons, self.label_position):
+                widget.config(bg=bg_color)
+
+        self.refresh(last_page=True)
+        entry_search.focus_set()
+
+    on_exit_cb = None
+    def set_on_exit_cb(self, cb):
+        self.on_exit_cb = cb
+
+    def destroy(self):
+        self.frame.destroy()
+        self.frame = None
+
+    def is_destroyed(self):
+        return not self.frame
+
+    def _on_exit(self):
+        self.destroy()
+        if self.on_exit_cb:
+            self.on_exit_cb()
+
+    def _update_processes(self):
+        self.combo_process['values'] = [ALL_PROCESSES, *self.session_log.processes]
+
+    def refresh(self, last_page=False):
+        process = self.process_var.get()
+        self.lines = self.session_log.find(self.search_var.get(),
+                                           max_level=LEVEL_ERROR if self.errors_only_var.get() else None,
+                                           process=None if process == ALL_PROCESSES else process)
+        self.show_page(len(self.lines) if last_page else 0)
+
+    def jump_to_time(self):
+        try:
+            parts = self.time_var.get().strip().split(':')
+            t = sum(x * float(p) for x, p in zip([3600, 60, 1][-len(parts):], parts))
+        except ValueError:
+            return
+        self.show_page(self.session_log.line_at_time(self.session_log.start_time + t, self.lines))
+
+    def show_page(self, position):
+        '''Shows the matching lines from `position`, a full last page when past the end'''
+        position = max(0, min(position, len(self.lines) - PAGE_LINES))
+        self.page_start = position
+        page = self.session_log.read(self.lines[position:position + PAGE_LINES])
+        args = []
+        for line in page:
+            t = line.time - self.session_log.start_time
+            args += (f'{int(t // 60):02d}:{t % 60:05.2f} {line.process}: ', 'time', line.text + '\n', str(line.level))
+        self.text.config(state=tk.NORMAL)
+        self.text.delete('1.0', tk.END)
+        if args:
+            self.text.insert(tk.END, *args)
+        self.text.config(state=tk.DISABLED)
+        self.label_position.config(text=f'Lines {position + 1 if page else 0}-{position + len(page)} of {len(self.lines)}'
+                                        f'{"+" if self.search_var.get() and len(self.lines) >= MAX_RESULTS else ""}'
+                                        f', {self.session_log.count} in the session')
@@ -0,0 +1,119 @@
+'''Streaming ANSI SGR parser for the console, same spans and tag names as lexing with AnsiColorLexer'''
+import re
+from typing import Dict, List, Tuple
+
+try:
+    from widget.ansi_colors import _ansi_code_to_color, _ff_play_colors, _token_from_lexer_state
+except ImportError:
+    from ansi_colors import _ansi_code_to_color, _ff_play_colors, _token_from_lexer_state
+
+ESC = '\x1b'
+TEXT_TAG = 'Token.Text'
+
+_CSI_RE = re.compile(r'([0-9;=]*?)?([a-zA-Z])(.*)$', re.DOTALL | re.MULTILINE)
+_CHARSET_RE = re.compile(r'\([AB012]')
+
+
+class SgrParser:
+    '''Splits text with ANSI escape codes into (text, tag) spans. The graphics state carries over between calls,
+    like in the lexer instance the console used to share between lines.
+
+    As in AnsiColorLexer the text before the first escape code is always plain Token.Text, so lines without
+    escape codes take a fast path.'''
+
+    def __init__(self):
+        self.bold = False
+        self.faint = False
+        self.fg_color: str = None
+        self.bg_color: str = None
+        self._tags: Dict[Tuple, str] = {}
+
+    def reset_state(self):
+        self.bold = False
+        self.faint = False
+        self.fg_color = None
+        self.bg_color = None
+
+    @property
+    def tag(self) -> str:
+        '''Tag name for the current state, one token name per attribute combination'''
+        key = (self.bold, self.faint, self.fg_color, self.bg_color)
+        tag = self._tags.get(key)
+        if tag is None:
+            tag = self._tags[key] = str(_token_from_lexer_state(*key))
+        return tag
+
+    def parse_line(self, text: str) -> List[Tuple[str, str]]:
+        '''Spans of a console line, ending with a newline, as pygments.lex() returns them'''
+        if '\r' in text:
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+        return self.parse(text.strip('\n') + '\n')
+
+    def parse(self, text: str) -> List[Tuple[str, str]]:
+        if ESC not in text:
+            return [(text, TEXT_TAG)] if text else []
+        chunks = text.split(ESC)
+        spans = [(chunks[0], TEXT_TAG)] if chunks[0] else []
+        for chunk in chunks[1:]:
+            if chunk.startswith('['):
+                chunk = self._csi(chunk[1:])
+            elif _CHARSET_RE.match(chunk):
+                chunk = chunk[2:]
+            if chunk:
+                spans.append((chunk, self.tag))
+        return spans
+
+    def _csi(self, after_escape: str) -> str:
+        '''Applies a control sequence, returns the text after it'''
+        parsed = _CSI_RE.match(after_escape)
+        if parsed is None:
+            return after_escape
+        value, code, text = parsed.groups()
+        if code != 'm': # Only "Set Graphics Mode" changes the colors
+            return text
+        if not value:
+            self.reset_state()
+            return text
+        try:
+            values = [int(v) for v in value.split(';')]
+        except ValueError:
+            print(f'Invalid ANSI code: {value}')
+            return text
+
+        i = 0
+        while i < len(values):
+            value = values[i]
+            i += 1
+            fg_color = _ansi_code_to_color.get(value - 30)
+            bg_color = _ansi_code_to_color.get(value - 40)
+            if value >= 300:
+                fg_color = _ff_play_colors.get(value - 300) or _ff_play_colors.get(7) # AV_LOG_INFO
+            if fg_color:
+                self.fg_color = fg_color
+            elif bg_color:
+                self.bg_color = bg_color
+            elif value == 1:
+                self.bold = True
+            elif value == 2:
+                self.faint = True
+            elif value == 22:
+                self.bold = False
+                self.faint = False
+            elif value == 39:
+                self.fg_color = None
+            elif value == 49:
+                self.bg_color = None
+            elif value == 0:
+                self.reset_state()
+            elif value in (38, 48):
+                if i + 2 > len(values):
+                    i = len(values)
+                    continue
+                five, color = values[i], values[i + 1]
+                i += 2
+                if five == 5 and 0 <= color <= 255:
+                    if value == 38:
+                        self.fg_color = f'C{color}'
+                    else:
+                        self.bg_color = f'C{color}'
+        return text
@@ -0,0 +1,337 @@
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+
+import zmq
+
+from lib.colored_print import print_error, print_warn
+from lib.latency_stats import LatencyStats
+
+#pylint: disable=broad-except
+
+MAX_MESSAGES_PER_EVENT = 64
+
+class ZmqRequest:
+    def __init__(self, text: str, timeout: float):
+        self.text = text
+        self.timeout = timeout
+        self.reply_queue: queue.Queue = queue.Queue(maxsize=1)
+        self.created_t = time.time()
+        self.sent_t: float = None
+        self.deadline: float = None
+
+    def done(self, status, msg=None):
+        elapsed = (time.time() - self.sent_t) if self.sent_t else 0.0
+        self.reply_queue.put((status, msg, elapsed))
+        return elapsed
+
+    @property
+    def queued(self):
+        '''Time spent waiting behind other requests on the same channel'''
+        return ((self.sent_t or time.time()) - self.created_t)
+
+
+class ZmqChannel:
+    def __init__(self, name: str, socket_type: int, url: str, bind=False, on_message: Callable[[bytes], None] = None):
+        self.name = name
+        self.socket_type = socket_type
+        self.url = url
+        self.bind = bind
+        self.on_message = on_message
+        self.socket: zmq.Socket = None
+        self.endpoint = ''
+        self.pending: ZmqRequest = None
+        self.waiting: Deque[ZmqRequest] = deque()
+
+
+class ZmqIoThread:
+    '''One thread owning every ZMQ socket of the app, multiplexed with a single zmq.Poller.
+    Other threads talk to it only through queues, so sockets are never touched outside this thread.'''
+
+    def __init__(self, ctx: zmq.Context = None):
+        self.context = ctx or zmq.Context()
+        self.channels: Dict[str, ZmqChannel] = {}
+        self.commands: queue.Queue = queue.Queue()
+        self.stats = LatencyStats()
+        self.thread: threading.Thread = None
+        self.running = False
+        self._poller = zmq.Poller()
+        self._wake_url = f'inproc://zmq_io_wake_{id(self)}'
+        self._wake_lock = threading.Lock()
+        self._wake_tx: zmq.Socket = None
+        self._wake_rx: zmq.Socket = None
+
+    def start(self):
+        if self.running:
+            return
+        self._wake_rx = self.context.socket(zmq.PULL)
+        self._wake_rx.bind(self._wake_url)
+        self._wake_tx = self.context.socket(zmq.PUSH)
+        self._wake_tx.connect(self._wake_url)
+        self._poller.register(self._wake_rx, zmq.POLLIN)
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='zmq_io')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self, timeout=1.0):
+        if not self.running:
+            return
+        self._submit(self._stop_in_thread)
+        self.thread.join(timeout)
+        with self._wake_lock:
+            self._wake_tx.close(linger=0)
+            self._wake_tx = None
+        if self.thread.is_alive():
+            # term() would wait for the sockets the stuck thread still owns, forever
+            print_error('ZmqIoThread: I/O thread did not stop in time, leaving its sockets open')
+            return
+        self.context.term()
+
+    # Public API, safe to call from any thread
+
+    def open_channel(self, name, socket_type, url, bind=False, on_message: Callable[[bytes], None] = None, timeout=1.0):
+        '''Create the socket in the I/O thread. Returns True when it's connected (or bound).'''
+        channel = ZmqChannel(name, socket_type, url, bind, on_message)
+        return self._call(self._open_in_thread, channel, timeout=timeout)
+
+    def get_endpoint(self, name):
+        '''Actual endpoint of a bound channel, useful for wildcard binds like tcp://127.0.0.1:*'''
+        channel = self.channels.get(name)
+        return channel.endpoint if channel else ''
+
+    def close_channel(self, name, timeout=1.0):
+        return self._call(self._close_in_thread, name, timeout=timeout)
+
+    def request(self, name, text: str, timeout: float) -> ZmqRequest:
+        '''Queue a REQ/REP round trip. The result lands in the returned request's reply_queue
+        as (status, msg, elapsed), status is one of: 'ok', 'timeout', 'error'.'''
+        req = ZmqRequest(text, timeout)
+        self._submit(self._request_in_thread, name, req)
+        return req
+
+    def send(self, name, data):
+        '''Fire and forget send for PUSH/PUB channels'''
+        self._submit(self._send_in_thread, name, data)
+
+    # Internals
+
+    def _submit(self, func, *args):
+        self.commands.put((func, args, None))
+        self._wake()
+
+    def _call(self, func, *args, timeout=1.0):
+        if threading.current_thread() is self.thread:
+            return func(*args)
+        result: queue.Queue = queue.Queue(maxsize=1)
+        self.commands.put((func, args, result))
+        self._wake()
+        try:
+            return result.get(timeout=timeout)
+        except queue.Empty:
+            print_error(f'ZmqIoThread: {func.__name__} timed out')
+            return None
+
+    def _wake(self):
+        with self._wake_lock:
+            if self._wake_tx is not None:
+                try:
+                    self._wake_tx.send(b'', zmq.NOBLOCK)
+                except zmq.error.Again:
+                    pass # Already woken up
+
+    def _run(self):
+        while self.running:
+            try:
+                events = dict(self._poller.poll(self._next_poll_timeout_ms()))
+            except zmq.error.ZMQError as e:
+                print_error('ZmqIoThread poll:', e)
+                time.sleep(0.01)
+                continue
+
+            if self._wake_rx in events:
+                self._drain(self._wake_rx)
+            self._run_commands()
+
+            for channel in list(self.channels.values()):
+                if channel.socket is not None and channel.socket in events:
+                    self._on_readable(channel)
+
+            self._check_deadlines()
+
+        for name in list(self.channels):
+            self._close_in_thread(name)
+        self._poller.unregister(self._wake_rx)
+        self._wake_rx.close(linger=0)
+
+    def _next_poll_timeout_ms(self):
+        timeout = 100
+        now = time.time()
+        for channel in self.channels.values():
+            if channel.pending:
+                timeout = min(timeout, max(0, int((channel.pending.deadline - now) * 1000) + 1))
+        return timeout
+
+    def _drain(self, socket: zmq.Socket):
+        while True:
+            try:
+                socket.recv(zmq.NOBLOCK)
+            except zmq.error.Again:
+                break
+
+    def _run_commands(self):
+        while True:
+            try:
+                func, args, result = self.commands.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                ret = func(*args)
+            except Exception as e:
+                print_error(f'ZmqIoThread {func.__name__}:', e)
+                ret = None
+            if result is not None:
+                result.put(ret)
+
+    def _stop_in_thread(self):
+        self.running = False
+
+    def _open_in_thread(self, channel: ZmqChannel):
+        if channel.name in self.channels:
+            self._close_in_thread(channel.name)
+        socket = None
+        try:
+            socket = self.context.socket(channel.socket_type)
+            socket.setsockopt(zmq.RECONNECT_IVL, 20)
+            socket.setsockopt(zmq.RECONNECT_IVL_MAX, 200)
+            if channel.socket_type == zmq.SUB:
+                socket.setsockopt(zmq.SUBSCRIBE, b'')
+            if channel.bind:
+                socket.bind(channel.url)
+                channel.endpoint = socket.getsockopt_string(zmq.LAST_ENDPOINT)
+            else:
+                socket.connect(channel.url)
+                channel.endpoint = channel.url
+        except zmq.error.ZMQError as e:
+            print_warn(f'Error on connecting to {channel.url}: {e}')
+            if socket is not None:
+                socket.close(linger=0)
+            return False
+        channel.socket = socket
+        if channel.socket_type in (zmq.REQ, zmq.SUB, zmq.PULL, zmq.REP):
+            self._poller.register(socket, zmq.POLLIN)
+        self.channels[channel.name] = channel
+        return True
+
+    def _close_in_thread(self, name):
+        channel = self.channels.pop(name, None)
+        if not channel:
+            return False
+        if channel.pending:
+            channel.pending.done('error', 'Channel closed')
+            channel.pending = None
+        while channel.waiting:
+            channel.waiting.popleft().done('error', 'Channel closed')
+        self._close_socket(channel)
+        return True
+
+    def _close_socket(self, channel: ZmqChannel):
+        if channel.socket is None:
+            return
+        try:
+            if channel.socket_type in (zmq.REQ, zmq.SUB, zmq.PULL, zmq.REP):
+                self._poller.unregister(channel.socket)
+            channel.socket.close(linger=0)
+        except (zmq.error.ZMQError, KeyError) as e:
+            print_warn(f'Error on closing socket: {e}')
+        channel.socket = None
+
+    def _reconnect(self, channel: ZmqChannel):
+        '''REQ sockets are stuck after a lost reply, the only way out is a fresh socket'''
+        self.stats.record_reconnect(channel.name)
+        self._close_socket(channel)
+        self.channels.pop(channel.name, None)
+        waiting = channel.waiting
+        channel.waiting = deque()
+        if self._open_in_thread(channel):
+            channel.waiting = waiting
+            self._send_next(channel)
+        else:
+            for req in waiting:
+                req.done('error', 'Reconnect failed')
+
+    def _request_in_thread(self, name, req: ZmqRequest):
+        channel = self.channels.get(name)
+        if not channel:
+            req.done('error', f'Not connected: {name}')
+            return
+        channel.waiting.append(req)
+        if not channel.pending:
+            self._send_next(channel)
+
+    def _send_next(self, channel: ZmqChannel):
+        while channel.waiting and not channel.pending:
+            req = channel.waiting.popleft()
+            try:
+                channel.socket.send_string(req.text, zmq.NOBLOCK)
+            except zmq.error.ZMQError as e:
+                self.stats.record(channel.name, req.text, 'error', req.done('error', str(e)), req.queued)
+                continue
+            req.sent_t = time.time()
+            req.deadline = req.sent_t + req.timeout
+            channel.pending = req
+
+    def _send_in_thread(self, name, data):
+        channel = self.channels.get(name)
+        if not channel:
+            return
+        try:
+            if isinstance(data, str):
+                channel.socket.send_string(data, zmq.NOBLOCK)
+            else:
+                channel.socket.send(data, zmq.NOBLOCK, copy=False)
+        except zmq.error.Again:
+            pass # Nobody listening (yet), drop like the DONTWAIT senders do
+        except zmq.error.ZMQError as e:
+            print_warn(f'Error on sending to {channel.url}: {e}')
+
+    def _on_readable(self, channel: ZmqChannel):
+        # Back to the poller after a batch, a busy stream can't hold off the other channels and the deadlines
+        for _ in range(MAX_MESSAGES_PER_EVENT):
+            if channel.socket is None:
+                break
+            try:
+                msg = channel.socket.recv(zmq.NOBLOCK)
+            except zmq.error.Again:
+                break
+            except zmq.error.ZMQError as e:
+                print_warn(f'Error on receiving from {channel.url}: {e}')
+                break
+
+            if channel.socket_type == zmq.REQ:
+                req = channel.pending
+                channel.pending = None
+                if req:
+                    self.stats.record(channel.name, req.text, 'ok', req.done('ok', msg), req.queued)
+                self._send_next(channel)
+                break
+
+            if channel.on_message:
+                try:
+                    channel.on_message(msg)
+                except Exception as e:
+                    print_error(f'ZmqIoThread {channel.name} on_message:', e)
+
+    def _check_deadlines(self):
+        now = time.time()
+        timed_out: List[ZmqChannel] = []
+        for channel in self.channels.values():
+            if channel.pending and now >= channel.pending.deadline:
+                timed_out.append(channel)
+        for channel in timed_out:
+            req: Optional[ZmqRequest] = channel.pending
+            channel.pending = None
+            self.stats.record(channel.name, req.text, 'timeout', req.done('timeout'), req.queued)
+            self._reconnect(channel)
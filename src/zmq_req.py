@@ -1,22 +1,139 @@
+import json
 import os
+import platform
+import queue
+import shutil
+import sys
 import tempfile
-import time
+import threading
 import socket
+import time
 from enum import Enum
+from typing import List
 
 import zmq
 
 from lib.colored_print import print_error, print_warn
 from lib.misc import normalize_path
+from zmq_io import ZmqIoThread
 
 class ZmqReqMode(Enum):
     IPC = 1
     TCP = 2
 
+TRANSPORT_CACHE_FILE = os.path.join(tempfile.gettempdir(), 'livemosher_transport_cache.json')
+REPLY_WAIT_MARGIN = 1.0 # Over the request timeout, the I/O thread replies by then unless it's stopped or stuck
+
+_ipc_supported = None
+_ipc_supported_lock = threading.Lock()
+
+def _transport_cache_key():
+    return f'{sys.platform}-{platform.release()}-py{sys.version_info[0]}.{sys.version_info[1]}' \
+           f'-pyzmq{zmq.pyzmq_version()}-libzmq{zmq.zmq_version()}'
+
+def ipc_supported(ctx: zmq.Context):
+    '''Loopback IPC probe, run once per platform/version and cached on disk'''
+    global _ipc_supported # pylint: disable=global-statement
+    with _ipc_supported_lock:
+        if _ipc_supported is not None:
+            return _ipc_supported
+
+        key = _transport_cache_key()
+        cache = {}
+        try:
+            with open(TRANSPORT_CACHE_FILE, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+            if isinstance(cache.get(key), bool):
+                _ipc_supported = cache[key]
+                return _ipc_supported
+        except (OSError, ValueError, AttributeError):
+            cache = {}
+
+        _ipc_supported = _probe_loopback_ipc(ctx)
+        try:
+            cache = cache if isinstance(cache, dict) else {}
+            cache[key] = _ipc_supported
+            with open(TRANSPORT_CACHE_FILE, 'w', encoding='utf-8') as f:
+                json.dump(cache, f, indent=2)
+        except OSError as e:
+            print_warn(f'Error saving transport cache: {e}')
+        return _ipc_supported
+
+def _probe_loopback_ipc(ctx: zmq.Context):
+    ipc_file_path = ''
+    try:
+        with tempfile.NamedTemporaryFile(mode='w', delete=False, prefix='test_', suffix='.ipc') as file:
+            ipc_file_path = normalize_path(file.name)
+            file.write('')
+        bind_url = f'ipc://{ipc_file_path}'
+        connect_url = bind_url
+        with ctx.socket(zmq.REP) as s:
+            s.bind(bind_url)
+            with ctx.socket(zmq.REQ) as c:
+                c.connect(connect_url)
+                c.send_string('test')
+                msg = s.recv().decode('utf-8', 'ignore')
+        return msg == 'test'
+    except zmq.error.ZMQError as e:
+        print_error('ZmqReq.test_loopback_ipc:', e)
+        return False
+    except Exception as e: #pylint: disable=broad-except
+        print_error('ZmqReq.test_loopback_ipc:', e)
+        return False
+    finally:
+        if ipc_file_path:
+            try:
+                os.unlink(ipc_file_path)
+            except FileNotFoundError:
+                pass
+
+
+class EndpointPool:
+    '''Hands out control endpoints on demand. IPC paths live in one private temp dir, so no temp file
+    is created per endpoint. Free TCP ports are reserved in small batches the first time they're needed.'''
+
+    def __init__(self, tcp_batch=4):
+        self.tcp_batch = tcp_batch
+        self._ipc_dir = ''
+        self._ipc_counter = 0
+        self._tcp_ports: List[int] = []
+        self._lock = threading.Lock()
+
+    def ipc_path(self, name):
+        with self._lock:
+            if not self._ipc_dir or not os.path.isdir(self._ipc_dir):
+                self._ipc_dir = normalize_path(tempfile.mkdtemp(prefix='livemosher_ipc_'))
+            self._ipc_counter += 1
+            return f'{self._ipc_dir}/{name}_{self._ipc_counter}.ipc'
+
+    def tcp_port(self):
+        with self._lock:
+            if not self._tcp_ports:
+                sockets = []
+                try:
+                    for _ in range(self.tcp_batch):
+                        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                        sockets.append(s)
+                        s.bind(('', 0))
+                        self._tcp_ports.append(s.getsockname()[1])
+                finally:
+                    for s in sockets:
+                        s.close()
+            return self._tcp_ports.pop(0)
+
+    def cleanup(self):
+        with self._lock:
+            if self._ipc_dir:
+                shutil.rmtree(self._ipc_dir, ignore_errors=True)
+                self._ipc_dir = ''
+
+endpoint_pool = EndpointPool()
+
 class ZmqReqPush:
-    def __init__(self, ctx: zmq.Context, name, wait_cb = None, mode = ZmqReqMode.IPC, port_file = None, is_push = False):
+    def __init__(self, io: ZmqIoThread, name, wait_cb = None, mode = ZmqReqMode.IPC, port_file = None, is_push = False):
         self.name = name
-        self.context = ctx
+        self.io = io
+        self.context = io.context
         self.wait_cb = wait_cb
         self.mode = mode
         self.ipc_port_file = port_file
@@ -26,7 +143,6 @@ class ZmqReqPush:
             print_warn('IPC is not supported, fallback to TCP')
             self.mode = ZmqReqMode.TCP
 
-        self.socket: zmq.Socket = None
         self.connected = False
         self.soft_timeout = 500 / 1000
 
@@ -36,9 +152,7 @@ class ZmqReqPush:
         if self.mode == ZmqReqMode.IPC:
             self.ipc_file_path = self.ipc_port_file
             if not self.ipc_file_path:
-                with tempfile.NamedTemporaryFile(mode='w', delete=False, prefix=f'{self.name}_', suffix='.ipc') as file:
-                    self.ipc_file_path = normalize_path(file.name)
-                    file.write('')
+                self.ipc_file_path = endpoint_pool.ipc_path(self.name)
             else:
                 self.ipc_file_path = normalize_path(self.ipc_file_path)
                 with open(self.ipc_file_path, 'w', encoding='utf-8') as file:
@@ -47,11 +161,7 @@ class ZmqReqPush:
             self.connect_url = self.bind_url
             self.url_basename = os.path.basename(self.ipc_file_path)
         elif self.mode == ZmqReqMode.TCP:
-            port = self.ipc_port_file or 0
-            if not port:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                    s.bind(('', 0))
-                    port = s.getsockname()[1]
+            port = self.ipc_port_file or endpoint_pool.tcp_port()
             self.bind_url = f'{protocol}://*:{port}'
             self.connect_url = f'{protocol}://localhost:{port}'
             self.url_basename = self.connect_url
@@ -62,31 +172,18 @@ class ZmqReqPush:
         self.reconnect()
 
     def reconnect(self):
-        try:
-            self.disconnect()
-        except zmq.error.ZMQError as e:
-            print_warn(f'Error on closing socket: {e}')
-        try:
-            self.socket = self.context.socket(zmq.REQ if not self.is_push else zmq.PUSH)
-            self.socket.connect(self.connect_url)
-            self.socket.setsockopt(zmq.RCVTIMEO, 50)
-            self.socket.setsockopt(zmq.RECONNECT_IVL, 20)
-            self.socket.setsockopt(zmq.RECONNECT_IVL_MAX, 200)
-            # self.socket.setsockopt(zmq.SNDTIMEO, 50)
-            self.connected = True
-        except zmq.error.ZMQError as e:
-            print_warn(f'Error on connecting to {self.url_basename}: {e}')
-            self.connected = False
+        self.disconnect()
+        self.connected = bool(self.io.open_channel(self.name, zmq.REQ if not self.is_push else zmq.PUSH, self.connect_url))
+        if not self.connected:
+            print_warn(f'Error on connecting to {self.url_basename}')
 
     def disconnect(self):
         if self.connected:
-            self.socket.setsockopt(zmq.LINGER, 0)
-            self.socket.close()
+            self.io.close_channel(self.name)
             self.connected = False
 
     def close(self):
         self.disconnect()
-        self.context.term()
         if self.mode == ZmqReqMode.IPC:
             self._remove_ipc_file()
 
@@ -95,80 +192,60 @@ class ZmqReqPush:
         return msg
 
     def req(self, text = '', throw_timeout = False):
+        if self.is_push:
+            self.req_text(text, throw_timeout)
+            return None, None
+        msg = self.req_text(text, throw_timeout)
+        if msg is None:
+            return None, None
+        try:
+            ret_num, ret_msg = msg.split(':', 1)
+            ret_num = int(ret_num)
+            return ret_num, ret_msg
+        except ValueError:
+            print_error(f'ZmqReq.send: Invalid return message: {msg}')
+            return None, None
+
+    def req_text(self, text = '', throw_timeout = False):
+        '''Raw reply, for peers not answering in the fflive "num:msg" format'''
         if not self.connected:
             raise ConnectionError(f'Not connected to {self.url_basename}')
-        try:
-            self.socket.send_string(text)
-            if self.is_push:
-                return None, None
-
-            t = time.time()
-            start_t = t
-            end_t = t + self.soft_timeout
-            msg = None
-            while t < end_t:
-                try:
-                    if self.socket.poll(50, zmq.POLLIN):
-                        msg = self.socket.recv().decode('utf-8', 'ignore')
-                        elapsed = t - start_t
-                        if elapsed > self.soft_timeout * 0.8:
-                            print_warn(f'ZmqReq.send: "{text}" => "{msg}", {elapsed * 1000:.1f} ms')
-
-                        try:
-                            ret_num, ret_msg = msg.split(':', 1)
-                            ret_num = int(ret_num)
-                            return ret_num, ret_msg
-                        except ValueError:
-                            print_error(f'ZmqReq.send: Invalid return message: {msg}')
-                            return None, None
-                except zmq.error.Again:
-                    if self.wait_cb is not None:
-                        self.wait_cb()
-                finally:
-                    t = time.time()
-
-            # print_error(f'ZMQ Timeout on sending {text} to {self.url_basename}')
-            self.reconnect()
-            if throw_timeout:
-                raise TimeoutError(f'Timeout occurred on sending {text} to {self.url_basename}')
-            # print(f'Send: {text}, Received: {msg}, Taken: {(time.time() - t) * 1e3:.3f} ms')
-        except zmq.error.ZMQError as _e:
-            # print_warn(f'ZMQ Error on sending "{text}" to {self.url_basename}: {_e}')
-            pass
-        return None, None
+        if self.is_push:
+            self.io.send(self.name, text)
+            return None
+
+        request = self.io.request(self.name, text, self.soft_timeout)
+        wait_deadline = request.created_t + request.timeout + REPLY_WAIT_MARGIN
+        while True:
+            try:
+                status, msg, elapsed = request.reply_queue.get(timeout=0.05)
+                break
+            except queue.Empty:
+                if not self.io.thread or not self.io.thread.is_alive() or time.time() > wait_deadline:
+                    status, msg, elapsed = 'timeout', None, time.time() - request.created_t
+                    print_warn(f'ZmqReq.send: no reply from the I/O thread for "{text}" to {self.url_basename}')
+                    break
+                if self.wait_cb is not None:
+                    self.wait_cb()
+
+        if status == 'ok':
+            msg = msg.decode('utf-8', 'ignore')
+            if elapsed > self.soft_timeout * 0.8:
+                print_warn(f'ZmqReq.send: "{text}" => "{msg}", {elapsed * 1000:.1f} ms')
+            return msg
+
+        # The I/O thread has already replaced the stuck REQ socket
+        if status == 'timeout' and throw_timeout:
+            raise TimeoutError(f'Timeout occurred on sending {text} to {self.url_basename}')
+        return None
 
     def _remove_ipc_file(self):
         try:
             os.unlink(self.ipc_file_path)
         except FileNotFoundError:
-            print_error(f'File not found: {self.ipc_file_path}')
+            pass # Never bound or already removed by the binding side
         except Exception as e: #pylint: disable=broad-except
             print_error('ZmqReq._remove_ipc_file:', e)
 
     def test_loopback_ipc(self):
-        ipc_file_path = ''
-        try:
-            with tempfile.NamedTemporaryFile(mode='w', delete=False, prefix='test_', suffix='.ipc') as file:
-                ipc_file_path = normalize_path(file.name)
-                file.write('')
-            bind_url = f'ipc://{ipc_file_path}'
-            connect_url = bind_url
-            with self.context.socket(zmq.REP) as s:
-                s.bind(bind_url)
-                with self.context.socket(zmq.REQ) as c:
-                    c.connect(connect_url)
-                    c.send_string('test')
-                    msg = s.recv().decode('utf-8', 'ignore')
-            return msg == 'test'
-        except zmq.error.ZMQError as e:
-            print_error('ZmqReq.test_loopback_ipc:', e)
-            return False
-        except Exception as e: #pylint: disable=broad-except
-            print_error('ZmqReq.test_loopback_ipc:', e)
-            return False
-        finally:
-            if ipc_file_path:
-                try:
-                    os.unlink(ipc_file_path)
-                except FileNotFoundError:
-                    pass
+        return ipc_supported(self.context)